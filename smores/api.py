@@ -4,14 +4,26 @@ import re
 import sys
 from datetime import datetime, timedelta
 import time
+import threading
 import logging
 import json
+import asyncio
+from urllib.parse import urlparse
 # Community Modules
 import requests
-import requests_cache
+try:
+    import aiohttp
+    from yarl import URL
+except ImportError:
+    aiohttp = None
 # SMOREs Internal Imports
 from smores.utility.errors import smores_error
 from smores.utility.Authenticate import Authenticate
+from smores.utility.sessions import SessionPool
+from smores.utility.ratelimit import RateLimiter
+from smores.utility.cache import ResponseCache
+from smores.utility.concurrency import SingleFlight, AdaptiveLimit
+from smores.utility.resilience import RequestAttempts, CircuitBreaker, RETRY_STATUS
 from requests import Session
 import smores.utility.util as util
 
@@ -21,7 +33,7 @@ APIlog = logging.getLogger(__name__)
 class SMORESapi:
     import smores.utility.util as util
     cache_base = util.get_util_base('cache')
-    expire_after = timedelta(hours=48)
+    in_flight = SingleFlight()
     e_class = '#A'
     e_subclass = 'x000'
 
@@ -29,11 +41,10 @@ class SMORESapi:
         self.api_url = ''
         self.api_name = ''
         self.api_short = ''
+        self.pool_id = ''
         self.cache = None
         self.endpoints = {}
         self.e_subclass = SMORESapi.e_subclass
-        self.def_wait = 100 #in milliseconds
-        self.last_call = None
 
     def get_endpoint(self, api_call):
         try:
@@ -42,18 +53,28 @@ class SMORESapi:
             smores_error(self.get_e('2', c_ovrd=SMORESapi.e_subclass), [api_call, self.api_name], logger=APIlog)
             return False
 
-    def call_api(self, call_type, val, c_opt=None):
-        if self.last_call is None or ((datetime.today() - self.last_call).total_seconds() * 1000) > self.def_wait:
-            pass
-        else:
-            time.sleep(self.def_wait)
-            self.last_call = datetime.today()
+    def get_session(self):
+        """ Shared keep-alive session for this API. Looked up from the SessionPool on each call so that API objects
+            stay picklable for session saves """
+        return SessionPool.get_session(self.pool_id)
+
+    def get_pool_stats(self):
+        return SessionPool.get_stats(self.pool_id)
+
+    def is_available(self) -> bool:
+        """ False while the circuit breaker of this API's host is open, so callers can use an alternate API instead """
+        return CircuitBreaker.is_available(self.api_url)
 
+    def build_request(self, call_type, val, c_opt=None):
+        """
+        Fills in the endpoint template for call_type with the input value and options
+        :return: (url, payload string) or False if the request could not be built
+        """
         payload = {}
         endpoint = self.get_endpoint(call_type)
-        api_call = self.api_url + endpoint['base']
 
         if endpoint:
+            api_call = self.api_url + endpoint['base']
             api_call = re.sub(r'\*CODE\*', str(val), api_call)
 
             for _pl, _p in endpoint['payload'].items():
@@ -77,9 +98,10 @@ class SMORESapi:
                         _pl_val = val
                     elif c_opt is not None and type(c_opt) is str:
                         _pl_val = c_opt
-                    elif c_opt is not None and type(c_opt) is dict:
+                    elif c_opt is not None and type(c_opt) is dict and _pl in c_opt:
                         _pl_val = c_opt[_pl]
                     elif _p is not None:
+                        # Fixed payload values such as api_key aren't part of the per-call options
                         _pl_val = _p
                     else:
                         smores_error(self.get_e('4', c_ovrd=SMORESapi.e_subclass), [self.api_short, _pl], logger=APIlog)
@@ -87,25 +109,133 @@ class SMORESapi:
                     payload[_pl] = str(_pl_val)
 
         else:
-            smores_error(self.get_e('2'), [api_call, self.api_name], logger=APIlog)
+            smores_error(self.get_e('2'), [call_type, self.api_name], logger=APIlog)
             return False
 
+        payload_str = "&".join("%s=%s" % (k, v) for k, v in payload.items())
+        return api_call, payload_str
+
+    def prepare_request(self, api_call, payload_str):
+        """ Prepared GET request as it will be sent by this API's session """
+        return self.get_session().prepare_request(requests.Request('GET', api_call, params=payload_str))
+
+    def get_cache(self) -> ResponseCache:
+        """ On-disk response cache for this API, expiry is configured per endpoint under [API_CACHE] """
+        return ResponseCache.get_cache(self.pool_id)
+
+    def get_cached(self, call_type, api_call, payload_str):
+        """
+        Looks up a request in this API's on-disk cache without making a call to the API
+        :return: (json data, url) of the cached response or None if it is not cached or has expired
+        """
+        return self.get_cache().get(call_type, ResponseCache.make_key(api_call, payload_str))
+
+    def set_cached(self, call_type, api_call, payload_str, url, json_data):
+        self.get_cache().set(call_type, ResponseCache.make_key(api_call, payload_str), url, json_data)
+
+    def get_negative(self, call_type, api_call, payload_str):
+        """
+        Looks up a request among the codes this API already reported as unknown / not found
+        :return: (json data or None if the API answered with an error, url) or None if the request is not known to fail
+        """
+        return self.get_cache().get_negative(call_type, ResponseCache.make_key(api_call, payload_str))
+
+    def set_negative(self, call_type, api_call, payload_str, url, json_data=None):
+        self.get_cache().set_negative(call_type, ResponseCache.make_key(api_call, payload_str), url, json_data)
+
+    def is_negative(self, call_type, json_data) -> bool:
+        """ True if a successful response reports the requested code as unknown, it is then cached with the negative
+            expiry ([API_CACHE] NEGATIVE_EXPIRE_AFTER) instead of the endpoint's """
+        return False
+
+    def sign_request(self, api_call, payload_str):
+        """ Adds any per-request credentials to a request that is about to be sent to the API """
+        return payload_str
+
+    def get_release(self):
+        """
+        Current release of the API's source data, used to tag cached responses when [API_CACHE] <API>_MODE = RELEASE
+        :return: str release or None if the API does not publish one
+        """
+        return None
+
+    def call_api(self, call_type, val, c_opt=None, use_cache=True):
+        # Request throttling is applied per upstream host by the session's ThrottledAdapter ([API_RATE_LIMIT])
+        request = self.build_request(call_type, val, c_opt)
+        if not request:
+            return False, self.api_url, None
+        api_call, payload_str = request
+
+        if use_cache:
+            self.get_cache().check_release(self.get_release)
+            cached = self.get_cached(call_type, api_call, payload_str)
+            if cached is not None:
+                APIlog.info('API Results from cache: %s', cached[1])
+                return True, cached[0], cached[1]
+            negative = self.get_negative(call_type, api_call, payload_str)
+            if negative is not None:
+                APIlog.info('Known unknown code, API not called: %s', negative[1])
+                return (True, negative[0], negative[1]) if negative[0] is not None else (False, api_call, None)
+
+        # Identical requests already in flight from other threads share that request's response
+        return SMORESapi.in_flight.do(ResponseCache.make_key(api_call, payload_str), self.send_request,
+                                      call_type, api_call, payload_str, use_cache)
+
+    def send_request(self, call_type, api_call, payload_str, use_cache=True):
+        """
+        Sends a built request to the API and caches the response, returns (success, json / url, url). Timeouts,
+        connection errors and 429 / 5xx responses are retried with backoff until [API_RESILIENCE] DEADLINE, and
+        requests to a host whose circuit breaker is open fail fast
+        """
+        attempts = RequestAttempts(self.pool_id, api_call)
+        limit = AdaptiveLimit.get_limit(urlparse(api_call).hostname, self.pool_id)
+        endpoint = '{0}_{1}'.format(self.pool_id, call_type)
+        while True:
+            if not attempts.allow():
+                smores_error('#Ax000.9', [api_call, self.api_name], logger=APIlog)
+                return False, api_call, None
+            # Signed per attempt, UMLS service tickets are single use
+            params = self.sign_request(api_call, payload_str)
+            response = None
+            limit.acquire()
+            tic = time.monotonic()
+            try:
+                response = self.get_session().get(api_call, params=params, timeout=attempts.get_timeout())
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            finally:
+                limit.release(endpoint, time.monotonic() - tic - getattr(response, 'rate_wait', 0.0),
+                              response is not None and response.status_code not in RETRY_STATUS)
+            if response is None:
+                wait = attempts.failed()
+                if wait is None:
+                    smores_error(self.get_e('1', c_ovrd=SMORESapi.e_subclass), [api_call, self.api_name, error],
+                                 logger=APIlog)
+                    return False, api_call, None
+            else:
+                if response.status_code not in RETRY_STATUS:
+                    attempts.succeeded()
+                    break
+                wait = attempts.failed(response.status_code, response.headers.get('Retry-After'))
+                if wait is None:
+                    break
+            APIlog.info('Retrying %s in %s seconds', api_call, round(wait, 2))
+            time.sleep(wait)
         try:
-            payload_str = "&".join("%s=%s" % (k, v) for k, v in payload.items())
-            response = requests.get(api_call, params=payload_str)
             response.raise_for_status()
-            if response.from_cache:
-                APIlog.info('API Results from cache: %s', response.url)
             response.encoding = 'utf-8'
             try:
                 json_data = response.json()
             except ValueError:
-                json_data = json.load(response.text)
+                json_data = json.loads(response.text)
+            if use_cache and self.is_negative(call_type, json_data):
+                self.set_negative(call_type, api_call, payload_str, response.url, json_data)
+            elif use_cache:
+                self.set_cached(call_type, api_call, payload_str, response.url, json_data)
             return True, json_data, response.url
-        except (requests.ConnectionError, requests.Timeout) as e:
-            smores_error(self.get_e('1', c_ovrd=SMORESapi.e_subclass), [api_call, self.api_name, e], logger=APIlog)
-            return False, api_call, None
         except requests.exceptions.HTTPError as e:
+            if use_cache and e.response is not None and e.response.status_code == 404:
+                self.set_negative(call_type, api_call, payload_str, e.response.url)
             smores_error(self.get_e('3', c_ovrd=SMORESapi.e_subclass), [api_call, self.api_name, e], logger=APIlog)
             return False, api_call, None
 
@@ -118,17 +248,16 @@ class SMORESapi:
 
 class openFDA(SMORESapi):
     #TODO Need to Add Function to Check if Device NDC
-    requests_cache.install_cache(str(SMORESapi.cache_base.joinpath('openfda_cache').absolute()),
-                                 backend='sqlite',
-                                 expire_after=SMORESapi.expire_after)
-
-    def __init__(self, delay=300, api_key=None):
+    batch_limit = 1000  # Max results openFDA returns per query
+    batch_max_skip = 25000  # Max skip openFDA accepts when paging through results
+    batch_query_len = 1800  # Max characters of the search values in one batch query
+    def __init__(self, api_key=None):
         super(openFDA, self).__init__()
 
         self.api_url = 'https://api.fda.gov/drug/'
-        self.def_wait = delay
         self.api_name = 'openFDA - US Food and Drug Administration API'
         self.api_short = 'openFDA API'
+        self.pool_id = 'OPENFDA'
         self.cache = None
         self.e_subclass = 'x002'
         self.api_key = api_key if api_key != 'NONE' and api_key is not None else None
@@ -150,6 +279,28 @@ class openFDA(SMORESapi):
                 'payload': {
                     'search': ['openfda.rxcui:', 'PRIMARY']
                 }
+            },
+            # Batch lookups of many codes in one query, each result is matched back to a code through 'field' and
+            # cached as the 'batch_of' lookup of that code
+            'PACK_BATCH': {
+                'base': 'ndc.json',
+                'payload': {
+                    'search': ['packaging.package_ndc:', 'PRIMARY'],
+                    'limit': None,
+                    'skip': None
+                },
+                'batch_of': 'PACK_STATUS',
+                'field': 'packaging.package_ndc'
+            },
+            'RXN_BATCH': {
+                'base': 'ndc.json',
+                'payload': {
+                    'search': ['openfda.rxcui:', 'PRIMARY'],
+                    'limit': None,
+                    'skip': None
+                },
+                'batch_of': 'RXN_LOOKUP',
+                'field': 'openfda.rxcui'
             }
         }
         if self.api_key is not None:
@@ -164,25 +315,48 @@ class openFDA(SMORESapi):
         :return: NONE or dict{ndc, name, status}
         """
         success, response, api_url = self.call_api('PACK_STATUS', ndc)
-        _r, package_ndc, generic, brand, dose, form = (None for i in range(6))
-        if success and 'error' not in response.keys():
-            results = response['results'][0]
-            if len(results['packaging']) > 1:
-                for _ndc in results['packaging']:
-                    if _ndc['package_ndc'] == ndc:
-                        package_ndc = _ndc['package_ndc']
-                if package_ndc is None:
-                    package_ndc = results['product_ndc']
-            else:
-                package_ndc = results['packaging'][0]['package_ndc']
-            _ndc = self.process_ndc(results)
-            _r = {'ndc': package_ndc, 'name': _ndc['name'], 'status': _ndc['status']}
-        else:
+        _r = self.process_ndc_record(ndc, success, response, api_url)
+        if _r is None:
             smores_error(self.get_e('1'), api_url, logger=APIlog)
-        return _r
+            return None
+        return {'ndc': _r['ndc'], 'name': _r['name'], 'status': _r['status']}
+
+    def get_ndc_record(self, ndc):
+        """
+        Package, product, UNII and RxCUI information on a provided NDC code from a single openFDA query
+        :param ndc: str of valid NDC format
+        :return: NONE if openFDA has no match or dict{ndc, product_ndc, name, status, unii, rxcui}
+        """
+        return self.process_ndc_record(ndc, *self.call_api('PACK_STATUS', ndc))
+
+    def process_ndc_record(self, ndc, success, response, api_url):
+        if not success or 'error' in response.keys() or len(response.get('results', [])) == 0:
+            APIlog.debug('%s : No openFDA match for NDC %s', self.api_short, ndc)
+            return None
+        results = response['results'][0]
+        _ndc = self.process_ndc(results)
+        if _ndc is None:
+            return None
+        package_ndc = None
+        packaging = _ndc['packaging'] if 'packaging' in _ndc.keys() else []
+        if len(packaging) > 1:
+            for _pack in packaging:
+                if _pack['package_ndc'] == ndc:
+                    package_ndc = _pack['package_ndc']
+            if package_ndc is None:
+                package_ndc = _ndc['ndc']
+        elif len(packaging) == 1:
+            package_ndc = packaging[0]['package_ndc']
+        else:
+            package_ndc = _ndc['ndc']
+        rxcui = results['openfda']['rxcui'] if 'rxcui' in results['openfda'].keys() else []
+        return {'ndc': package_ndc, 'product_ndc': _ndc['ndc'], 'name': _ndc['name'], 'status': _ndc['status'],
+                'unii': _ndc['unii'], 'rxcui': rxcui}
 
     def get_ndc_rxnorm(self, ndc):
-        success, response, api_url = self.call_api('PACK_STATUS', ndc)
+        return self.process_ndc_rxnorm(*self.call_api('PACK_STATUS', ndc))
+
+    def process_ndc_rxnorm(self, success, response, api_url):
         _r = None
         if success and 'error' not in response.keys():
             results = response['results'][0]
@@ -202,7 +376,9 @@ class openFDA(SMORESapi):
         :param rxcui: Input RXCUI
         :return: list of NDC codes
         """
-        success, response, api_url = self.call_api('RXN_LOOKUP', rxcui)
+        return self.process_rxnorm_ndc(*self.call_api('RXN_LOOKUP', rxcui))
+
+    def process_rxnorm_ndc(self, success, response, api_url):
         _r = None
         if success and 'error' not in response.keys():
             results = response['results'][0]
@@ -247,6 +423,124 @@ class openFDA(SMORESapi):
                     ndc_list.append(_r)
             return ndc_list
 
+    @staticmethod
+    def get_batch_size():
+        """ Max number of codes sent in one openFDA batch query, from [PROCESSING] OPENFDA_BATCH_SIZE """
+        return min(max(util.read_config_option('PROCESSING', 'openfda_batch_size', 100), 1), openFDA.batch_limit)
+
+    @staticmethod
+    def chunk_codes(codes: list, batch_size: int):
+        """ Splits codes into chunks of at most batch_size codes whose search query stays under batch_query_len """
+        chunk, chunk_len = [], 0
+        for code in codes:
+            # Each code is sent quoted (%22...%22) and joined with +
+            code_len = len(str(code)) + 7
+            if len(chunk) > 0 and (len(chunk) >= batch_size or chunk_len + code_len > openFDA.batch_query_len):
+                yield chunk
+                chunk, chunk_len = [], 0
+            chunk.append(code)
+            chunk_len += code_len
+        if len(chunk) > 0:
+            yield chunk
+
+    @staticmethod
+    def format_batch(codes: list):
+        """ openFDA OR query of several values of a field, e.g. ("0002-3227-30"+"0002-3228-30") """
+        return '(' + '+'.join('"{0}"'.format(code) for code in codes) + ')'
+
+    @staticmethod
+    def get_field_values(record, field: str):
+        """ All values of a dotted openFDA field in a result, descending into lists, e.g. packaging.package_ndc """
+        values = [record]
+        for _key in field.split('.'):
+            _next = []
+            for _v in values:
+                _v = _v.get(_key) if type(_v) is dict else None
+                if type(_v) is list:
+                    _next += _v
+                elif _v is not None:
+                    _next.append(_v)
+            values = _next
+        return [str(_v) for _v in values]
+
+    def call_batch(self, call_type, codes: list, use_cache=True):
+        """
+        Looks up many codes with as few openFDA queries as possible. Codes already cached are answered from the cache,
+        the rest are sent in chunks as OR queries and each code found is cached as its own single lookup
+        :param call_type: Batch endpoint, PACK_BATCH or RXN_BATCH
+        :param codes: list of NDC's or RxCUI's
+        :return: dict{code: list of openFDA results for the code, empty if not found}
+        """
+        endpoint = self.get_endpoint(call_type)
+        if not endpoint:
+            return {}
+        single_call, field = endpoint['batch_of'], endpoint['field']
+        found = {str(code): None for code in codes}
+
+        to_fetch = []
+        if use_cache:
+            self.get_cache().check_release(self.get_release)
+        for code in found.keys():
+            cached = None
+            if use_cache:
+                request = self.build_request(single_call, code)
+                cached = self.get_cached(single_call, *request) if request else None
+            if cached is not None and 'error' not in cached[0].keys():
+                found[code] = cached[0]['results']
+            elif not use_cache or not request or self.get_negative(single_call, *request) is None:
+                to_fetch.append(code)
+
+        for chunk in self.chunk_codes(to_fetch, self.get_batch_size()):
+            chunk_results = {code: [] for code in chunk}
+            skip = 0
+            while True:
+                success, response, api_url = self.call_api(call_type, self.format_batch(chunk),
+                                                           {'limit': openFDA.batch_limit, 'skip': skip},
+                                                           use_cache=False)
+                if not success or 'error' in response.keys():
+                    break
+                for result in response['results']:
+                    for code in set(self.get_field_values(result, field)) & chunk_results.keys():
+                        chunk_results[code].append(result)
+                skip += openFDA.batch_limit
+                if skip >= response['meta']['results']['total'] or skip > openFDA.batch_max_skip:
+                    break
+            APIlog.info('%s : Batch of %s codes, %s found', self.api_short, len(chunk),
+                        len([_r for _r in chunk_results.values() if len(_r) > 0]))
+            for code, results in chunk_results.items():
+                found[code] = results
+                if use_cache:
+                    api_call, payload_str = self.build_request(single_call, code)
+                    url = self.prepare_request(api_call, payload_str).url
+                    if len(results) > 0:
+                        self.set_cached(single_call, api_call, payload_str, url,
+                                        {'meta': {'results': {'skip': 0, 'limit': len(results), 'total': len(results)}},
+                                         'results': results})
+                    elif success:
+                        # openFDA answers a single lookup of a code it does not know with a 404
+                        self.set_negative(single_call, api_call, payload_str, url)
+        return {code: results if results is not None else [] for code, results in found.items()}
+
+    def get_ndc_batch(self, ndc_list: list, use_cache=True):
+        """
+        Base information on many NDC codes, sent to openFDA in batches
+        :param ndc_list: list of NDC's in the hyphenated package format used by openFDA
+        :return: dict{ndc: process_ndc() result or NONE if openFDA has no match}
+        """
+        return {ndc: self.process_ndc(results[0]) if len(results) > 0 else None
+                for ndc, results in self.call_batch('PACK_BATCH', ndc_list, use_cache).items()}
+
+    def get_rxnorm_batch(self, rxcui_list: list, use_cache=True):
+        """
+        Products of many RxCUI's, sent to openFDA in batches
+        :param rxcui_list: list of RxCUI's
+        :return: dict{rxcui: list of process_ndc() results, one per product}
+        """
+        _r = {}
+        for rxcui, results in self.call_batch('RXN_BATCH', rxcui_list, use_cache).items():
+            _r[rxcui] = [_ndc for _ndc in (self.process_ndc(result) for result in results) if _ndc is not None]
+        return _r
+
     def process_ndc(self, ndc_data):
         try:
             _r_keys = ndc_data.keys()
@@ -294,19 +588,17 @@ class RXNAV(SMORESapi):
     RXNAV_VALID_IDS = ['AMPID', 'ANADA', 'ANDA', 'ATC', 'BLA', 'CVX', 'Drugbank', 'GCN_SEQNO', 'GFC', 'HCPCS',
                        'HIC_SEQN', 'MESH', 'MMSL_CODE', 'NADA', 'NDA', 'NDC', 'NUI', 'SNOMEDCT', 'SPL_SET_ID',
                        'UMLSCUI', 'UNII_CODE', 'USP', 'VUID']
-    requests_cache.install_cache(str(SMORESapi.cache_base.joinpath('rxnav_cache').absolute()),
-                                 backend='sqlite',
-                                 expire_after=SMORESapi.expire_after)
+    ndc_api = None
+    _ndc_api_lock = threading.Lock()
 
-    def __init__(self, delay=100):
+    def __init__(self):
         super(RXNAV, self).__init__()
 
         self.api_url = 'https://rxnav.nlm.nih.gov/REST/'
-        self.def_wait = delay
         self.api_name = 'RxNav - NLM RxNorm API'
         self.api_short = 'RxNav API'
+        self.pool_id = 'RXNAV'
         self.e_subclass = 'x001'
-        self.last_call = None
         self.endpoints = {
             'STATUS': {
                 'base': 'rxcui/*CODE*/status.json',
@@ -331,11 +623,45 @@ class RXNAV(SMORESapi):
             'NDC_STATUS': {
                 'base': 'ndcstatus.json',
                 'payload': {'ndc': 'PRIMARY'}
+            },
+            'VERSION': {
+                'base': 'version.json',
+                'payload': {}
             }
         }
 
+    def get_release(self):
+        return self.process_release(*self.call_api('VERSION', None, use_cache=False))
+
+    def is_negative(self, call_type, json_data) -> bool:
+        if type(json_data) is not dict:
+            return False
+        elif call_type == 'STATUS' and 'rxcuiStatus' in json_data.keys():
+            return str(json_data['rxcuiStatus'].get('status', '')).upper() in ['', 'UNKNOWN', 'NON-RXNORM']
+        elif call_type == 'NDC_STATUS' and 'ndcStatus' in json_data.keys():
+            return str(json_data['ndcStatus'].get('status', '')).upper() in ['', 'UNKNOWN']
+        return False
+
+    def process_release(self, success, response, api_url):
+        """ RxNorm data version, e.g. 07-Oct-2019, changes with each monthly and weekly RxNorm release """
+        if success and response is not None and 'version' in response.keys():
+            return str(response['version'])
+        else:
+            smores_error(self.get_e('1'), api_url, logger=APIlog)
+            return None
+
+    def get_status_payload(self, rxcui):
+        """
+        STATUS response of an RxCUI, validity, base properties and remaps can all be read from the one response
+        :param rxcui: str RxCUI
+        :return: (success, response, api_url) to pass to process_cui_status, process_cui_base or process_remap_cuis
+        """
+        return self.call_api('STATUS', rxcui)
+
     def get_cui_base(self, rxcui):
-        success, response, api_url = self.call_api('STATUS', rxcui.cui)
+        return self.process_cui_base(rxcui, *self.call_api('STATUS', rxcui.cui))
+
+    def process_cui_base(self, rxcui, success, response, api_url):
         error_index = {'Remapped': '5', 'Quantified': '8', 'Active': '1', 'Obsolete': '6', 'Retired': '5', 'Alien': '5'}
         if success and response is not None:
             APIlog.debug('Good Response from API.')
@@ -355,7 +681,9 @@ class RXNAV(SMORESapi):
             return None
 
     def get_cui_status(self, rxcui) -> [bool, str]:
-        success, response, api_url = self.call_api('STATUS', rxcui)
+        return self.process_cui_status(rxcui, *self.call_api('STATUS', rxcui))
+
+    def process_cui_status(self, rxcui, success, response, api_url) -> [bool, str]:
         e_index = {'remapped': '5', 'quantified': '7', 'active': '6', 'obsolete': '5', 'retired': '5', 'alien': '4',
                    'non-rxnorm': '4', 'never%20active': '4', 'unknown': '4'}
         if success and response is not None:
@@ -396,7 +724,9 @@ class RXNAV(SMORESapi):
         return valid
 
     def get_rxcui_ingredients(self, rxcui):
-        success, response, api_url = self.call_api('ING', rxcui)
+        return self.process_rxcui_ingredients(*self.call_api('ING', rxcui))
+
+    def process_rxcui_ingredients(self, success, response, api_url):
         if success:
             APIlog.debug('Good Response from API.')
             json_list = response['relatedGroup']['conceptGroup']
@@ -416,7 +746,9 @@ class RXNAV(SMORESapi):
             return None
 
     def get_remap_cuis(self, rxcui):
-        success, response, api_url = self.call_api('STATUS', rxcui)
+        return self.process_remap_cuis(*self.call_api('STATUS', rxcui))
+
+    def process_remap_cuis(self, success, response, api_url):
         remapped = []
         if success and response is not None:
             APIlog.debug('Good Response from API.')
@@ -447,6 +779,15 @@ class RXNAV(SMORESapi):
             smores_error(self.get_e('1'), api_url, logger=APIlog)
             return False
 
+    @staticmethod
+    def get_ndc_api():
+        """ openFDA client shared by all NDC id lookups, created on first use """
+        if RXNAV.ndc_api is None:
+            with RXNAV._ndc_api_lock:
+                if RXNAV.ndc_api is None:
+                    RXNAV.ndc_api = openFDA(api_key=util.get_api_key('FDA'))
+        return RXNAV.ndc_api
+
     def get_rxcui_by_id(self, id, idType):
         VALID_ID_TYPES = RXNAV.RXNAV_VALID_IDS
         api_success, api_results = False, None
@@ -454,13 +795,9 @@ class RXNAV(SMORESapi):
             alt_src_r = None
             # If it's an NDC code, try the NDC API first
             if idType.upper() == 'NDC':
-                alt_src_r = openFDA().get_ndc_rxnorm(id)
+                alt_src_r = RXNAV.get_ndc_api().get_ndc_rxnorm(id)
 
-            _clean_id = id.copy()
-            if idType == 'NDC' and len(_clean_id) < 11:
-                _zeroes = 11 - len(_clean_id)
-                for i in range(_zeroes):
-                    _clean_id = '0' + _clean_id
+            _clean_id = RXNDC.format_ndc(id) if idType.upper() == 'NDC' else id
             api_success, response, api_url = self.call_api('ID_LOOKUP', _clean_id, idType)
             if api_success and response is not None:
                 APIlog.info('Good Response from API : %s', api_url)
@@ -488,17 +825,13 @@ class RXNAV(SMORESapi):
 
 
 class RXNDC(SMORESapi):
-    requests_cache.install_cache(str(SMORESapi.cache_base.joinpath('rxndc_cache').absolute()),
-                                 backend='sqlite',
-                                 expire_after=SMORESapi.expire_after)
-
-    def __init__(self, delay=100):
+    def __init__(self):
         super().__init__()
 
         self.api_url = 'https://rxnav.nlm.nih.gov/REST/'
-        self.def_wait = delay
         self.api_name = 'RxNav - NLM RxNorm API for NDC Specific Lookups'
         self.api_short = 'RxNav API'
+        self.pool_id = 'RXNDC'
         self.e_subclass = 'x001'
         self.endpoints = {
             'NDC_STATUS': {
@@ -508,9 +841,20 @@ class RXNDC(SMORESapi):
             'NDC_LOOKUP': {
                 'base': 'allhistoricalndcs.json',
                 'payload': {'rxcui': 'PRIMARY'}
+            },
+            'VERSION': {
+                'base': 'version.json',
+                'payload': {}
             }
         }
 
+    def get_release(self):
+        # Same RxNorm data as RXNAV, parsed the same way
+        return RXNAV.process_release(self, *self.call_api('VERSION', None, use_cache=False))
+
+    def is_negative(self, call_type, json_data) -> bool:
+        return RXNAV.is_negative(self, call_type, json_data)
+
     def get_cui_base(self, ndc):
         if len(ndc) < 11:
             _zeroes = 11 - len(ndc)
@@ -557,13 +901,15 @@ class RXNDC(SMORESapi):
             else:
                 return _r, ndc_status
 
+    @staticmethod
+    def format_ndc(ndc):
+        """ RXNAV API expects 11 digit NDC, left pad shorter codes with zeroes """
+        return ndc.zfill(11) if len(ndc) < 11 else ndc
+
     def get_ndc_rxnorm(self, ndc):
-        if len(ndc) < 11:
-            _zeroes = 11 - len(ndc)
-            for i in range(_zeroes):
-                ndc = '0' + ndc
+        return self.process_ndc_rxnorm(*self.call_api('NDC_STATUS', RXNDC.format_ndc(ndc)))
 
-        success, response, api_url = self.call_api('NDC_STATUS', ndc)
+    def process_ndc_rxnorm(self, success, response, api_url):
         e_class = ''
         _r, status, name = (None for i in range(3))
         if success and response is not None:
@@ -592,8 +938,30 @@ class RXNDC(SMORESapi):
             smores_error(self.get_e('1'), api_url, logger=APIlog)
             return None
 
+    def get_ndc_record(self, ndc):
+        """
+        Status, name and RxCUI's of a provided NDC code from a single ndcstatus query
+        :param ndc: str of valid NDC format
+        :return: NONE if RxNorm does not know the NDC or dict{ndc, product_ndc, name, status, unii, rxcui}
+        """
+        return self.process_ndc_record(ndc, *self.call_api('NDC_STATUS', RXNDC.format_ndc(ndc)))
+
+    def process_ndc_record(self, ndc, success, response, api_url):
+        if not success or response is None or 'ndcStatus' not in response.keys():
+            APIlog.debug('%s : No RxNorm match for NDC %s', self.api_short, ndc)
+            return None
+        json_detail = response['ndcStatus']
+        if 'status' not in json_detail.keys() or json_detail['status'] == 'UNKNOWN':
+            return None
+        rxcui = self.process_ndc_rxnorm(success, response, api_url)
+        return {'ndc': ndc, 'product_ndc': None, 'status': json_detail['status'],
+                'name': str(json_detail['conceptName']) if 'conceptName' in json_detail.keys() else 'UNK',
+                'unii': None, 'rxcui': rxcui if rxcui else []}
+
     def get_rxnorm_ndc(self, rxcui):
-        success, response, api_url = self.call_api('NDC_LOOKUP', rxcui)
+        return self.process_rxnorm_ndc(*self.call_api('NDC_LOOKUP', rxcui))
+
+    def process_rxnorm_ndc(self, success, response, api_url):
         e_class = ''
         _r, _ndcList = (None for i in range(2))
         if success and response is not None:
@@ -617,11 +985,7 @@ class RXNDC(SMORESapi):
             return None
 
     def validate(self, ndc):
-        if len(ndc) < 11:
-            _zeroes = 11 - len(ndc)
-            for i in range(_zeroes):
-                ndc = '0' + ndc
-        response, status = RXNDC.get_cui_status(ndc)
+        response, status = self.get_cui_status(ndc) or (False, None)
         if response and status != 'UNKNOWN':
             return True
         else:
@@ -633,6 +997,7 @@ class openFDADevice(openFDA):
         super(openFDA, self).__init__()
         # https://api.fda.gov/device/udi.json?search=identifiers.id:%2266004-6028-1%22
         self.api_url = 'https://api.fda.gov/device/'
+        self.pool_id = 'OPENFDA_DEVICE'
         self.api_key = api_key if api_key.upper() != 'NONE' and api_key is not None else None
         self.endpoints = {
             'VALID': {
@@ -640,7 +1005,6 @@ class openFDADevice(openFDA):
                 'payload': {'search': 'identifiers.id:"*CODE*"'}
             }
         }
-        self.def_wait = 1500 if self.api_key is None else 250
         if self.api_key is not None:
             for endpoint in self.endpoints.values():
                 if 'api_key' not in endpoint['payload'].keys():
@@ -661,16 +1025,13 @@ class openFDADevice(openFDA):
 
 
 class UMLS(SMORESapi):
-    requests_cache.install_cache(str(SMORESapi.cache_base.joinpath('umls_cache').absolute()),
-                                 backend='sqlite',
-                                 expire_after=SMORESapi.expire_after)
-
     def __init__(self, apikey=None, authuser=None, authpwd=None):
         super(UMLS, self).__init__()
         self.api_url = 'https://uts-ws.nlm.nih.gov/rest/'
+        self.pool_id = 'UMLS'
         self.auth_uri = 'https://utslogin.nlm.nih.gov/'
         self.auth_endpoints = {'apikey': 'cas/v1/api-key', 'user': 'cas/v1/tickets/'}
-        self.auth_client = Authenticate(self.auth_uri, self.auth_endpoints, apikey, authuser, authpwd)
+        self.auth_client = self.get_auth_client(apikey, authuser, authpwd)
         self.st_service = 'http://umlsks.nlm.nih.gov'
         self.valid_codesets = util.UMLS_VALID_SRCS.keys()
         self.endpoints = {
@@ -689,16 +1050,38 @@ class UMLS(SMORESapi):
             }
         }
 
+    def get_auth_client(self, apikey=None, authuser=None, authpwd=None):
+        return Authenticate(self.auth_uri, self.auth_endpoints, apikey, authuser, authpwd)
+
     def get_st(self):
         return self.auth_client.get_service_ticket(self.st_service)
 
+    def is_valid_source(self, src:str):
+        return src.upper() in self.valid_codesets or src == 'CUI'
+
+    def get_lookup_opts(self, cui, src:str, search_type:str):
+        return {'ticket': '',
+                'string': cui,
+                'sabs': src,
+                'searchType': search_type,
+                'inputType': 'sourceUi'}
+
+    def get_status_opts(self, src:str):
+        return {'ticket': '', 'SRC': src if src == 'CUI' else 'source/' + src}
+
+    def get_crosswalk_opts(self, src:str, target_src:str):
+        return {'ticket': '', 'SRC': src, 'targetSource': target_src}
+
+    def sign_request(self, api_call, payload_str):
+        """ Service tickets are single use, so one is only taken once a request is not answered from the cache """
+        params = [_p for _p in payload_str.split('&') if len(_p) > 0 and not _p.startswith('ticket=')]
+        return '&'.join(params + ['ticket={0}'.format(self.get_st())])
+
     def get_umls_cui(self, cui, src:str='CUI', search_type:str='exact'):
-        _opts = {'ticket': self.get_st(),
-                 'string': cui,
-                 'sabs': src,
-                 'searchType': search_type,
-                 'inputType': 'sourceUi'}
-        success, response, api_url = self.call_api('CUI_LOOKUP', cui, _opts)
+        _opts = self.get_lookup_opts(cui, src, search_type)
+        return self.process_umls_cui(*self.call_api('CUI_LOOKUP', cui, _opts))
+
+    def process_umls_cui(self, success, response, api_url):
         if success and response is not None:
             try:
                 umls_cui = [atomCluster['ui'] for atomCluster in response['result']['results']]
@@ -715,77 +1098,324 @@ class UMLS(SMORESapi):
         :param src:
         :return: {status , name, }
         """
-        if src.upper() in self.valid_codesets or src == 'CUI':
-            if src != 'CUI':
-                src = 'source/'+src
-            _opts = {'ticket': self.get_st(), 'SRC': src}
-            success, response, api_url = self.call_api('STATUS', cui, _opts)
-            if success and response is not None:
-                try:
-                    cui_base = {}
-                    cui_base['cui'] = response['result']['ui']
-                    cui_base['source'] = response['result']['rootSource']
-                    cui_base['status'] = 'ACTIVE' if not response['result']['obsolete'] else 'OBSOLETE'
-                    cui_base['name'] = response['result']['name']
-                except KeyError or IndexError:
-                    smores_error(self.get_e('1'), api_url, logger=APIlog)
-                    return False, None
-                else:
-                    return True, cui_base
-            return success, response
+        if self.is_valid_source(src):
+            _opts = self.get_status_opts(src)
+            return self.process_cui_base(*self.call_api('STATUS', cui, _opts))
         else:
             smores_error(self.get_e('4'), self.api_url, logger=APIlog)
             return False, None
 
+    def process_cui_base(self, success, response, api_url):
+        if success and response is not None:
+            try:
+                cui_base = {}
+                cui_base['cui'] = response['result']['ui']
+                cui_base['source'] = response['result']['rootSource']
+                cui_base['status'] = 'ACTIVE' if not response['result']['obsolete'] else 'OBSOLETE'
+                cui_base['name'] = response['result']['name']
+            except KeyError or IndexError:
+                smores_error(self.get_e('1'), api_url, logger=APIlog)
+                return False, None
+            else:
+                return True, cui_base
+        return success, response
+
     def get_cui_status(self, cui, src:str='CUI'):
-        if src.upper() in self.valid_codesets or src == 'CUI':
-            if src != 'CUI':
-                src = 'source/'+src
-            _opts = {'ticket': self.get_st(), 'SRC': src}
-            success, response, api_url = self.call_api('STATUS', cui, _opts)
-            if success and response is not None:
-                try:
-                    cui_status = 'ACTIVE' if not response['result']['obsolete'] else 'OBSOLETE'
-                except KeyError or IndexError:
-                    smores_error(self.get_e('1'), api_url, logger=APIlog)
-                    return False, None
-                else:
-                    return True, cui_status
-            return success, response
+        if self.is_valid_source(src):
+            _opts = self.get_status_opts(src)
+            return self.process_cui_status(*self.call_api('STATUS', cui, _opts))
         else:
             smores_error(self.get_e('4'), self.api_url, logger=APIlog)
             return False, None
 
+    def process_cui_status(self, success, response, api_url):
+        if success and response is not None:
+            try:
+                cui_status = 'ACTIVE' if not response['result']['obsolete'] else 'OBSOLETE'
+            except KeyError or IndexError:
+                smores_error(self.get_e('1'), api_url, logger=APIlog)
+                return False, None
+            else:
+                return True, cui_status
+        return success, response
+
     def get_crosswalk_cui(self, cui, src=None, target_src=None):
         if type(cui) is dict:
             src = cui['src']
             target_src = cui['target_src']
             cui = cui['input']
 
-        _opts = {'ticket': self.get_st(), 'SRC': src, 'targetSource': target_src}
         if src.upper() in self.valid_codesets and target_src.upper() in self.valid_codesets:
-            success, response, api_url = self.call_api('CROSSWALK', cui, _opts)
-            if success and response is not None:
-                # json.dump(response, indent=4)
-                try:
-                    cui_crosswalk = [{'cui': atomCluster['ui'],
-                                      'name': atomCluster['name'],
-                                      'status': 'ACTIVE' if not atomCluster['obsolete'] else 'OBSOLETE',
-                                      'ucui': self.get_umls_cui(atomCluster['ui'], atomCluster['rootSource'], 'exact'),
-                                      } for atomCluster in response['result']]
-                except KeyError or IndexError:
-                    smores_error(self.get_e('1'), api_url, logger=APIlog)
-                    return False
-                else:
-                    return cui_crosswalk
-            else:
+            _opts = self.get_crosswalk_opts(src, target_src)
+            atoms = self.process_crosswalk_cui(*self.call_api('CROSSWALK', cui, _opts))
+            if atoms:
+                return [self.format_crosswalk_atom(atomCluster,
+                                                   self.get_umls_cui(atomCluster['ui'], atomCluster['rootSource'],
+                                                                     'exact'))
+                        for atomCluster in atoms]
+            return atoms
+        else:
+            return False
+
+    def process_crosswalk_cui(self, success, response, api_url):
+        """ :return: list of atomClusters from a CROSSWALK response or False """
+        if success and response is not None:
+            try:
+                atoms = response['result']
+                for atomCluster in atoms:
+                    for _key in ['ui', 'name', 'obsolete', 'rootSource']:
+                        if _key not in atomCluster.keys():
+                            raise KeyError(_key)
+            except (KeyError, TypeError, AttributeError):
+                smores_error(self.get_e('1'), api_url, logger=APIlog)
                 return False
+            else:
+                return atoms
         else:
             return False
 
+    @staticmethod
+    def format_crosswalk_atom(atomCluster, ucui):
+        return {'cui': atomCluster['ui'],
+                'name': atomCluster['name'],
+                'status': 'ACTIVE' if not atomCluster['obsolete'] else 'OBSOLETE',
+                'ucui': ucui}
+
     def validate(self, cui, src:str='CUI'):
         response, status = self.get_cui_status(cui, src)
         if response and status is not None:
             return True
         else:
-            return False
\ No newline at end of file
+            return False
+
+
+def get_async_max_in_flight():
+    """ Max number of requests an async API client keeps open at once, from [PROCESSING] in config.ini """
+    return max(util.read_config_option('PROCESSING', 'ASYNC_MAX_IN_FLIGHT', 100), 1)
+
+
+class SMORESapiAsync:
+    """
+    asyncio counterpart to SMORESapi for batch pipelines and embedding in other applications. Requests are built from
+    the endpoint templates of the wrapped synchronous API and answered from its on-disk cache where possible, otherwise
+    they are sent on the running event loop with at most max_in_flight requests open at once. Responses are handed to
+    the same process_* methods as the synchronous API so both clients return identical results.
+
+    Example:
+        async with RXNAVAsync() as rxnav:
+            results = await asyncio.gather(*[rxnav.get_cui_status(cui) for cui in cuis])
+    """
+    api_class = SMORESapi
+
+    def __init__(self, api: SMORESapi = None, max_in_flight: int = None):
+        if aiohttp is None:
+            smores_error('#Ax000.5', 'pip install aiohttp', logger=APIlog)
+            raise ImportError('aiohttp is required for the asynchronous API clients')
+        self.api = api if api is not None else self.api_class()
+        self.max_in_flight = max_in_flight if max_in_flight is not None else get_async_max_in_flight()
+        self._session = None
+        self._semaphore = None
+        self._in_flight = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def get_session(self):
+        """ aiohttp session for this client, created on first use inside the running event loop """
+        if self._session is None or self._session.closed:
+            conf = SessionPool.get_pool_config(self.api.pool_id)
+            connector = aiohttp.TCPConnector(limit=self.max_in_flight, force_close=not conf['keep_alive'])
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def get_semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._semaphore
+
+    async def sign_request(self, api_call, payload_str):
+        return self.api.sign_request(api_call, payload_str)
+
+    @staticmethod
+    async def run_blocking(func, *args):
+        """ Runs a blocking call (the sqlite cache, the auth client) on the default executor, off the event loop """
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def call_api(self, call_type, val, c_opt=None):
+        """ Awaitable version of SMORESapi.call_api, returns (success, json / url, url) """
+        request = self.api.build_request(call_type, val, c_opt)
+        if not request:
+            return False, self.api.api_url, None
+        api_call, payload_str = request
+
+        cache = self.api.get_cache()
+        if cache.needs_release():
+            await self.run_blocking(cache.check_release, self.api.get_release)
+        # The cache lookups take the cache's lock and query sqlite, so they run off the event loop
+        cached = await self.run_blocking(self.api.get_cached, call_type, api_call, payload_str)
+        if cached is not None:
+            APIlog.info('API Results from cache: %s', cached[1])
+            return True, cached[0], cached[1]
+        negative = await self.run_blocking(self.api.get_negative, call_type, api_call, payload_str)
+        if negative is not None:
+            APIlog.info('Known unknown code, API not called: %s', negative[1])
+            return (True, negative[0], negative[1]) if negative[0] is not None else (False, api_call, None)
+
+        # Identical requests already in flight on this client share that request's response
+        key = ResponseCache.make_key(api_call, payload_str)
+        pending = self._in_flight.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self.send_request(call_type, api_call, payload_str))
+            self._in_flight[key] = pending
+            pending.add_done_callback(lambda _f: self._in_flight.pop(key, None))
+        return await asyncio.shield(pending)
+
+    async def send_request(self, call_type, api_call, payload_str):
+        """ Same retry, deadline, circuit breaker and adaptive concurrency handling as SMORESapi.send_request """
+        attempts = RequestAttempts(self.api.pool_id, api_call)
+        limit = AdaptiveLimit.get_limit(urlparse(api_call).hostname, self.api.pool_id)
+        endpoint = '{0}_{1}'.format(self.api.pool_id, call_type)
+        while True:
+            if not attempts.allow():
+                smores_error('#Ax000.9', [api_call, self.api.api_name], logger=APIlog)
+                return False, api_call, None
+            url = self.api.prepare_request(api_call, await self.sign_request(api_call, payload_str)).url
+            async with self.get_semaphore():
+                await limit.acquire_async()
+                # Shares the host's token bucket with the synchronous clients ([API_RATE_LIMIT])
+                wait = RateLimiter.get_limiter(urlparse(url).hostname).reserve()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                tic = time.monotonic()
+                success = False
+                try:
+                    async with self.get_session().get(URL(url, encoded=True),
+                                                      timeout=aiohttp.ClientTimeout(total=attempts.get_timeout())) \
+                            as response:
+                        success = response.status not in RETRY_STATUS
+                        if success:
+                            attempts.succeeded()
+                            response.raise_for_status()
+                            json_data = json.loads(await response.text(encoding='utf-8'))
+                            break
+                        wait = attempts.failed(response.status, response.headers.get('Retry-After'))
+                        if wait is None:
+                            response.raise_for_status()
+                except aiohttp.ClientResponseError as e:
+                    if e.status == 404:
+                        await self.run_blocking(self.api.set_negative, call_type, api_call, payload_str, url)
+                    smores_error(self.api.get_e('3', c_ovrd=SMORESapi.e_subclass), [api_call, self.api.api_name, e],
+                                 logger=APIlog)
+                    return False, api_call, None
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    wait = attempts.failed()
+                    if wait is None:
+                        smores_error(self.api.get_e('1', c_ovrd=SMORESapi.e_subclass),
+                                     [api_call, self.api.api_name, e], logger=APIlog)
+                        return False, api_call, None
+                except ValueError as e:
+                    smores_error(self.api.get_e('1', c_ovrd=SMORESapi.e_subclass), [api_call, self.api.api_name, e],
+                                 logger=APIlog)
+                    return False, api_call, None
+                finally:
+                    limit.release(endpoint, time.monotonic() - tic, success)
+            APIlog.info('Retrying %s in %s seconds', api_call, round(wait, 2))
+            await asyncio.sleep(wait)
+        if self.api.is_negative(call_type, json_data):
+            await self.run_blocking(self.api.set_negative, call_type, api_call, payload_str, url, json_data)
+        else:
+            await self.run_blocking(self.api.set_cached, call_type, api_call, payload_str, url, json_data)
+        return True, json_data, url
+
+
+class openFDAAsync(SMORESapiAsync):
+    api_class = openFDA
+
+    async def get_ndc_record(self, ndc):
+        return self.api.process_ndc_record(ndc, *await self.call_api('PACK_STATUS', ndc))
+
+    async def get_ndc_rxnorm(self, ndc):
+        return self.api.process_ndc_rxnorm(*await self.call_api('PACK_STATUS', ndc))
+
+    async def get_rxnorm_ndc(self, rxcui):
+        return self.api.process_rxnorm_ndc(*await self.call_api('RXN_LOOKUP', rxcui))
+
+
+class RXNAVAsync(SMORESapiAsync):
+    api_class = RXNAV
+
+    async def get_cui_base(self, rxcui):
+        return self.api.process_cui_base(rxcui, *await self.call_api('STATUS', rxcui.cui))
+
+    async def get_cui_status(self, rxcui):
+        return self.api.process_cui_status(rxcui, *await self.call_api('STATUS', rxcui))
+
+    async def get_rxcui_ingredients(self, rxcui):
+        return self.api.process_rxcui_ingredients(*await self.call_api('ING', rxcui))
+
+
+class RXNDCAsync(SMORESapiAsync):
+    api_class = RXNDC
+
+    async def get_ndc_record(self, ndc):
+        return self.api.process_ndc_record(ndc, *await self.call_api('NDC_STATUS', RXNDC.format_ndc(ndc)))
+
+    async def get_ndc_rxnorm(self, ndc):
+        return self.api.process_ndc_rxnorm(*await self.call_api('NDC_STATUS', RXNDC.format_ndc(ndc)))
+
+    async def get_rxnorm_ndc(self, rxcui):
+        return self.api.process_rxnorm_ndc(*await self.call_api('NDC_LOOKUP', rxcui))
+
+
+class UMLSAsync(SMORESapiAsync):
+    api_class = UMLS
+
+    async def sign_request(self, api_call, payload_str):
+        # Service tickets may need to be requested with the blocking auth client, keep that off the event loop
+        return await self.run_blocking(self.api.sign_request, api_call, payload_str)
+
+    async def get_umls_cui(self, cui, src: str = 'CUI', search_type: str = 'exact'):
+        _opts = self.api.get_lookup_opts(cui, src, search_type)
+        return self.api.process_umls_cui(*await self.call_api('CUI_LOOKUP', cui, _opts))
+
+    async def get_cui_base(self, cui, src: str = 'CUI'):
+        if self.api.is_valid_source(src):
+            _opts = self.api.get_status_opts(src)
+            return self.api.process_cui_base(*await self.call_api('STATUS', cui, _opts))
+        else:
+            smores_error(self.api.get_e('4'), self.api.api_url, logger=APIlog)
+            return False, None
+
+    async def get_cui_status(self, cui, src: str = 'CUI'):
+        if self.api.is_valid_source(src):
+            _opts = self.api.get_status_opts(src)
+            return self.api.process_cui_status(*await self.call_api('STATUS', cui, _opts))
+        else:
+            smores_error(self.api.get_e('4'), self.api.api_url, logger=APIlog)
+            return False, None
+
+    async def get_crosswalk_cui(self, cui, src=None, target_src=None):
+        if type(cui) is dict:
+            src = cui['src']
+            target_src = cui['target_src']
+            cui = cui['input']
+
+        if src.upper() in self.api.valid_codesets and target_src.upper() in self.api.valid_codesets:
+            _opts = self.api.get_crosswalk_opts(src, target_src)
+            atoms = self.api.process_crosswalk_cui(*await self.call_api('CROSSWALK', cui, _opts))
+            if atoms:
+                # The UMLS CUI of every returned atom is looked up concurrently
+                ucuis = await asyncio.gather(*[self.get_umls_cui(atomCluster['ui'], atomCluster['rootSource'], 'exact')
+                                               for atomCluster in atoms])
+                return [UMLS.format_crosswalk_atom(atomCluster, ucui) for atomCluster, ucui in zip(atoms, ucuis)]
+            return atoms
+        else:
+            return False
@@ -1,28 +1,145 @@
+import time
+import heapq
+import logging
+import threading
+from itertools import count
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 import smores.api as api
 import smores.medication as med
 import smores.utility.util as util
+from smores.utility.errors import smores_error
+from smores.utility.cache import CrosswalkStore
+from smores.utility.ratelimit import RateLimiter
+
+smoresLog = logging.getLogger(__name__)
 
 def get_crosswalk(source, target):
-    return CUICrosswalk.CROSSWALKS[source][target]
+    """
+    The registered crosswalk from source to target, or else a CrosswalkChain planned through other code sets
+    Raises KeyError when target can't be reached from source
+    """
+    try:
+        return CUICrosswalk.CROSSWALKS[source][target]
+    except KeyError:
+        chain = CrosswalkPlanner.get_plan(source, target)
+        if chain is None:
+            raise
+        return chain
 
 # Class to handle workflows for performing various crosswalks to other code sets.
 # allows for the definition of a workflow of different processes to be executed
 # CUICrosswalk('RXNORM','NDC')
 class CUICrosswalk:
     CROSSWALKS = {}
+    MODES = ['SEQUENTIAL', 'HEDGED']
+    MERGES = ['FIRST', 'UNION']
+    hedge_executor = None
+    _hedge_lock = threading.Lock()
+    _hedge_thread = threading.local()
+    _stats_lock = threading.Lock()
+    default_run_seconds = 1.0  # Assumed time of a lookup through a crosswalk that has not been run yet
+    hop_cost = 0.001  # Added per crosswalk so that of two equally cheap plans the shorter is used
 
     def __init__(self, init_type:str, target_type:str):
         self.start = init_type
         self.end = target_type
         self.workflow = []
+        self.internal = False  # Set once the crosswalk is a step of another one, its code sets are internal to it
         CUICrosswalk.add_crosswalk(self)
         self.config = None
+        self.mode, self.merge, self.hedge_delay = 'SEQUENTIAL', 'FIRST', 0.0
+        self.lookups, self.store_hits, self.runs, self.run_seconds = 0, 0, 0, 0.0
+        self.read_mode_config()
+
+    def read_mode_config(self):
+        """
+        Execution mode from [PROCESSING] CROSSWALK_MODE, CROSSWALK_MERGE and CROSSWALK_HEDGE_DELAY in config.ini, each
+        can be overridden for one crosswalk by prefixing the start and end code sets, e.g. NDC_RXNORM_CROSSWALK_MODE
+        """
+        _prefix = '{0}_{1}_'.format(self.start, self.end)
+        _opts = {}
+        for opt, default in [('CROSSWALK_MODE', self.mode), ('CROSSWALK_MERGE', self.merge),
+                             ('CROSSWALK_HEDGE_DELAY', self.hedge_delay)]:
+            _val = util.read_config_option('PROCESSING', opt, default)
+            _opts[opt] = util.read_config_option('PROCESSING', _prefix + opt, _val)
+        self.set_mode(_opts['CROSSWALK_MODE'], _opts['CROSSWALK_MERGE'], _opts['CROSSWALK_HEDGE_DELAY'])
+
+    def set_mode(self, mode:str, merge:str=None, hedge_delay:float=None):
+        """
+        Set how a workflow of alternative steps (each step but the last continuing on None) is run, other workflows
+        always run sequentially
+        :param mode: SEQUENTIAL runs the steps one after the other until one has an answer. HEDGED sends them all at
+            once with the same input
+        :param merge: HEDGED only. FIRST returns the first non-empty answer without waiting on the other steps,
+            UNION waits for every step and returns the combined answers in workflow order
+        :param hedge_delay: HEDGED only. Seconds the first step runs alone before the others are sent, 0 sends them
+            all at once
+        """
+        if str(mode).upper() in CUICrosswalk.MODES:
+            self.mode = str(mode).upper()
+        else:
+            smores_error('#Cx003.1', '[PROCESSING] CROSSWALK_MODE = {0}'.format(mode))
+        if merge is not None and str(merge).upper() in CUICrosswalk.MERGES:
+            self.merge = str(merge).upper()
+        elif merge is not None:
+            smores_error('#Cx003.1', '[PROCESSING] CROSSWALK_MERGE = {0}'.format(merge))
+        if hedge_delay is not None:
+            self.hedge_delay = max(float(hedge_delay), 0.0)
+
+    @staticmethod
+    def get_hedge_executor() -> ThreadPoolExecutor:
+        """
+        Threads shared by all hedged crosswalks, separate from the threads of their callers. Sized by [PROCESSING]
+        CROSSWALK_HEDGE_WORKERS, by default twice WORKERS, which also bounds the steps left running after a FIRST merge
+        """
+        if CUICrosswalk.hedge_executor is None:
+            with CUICrosswalk._hedge_lock:
+                if CUICrosswalk.hedge_executor is None:
+                    _workers = util.read_config_option('PROCESSING', 'CROSSWALK_HEDGE_WORKERS', 0)
+                    if _workers <= 0:
+                        _workers = max(util.read_config_option('PROCESSING', 'WORKERS', 1), 1) * 2
+                    CUICrosswalk.hedge_executor = ThreadPoolExecutor(max_workers=max(_workers, 2),
+                                                                     thread_name_prefix='crosswalk-hedge')
+        return CUICrosswalk.hedge_executor
+
+    @staticmethod
+    def run_hedged_step(process, input):
+        """ run_workflow_process on a hedge thread. Crosswalks it runs are not hedged again, see run_hedged """
+        CUICrosswalk._hedge_thread.active = True
+        return CUICrosswalk.run_workflow_process(process, input)
+
+    def is_hedged(self) -> bool:
+        """
+        Whether the workflow is run HEDGED. Only a workflow of alternative steps, where every step but the last
+        continues on None, can be hedged. Any other workflow feeds each step's answer to the next and stays sequential
+        """
+        if self.mode != 'HEDGED' or len(self.workflow) < 2:
+            return False
+        return all('continue' in _proc.keys() and _proc['continue'] is None for _proc in self.workflow[:-1])
+
+    @staticmethod
+    def is_empty(result) -> bool:
+        return result is None or result is False or (isinstance(result, (list, dict)) and len(result) == 0)
+
+    @staticmethod
+    def get_answers(result) -> list:
+        """ The answers of a crosswalk as a list, empty when it has none """
+        if CUICrosswalk.is_empty(result):
+            return []
+        return result if isinstance(result, list) else [result]
+
+    @staticmethod
+    def get_code(answer) -> str:
+        """ Code of one answer, answers of the UMLS crosswalk are dicts holding it as 'cui' """
+        return answer['cui'] if type(answer) is dict else str(answer)
 
     @staticmethod
     def add_crosswalk(cross):
         if cross.start not in CUICrosswalk.CROSSWALKS.keys():
             CUICrosswalk.CROSSWALKS[cross.start] = {}
         CUICrosswalk.CROSSWALKS[cross.start][cross.end] = cross
+        CrosswalkPlanner.clear()
 
     def add_config(self, param, val):
         if self.config is None:
@@ -39,44 +156,281 @@ class CUICrosswalk:
         :param cont: A value returned from the process that triggers it to continue
         """
         _proc = {'func': step}
+        if isinstance(step, CUICrosswalk):
+            step.internal = True
         if cont != '':
             _proc['continue'] = cont
         self.workflow.append(_proc)
+        CrosswalkPlanner.clear()
 
-    def run_crosswalk(self, input:str):
+    def run_crosswalk(self, input:str, use_store:bool=True):
         """
-        Run the processes in the defined workflow for this crosswalk
+        Run the processes in the defined workflow for this crosswalk. Answers are kept in the persistent CrosswalkStore
+        and read back from it until they are stale ([API_CACHE] CROSSWALK_EXPIRE_AFTER)
         :param input: code input for crosswalk
+        :param use_store: False to always run the workflow, e.g. to re-validate a stored answer
         :return:
         """
+        store = CrosswalkStore.get_store() if use_store else None
+        if store is not None and store.is_enabled():
+            entry = store.get(self.start, self.end, input)
+            if entry is not None and not entry['stale']:
+                self.record_lookup()
+                return entry['result']
+            result = self.refresh(input)
+            # A stale answer is still the best known one when the lookup has none
+            return entry['result'] if entry is not None and CUICrosswalk.is_empty(result) else result
+        return self.run_timed(input)[0]
+
+    def run_batch(self, codes:list, workers:int=None):
+        """
+        Crosswalk many codes concurrently, each unique code once
+        :param workers: Number of concurrent crosswalks. Defaults to [PROCESSING] WORKERS in config.ini
+        :return: dict{code: answer}
+        """
+        codes = list(dict.fromkeys(codes))
+        workers = max(util.read_config_option('PROCESSING', 'WORKERS', 1), 1) if workers is None else max(workers, 1)
+        if workers == 1 or len(codes) <= 1:
+            return {_c: self.run_crosswalk(_c) for _c in codes}
+        with ThreadPoolExecutor(max_workers=min(workers, len(codes))) as executor:
+            return dict(zip(codes, executor.map(self.run_crosswalk, codes)))
+
+    def run_timed(self, input:str):
+        """ run_workflow, recording its time towards the cost the planner sees for this crosswalk """
+        tic = time.monotonic()
+        result = self.run_workflow(input)
+        self.record_lookup(time.monotonic() - tic)
+        return result
+
+    def record_lookup(self, run_seconds:float=None):
+        """ :param run_seconds: time the workflow took, None for a lookup answered by the crosswalk store """
+        with CUICrosswalk._stats_lock:
+            self.lookups += 1
+            if run_seconds is None:
+                self.store_hits += 1
+            else:
+                self.runs += 1
+                self.run_seconds += run_seconds
+
+    def get_cost(self) -> float:
+        """
+        Expected seconds per lookup, as seen by the CrosswalkPlanner: the share of lookups not answered by the crosswalk
+        store times the average time of a workflow run plus the time the API rate limits reserve for its requests
+        """
+        with CUICrosswalk._stats_lock:
+            miss_ratio = 1.0 - self.store_hits / self.lookups if self.lookups > 0 else 1.0
+            run_seconds = self.run_seconds / self.runs if self.runs > 0 else CUICrosswalk.default_run_seconds
+        return CUICrosswalk.hop_cost + miss_ratio * (run_seconds + self.get_quota_cost())
+
+    def get_quota_cost(self) -> float:
+        """ Seconds per lookup reserved by [API_RATE_LIMIT] for the first workflow step, or every step if HEDGED """
+        cost = 0.0
+        for _proc in (self.workflow if self.is_hedged() else self.workflow[:1]):
+            process = _proc['func']
+            if isinstance(process, CUICrosswalk):
+                cost += process.get_quota_cost()
+                continue
+            _url = urlparse(getattr(getattr(process, '__self__', None), 'api_url', None) or '')
+            if _url.scheme in ['http', 'https'] and _url.hostname is not None:
+                rate = RateLimiter.get_limiter(_url.hostname).rate
+                cost += 1.0 / rate if rate > 0 else 0.0
+        return cost
+
+    def refresh(self, input:str):
+        """
+        Run the workflow for input and replace its stored answer. A lookup without an answer keeps the stored one and
+        marks it refreshed, so it isn't looked up again before it is stale again
+        :return: the new answer
+        """
+        result, source = self.run_timed(input)
+        store = CrosswalkStore.get_store()
+        if store.is_enabled() and not CUICrosswalk.is_empty(result):
+            store.set(self.start, self.end, input, result, source)
+        elif store.is_enabled():
+            store.touch(self.start, self.end, input)
+        return result
+
+    def run_workflow(self, input:str):
+        """
+        Run the processes in the defined workflow for this crosswalk
+        :param input: code input for crosswalk
+        :return: (answer, name of the API(s) that answered)
+        """
 
         if self.config is not None:
-            _proc_data = self.config
+            # Copied so that concurrent crosswalks don't overwrite each other's input
+            _proc_data = dict(self.config)
             _proc_data['input'] = input
         else:
             _proc_data = input
 
+        if self.is_hedged() and not getattr(CUICrosswalk._hedge_thread, 'active', False):
+            return self.run_hedged(_proc_data)
+
+        _source = None
         for _proc in self.workflow:
             _func = _proc['func']
-            _proc_data = self.run_workflow_process(_func, _proc_data if _proc_data is not None else input)
+            _proc_data, _source = self.run_workflow_process(_func, _proc_data if _proc_data is not None else input)
             if 'continue' in _proc.keys():
                 if _proc_data == _proc['continue']:
                     continue
                 else:
                     break
-        return _proc_data
+        return _proc_data, _source
+
+    def run_hedged(self, input):
+        """
+        Run every step of the workflow at once on the same input and merge the answers by self.merge. Steps that have
+        already started can't be stopped, they finish in the background on the bounded hedge threads and their
+        responses are still cached, steps not yet started are cancelled.
+        Steps run on the shared hedge threads (get_hedge_executor), never on the threads of the callers
+        (CrosswalkChain.run_batch, file workers). A hedged step doesn't hedge again: crosswalks run by a step on a hedge
+        thread run their workflow sequentially, so hedge threads never wait on other hedge threads
+        :param input: code input for crosswalk, or the crosswalk config holding it
+        :return: (merged answer, or the answer of the last step when no step has one, name of the API(s) that answered)
+        """
+        executor = CUICrosswalk.get_hedge_executor()
+        futures = [executor.submit(CUICrosswalk.run_hedged_step, self.workflow[0]['func'], input)]
+        if self.hedge_delay > 0:
+            wait(futures, timeout=self.hedge_delay)
+            if futures[0].done() and self.merge == 'FIRST' and not CUICrosswalk.is_empty(futures[0].result()[0]):
+                return futures[0].result()
+        futures += [executor.submit(CUICrosswalk.run_hedged_step, _proc['func'], input)
+                    for _proc in self.workflow[1:]]
+
+        for future in as_completed(futures):
+            if self.merge == 'FIRST' and not CUICrosswalk.is_empty(future.result()[0]):
+                for _f in futures:
+                    _f.cancel()
+                return future.result()
+
+        results = [_f.result() for _f in futures]
+        if self.merge == 'UNION':
+            merged, sources = [], []
+            for result, source in results:
+                if not CUICrosswalk.is_empty(result):
+                    merged += [_r for _r in (result if isinstance(result, list) else [result]) if _r not in merged]
+                    sources.append(source)
+            if len(merged) > 0:
+                return merged, ','.join(str(_s) for _s in sources)
+        return results[-1]
+
+    @staticmethod
+    def get_process_source(process):
+        """ Name of the API behind a workflow process (api_short or pool id), or the function name otherwise """
+        _api = getattr(process, '__self__', None)
+        _name = (getattr(_api, 'api_short', None) or getattr(_api, 'pool_id', None)) if _api is not None else None
+        return _name or getattr(process, '__name__', None)
 
     @staticmethod
     def run_workflow_process(process, input):
+        """
+        A step that fails on a bad response or lost connection is reported (#Ax000.10) and counts as having no answer
+        :return: (result, name of the API that answered)
+        """
         try:
             if isinstance(process, CUICrosswalk):
-                return process.run_crosswalk(input)
+                return process.run_workflow(input)
             else:
-                return process(input)
+                return process(input), CUICrosswalk.get_process_source(process)
                 # Process needs to be some kind of api call that returns the form of BOOL, DICT
                 # return result
-        except:
-            print('error')
+        except (OSError, KeyError, IndexError, TypeError, ValueError, AttributeError) as e:
+            _name = '{0} > {1}'.format(process.start, process.end) if isinstance(process, CUICrosswalk) else \
+                CUICrosswalk.get_process_source(process)
+            smores_error('#Ax000.10', [_name, input, repr(e)], logger=smoresLog)
+            return None, None
+
+class CrosswalkChain:
+    """ A planned path of crosswalks, run as one crosswalk from the first hop's start to the last hop's end """
+
+    def __init__(self, hops:list):
+        self.hops = hops
+        self.start = hops[0].start
+        self.end = hops[-1].end
+
+    def get_route(self) -> str:
+        return ' > '.join([self.start] + [_hop.end for _hop in self.hops])
+
+    def run_crosswalk(self, input:str):
+        return self.run_batch([input]).get(input)
+
+    def run_batch(self, codes:list, workers:int=None):
+        """
+        Crosswalk many codes, running each hop once (concurrently, see CUICrosswalk.run_batch) on the unique codes that
+        reach it from the previous hop
+        :return: dict{input code: list of answers of the last hop, or None}
+        """
+        reached = {_c: [_c] for _c in dict.fromkeys(codes)}
+        for i, hop in enumerate(self.hops):
+            last = i == len(self.hops) - 1
+            answers = hop.run_batch([_c for _codes in reached.values() for _c in _codes], workers)
+            for code, _codes in reached.items():
+                found = []
+                for _c in _codes:
+                    for _a in CUICrosswalk.get_answers(answers.get(_c)):
+                        _a = _a if last else CUICrosswalk.get_code(_a)
+                        if _a not in found:
+                            found.append(_a)
+                reached[code] = found
+        return {_c: (_a if len(_a) > 0 else None) for _c, _a in reached.items()}
+
+
+class CrosswalkPlanner:
+    """ Plans crosswalks between code sets that have no registered crosswalk by chaining registered ones. Code sets are
+        the nodes of a graph whose edges are the crosswalks, weighted by CUICrosswalk.get_cost(), and the cheapest path
+        is found with Dijkstra's algorithm. Crosswalks that are steps of another crosswalk are not edges. Plans are
+        kept for plan_ttl seconds so that they follow the observed costs """
+    plans = {}
+    _lock = threading.Lock()
+    plan_ttl = 300.0
+
+    @staticmethod
+    def find_path(source:str, target:str):
+        """ :return: (cost, list of CUICrosswalk hops) of the cheapest path, None if target can't be reached """
+        costs = {source: 0.0}
+        tie = count()
+        queue = [(0.0, next(tie), source, [])]
+        done = set()
+        while len(queue) > 0:
+            cost, _, node, hops = heapq.heappop(queue)
+            if node == target:
+                return cost, hops
+            if node in done:
+                continue
+            done.add(node)
+            for _next, crosswalk in list(CUICrosswalk.CROSSWALKS.get(node, {}).items()):
+                # Crosswalks used as steps of another (NDC1 > RXNORM1, ...) are not edges of the graph
+                if _next in done or len(crosswalk.workflow) == 0 or crosswalk.internal:
+                    continue
+                _cost = cost + crosswalk.get_cost()
+                if _cost < costs.get(_next, float('inf')):
+                    costs[_next] = _cost
+                    heapq.heappush(queue, (_cost, next(tie), _next, hops + [crosswalk]))
+        return None
+
+    @staticmethod
+    def get_plan(source:str, target:str):
+        """ The CrosswalkChain from source to target, planned again past plan_ttl. None if there's no path """
+        key = (source, target)
+        plan = CrosswalkPlanner.plans.get(key)
+        if plan is None or time.monotonic() - plan[1] > CrosswalkPlanner.plan_ttl:
+            with CrosswalkPlanner._lock:
+                plan = CrosswalkPlanner.plans.get(key)
+                if plan is None or time.monotonic() - plan[1] > CrosswalkPlanner.plan_ttl:
+                    path = CrosswalkPlanner.find_path(source, target)
+                    chain = CrosswalkChain(path[1]) if path is not None and len(path[1]) > 0 else None
+                    plan = (chain, time.monotonic())
+                    CrosswalkPlanner.plans[key] = plan
+                    if chain is not None:
+                        smoresLog.info('Crosswalk plan {0} (cost {1})'.format(chain.get_route(), round(path[0], 4)))
+        return plan[0]
+
+    @staticmethod
+    def clear():
+        with CrosswalkPlanner._lock:
+            CrosswalkPlanner.plans.clear()
+
 
 # Create NDC to RxNorm Crosswalk
 NDC_RXN = CUICrosswalk('NDC','RXNORM')
@@ -96,8 +450,8 @@ RXN_NDC2.add_step(med.NDC.api2.get_rxnorm_ndc)
 RXN_NDC.add_step(RXN_NDC1, None)
 RXN_NDC.add_step(RXN_NDC2)
 
-# If the UMLS API setup is not valid, we don't want to create invalid crosswalk options
-if util.isUmlsApiValid():
+# If the UMLS API setup is not valid and there is no local UMLS, we don't want to create invalid crosswalk options
+if med.UMLSCUI.api is not None:
     # Create RxNorm to SNOMED Crosswalk
     RXN_SNOMED = CUICrosswalk('RXNORM', 'SNOMEDCT_US')
     RXN_SNOMED.add_step(med.UMLSCUI.api.get_crosswalk_cui)
@@ -4,11 +4,15 @@ import logging
 # SMOREs Internal Imports
 import smores.medicationdictionary as md
 from smores.api import openFDA, RXNAV, RXNDC, openFDADevice, UMLS
+from smores.offline import get_local_api
 from smores.utility.errors import smores_error
+from smores.utility.concurrency import KeyedLock
 from typing import Union
 import smores.utility.util as util
 
 smoresLog = logging.getLogger(__name__)
+# Serializes creation of, and lookups made through, a single code's Medication object when commands run concurrently
+_med_locks = KeyedLock()
 
 
 def get_FHIR_codesets(sys):
@@ -69,7 +73,11 @@ def get_rxcui(cui, valid=None, idType=None):
                     return_rxc = get_rxcui(result)
                 return return_rxc
         else:
-            return RxCUI(cui, valid)
+            with _med_locks.get(('RXNORM', str(cui))):
+                # Another worker may have created the RxCUI while this one was waiting
+                if str(cui) in rxcui_dict.med_list.keys():
+                    return rxcui_dict.med_list[str(cui)]
+                return RxCUI(cui, valid)
 
 def get_med_obj(cui: Union[list, str], idType:str, valid=None):
     """
@@ -91,11 +99,15 @@ def get_med_obj(cui: Union[list, str], idType:str, valid=None):
             smoresLog.debug('Key Already Exists: %s', str(cui))
             return cui_dict.med_list[cui]
         elif idType is not None:
-            if idType in CUI_OBJECT_MAP.keys():
-                objType = CUI_OBJECT_MAP[idType]
-                return objType(cui, source=idType)
-            else:
-                return Medication(cui)
+            with _med_locks.get((idType, str(cui))):
+                # Another worker may have created the object while this one was waiting
+                if str(cui) in cui_dict.med_list.keys():
+                    return cui_dict.med_list[str(cui)]
+                if idType in CUI_OBJECT_MAP.keys():
+                    objType = CUI_OBJECT_MAP[idType]
+                    return objType(cui, source=idType)
+                else:
+                    return Medication(cui)
 
 def getValidTypes():
     return RXNAV.RXNAV_VALID_IDS
@@ -125,8 +137,9 @@ class Medication:
             med_obj = cui
             cui = med_obj.cui
 
-        if not self.has_dict(src):
-            self.add_dict(src, self.sys_id)
+        with _med_locks.get(('DICT', self.sys_id)):
+            if not self.has_dict(src):
+                self.add_dict(src, self.sys_id)
 
         self.get_dict(src).add_med_with_id(med_obj, cui)
 
@@ -518,30 +531,30 @@ class LocalMed(Medication):
 
 
 class NDC(Medication):
-    api = openFDA(api_key=util.get_api_key('FDA'))
+    # Local FDA NDC directory when enabled under [LOCAL_SOURCES], otherwise the openFDA API
+    api = get_local_api('FDA_NDC') or openFDA(api_key=util.get_api_key('FDA'))
     api2 = RXNDC()
     api3 = openFDADevice(api_key=util.get_api_key('FDA'))
 
     def __init__(self, input_key:str, source:str='NDC', valid=None):
         super(NDC, self).__init__(input_key, source)
+        self.rxcui_list = None
 
         if valid is None:
-            if NDC.api.validate(self.cui):
-                ndc_base = NDC.api.get_ndc_base(self.cui)
+            # One query hydrates the NDC, RXNDC is only asked when openFDA has no answer or openFDA's circuit is open
+            ndc_record = NDC.api.get_ndc_record(self.cui) if NDC.api.is_available() else None
+            if ndc_record is not None:
                 self.api = NDC.api
-            elif NDC.api2.validate:
-                ndc_base = NDC.api2.get_cui_base(self.cui)
-                self.api = NDC.api2 if ndc_base is not None else self.api
-            elif NDC.api3.validate:
-                self.valid = False
             else:
-                ndc_base = NDC.api.get_ndc_product(self.cui)
+                ndc_record = NDC.api2.get_ndc_record(self.cui)
+                self.api = NDC.api2 if ndc_record is not None else self.api
 
-            if ndc_base is not None:
+            if ndc_record is not None:
                 self.valid = True
-                self.name = ndc_base['name']
-                self.status = ndc_base['status']
-                self.unii = ndc_base['unii'] if 'unii' in ndc_base.keys() else None
+                self.name = ndc_record['name']
+                self.status = ndc_record['status']
+                self.unii = ndc_record['unii']
+                self.rxcui_list = ndc_record['rxcui']
             else:
                 self.valid = False
 
@@ -577,11 +590,15 @@ class NDC(Medication):
                 return self.status
 
     def get_linked_cui(self, cui_type:str):
+        with _med_locks.get(('LINK', self.sys_id)):
+            return self._get_linked_cui(cui_type)
+
+    def _get_linked_cui(self, cui_type:str):
         linked = []
         if self.has_dict(cui_type.upper()):
             linked = self.get_dict(cui_type.upper()).get_med_list(inc_obj=True)
         elif cui_type == 'RXNORM':
-            rxc_l = self.api.get_ndc_rxnorm(self.cui)
+            rxc_l = self.rxcui_list if self.rxcui_list is not None else self.api.get_ndc_rxnorm(self.cui)
             if rxc_l:
                 self.add_dict('RXNORM', self.sys_id)
                 rxc_dict = self.get_dict('RXNORM')
@@ -608,7 +625,8 @@ class NDC(Medication):
 class RxCUI(Medication):
     rx_remap_avail = {}
     rx_hist_avail = {}
-    api = RXNAV()
+    # Local RxNorm release when enabled under [LOCAL_SOURCES], otherwise the RxNav API
+    api = get_local_api('RXNORM') or RXNAV()
 
     TTY_DICT = util.RXNORM_TTY_SUPPORT_DICT
 
@@ -623,11 +641,14 @@ class RxCUI(Medication):
         self.has_hist = None
         self.dictionaries = {}
         self.source = 'RXNORM'
+        # STATUS response the RxCUI was hydrated from, later reused for its remaps
+        self.status_payload = None
 
         if valid is None:
             self.valid, self.status, self.tty, self.name = (None for i in range(4))
-            if RxCUI.api.validate(self.cui):
-                RxCUI.api.get_cui_base(self)
+            self.status_payload = RxCUI.api.get_status_payload(self.cui)
+            if RxCUI.api.process_cui_status(self.cui, *self.status_payload)[0]:
+                RxCUI.api.process_cui_base(self, *self.status_payload)
                 self.valid = True
             else:
                 self.valid = False
@@ -703,6 +724,10 @@ class RxCUI(Medication):
             return self.cui
 
     def get_ingredients(self):
+        with _med_locks.get(('ING', self.sys_id)):
+            return self._get_ingredients()
+
+    def _get_ingredients(self):
         if self.has_ingredients:
             return self.dictionaries['ING'].get_med_list()
         elif self.valid and self.has_ingredients is None:
@@ -738,12 +763,17 @@ class RxCUI(Medication):
             return False
 
     def get_linked_cui(self, cui_type:str):
+        with _med_locks.get(('LINK', self.sys_id)):
+            return self._get_linked_cui(cui_type)
+
+    def _get_linked_cui(self, cui_type:str):
         linked = []
         if cui_type == 'remap':
             if self.has_dict('REMAP'):
                 linked = self.get_dict('REMAP').get_med_list(inc_obj=True)
             else:
-                remaps = self.api.get_remap_cuis(self.cui)
+                remaps = self.api.process_remap_cuis(*self.status_payload) if self.status_payload is not None \
+                    else self.api.get_remap_cuis(self.cui)
                 if remaps:
                     self.add_dict('REMAP', self.sys_id)
                     remap_d = self.get_dict('REMAP')
@@ -786,12 +816,12 @@ class UMLSCUI(Medication):
     is_valid = util.isUmlsApiValid()
     api_conf = util.get_api_key('UMLS')
 
-    if is_valid == 'API_KEY':
+    # Local UMLS MRCONSO extract when enabled under [LOCAL_SOURCES], otherwise the UMLS API
+    api = get_local_api('UMLS')
+    if api is None and is_valid == 'API_KEY':
         api = UMLS(apikey=api_conf['UMLS_API_KEY'])
-    elif is_valid == 'USER_PASS':
+    elif api is None and is_valid == 'USER_PASS':
         api = UMLS(authuser=api_conf['UMLS_USER'], authpwd=api_conf['UMLS_PASSWORD'])
-    else:
-        api = None
 
     def __init__(self, input_key: str, source: str = 'UMLS', valid=None):
         super(UMLSCUI, self).__init__(input_key, source)
@@ -823,7 +853,7 @@ class UMLSCUI(Medication):
 
 # Set the specific Medication Class Mapping for various cases
 CUI_OBJECT_MAP = {'NDC': NDC, 'RXNORM': RxCUI, 'GENERIC': Medication, 'LOCAL': LocalMed}
-is_umls_valid = util.isUmlsApiValid()
+is_umls_valid = util.isUmlsApiValid() or UMLSCUI.api is not None
 for uml_src in util.UMLS_VALID_SRCS:
     if uml_src not in CUI_OBJECT_MAP.keys():
         CUI_OBJECT_MAP[uml_src] = UMLSCUI if is_umls_valid else Medication
\ No newline at end of file
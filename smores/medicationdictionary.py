@@ -1,18 +1,21 @@
 # Python Lib Modules
 import logging
+import threading
 # Community Modules
 from tqdm import tqdm, trange
 # SMOREs Internal Imports
 from smores.medkit import MedKit
 
 smoresLog = logging.getLogger(__name__)
+_src_lock = threading.RLock()
 
 
 def get_med_dict_by_src(src, child=None):
     """ Returns a MedicationDictionary with a Source = @src - Always returns MASTER"""
     med_dict_list = MedicationDictionary.src_list
     if src not in med_dict_list.keys():
-        _md = MedicationDictionary(src)
+        with _src_lock:
+            _md = MedicationDictionary(src) if src not in med_dict_list.keys() else med_dict_list[src]['MASTER']
     else:
         if child is not None and child in med_dict_list[src].keys():
             _md = med_dict_list[src][child]
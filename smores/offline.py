@@ -0,0 +1,544 @@
+# Python Lib Modules
+import sqlite3
+import logging
+import json
+from pathlib import Path
+# SMOREs Internal Imports
+from smores.api import SMORESapi, RXNAV, openFDA, UMLS
+from smores.utility.errors import smores_error
+from smores.utility.localstore import LocalStore
+import smores.utility.util as util
+
+'''Local backends for the SMOREs APIs. Each backend answers the endpoint calls of its API from a LocalStore built from a
+downloaded source release and returns them in that API's JSON format, so all result handling of the API is re-used.
+Backends are enabled per source under [LOCAL_SOURCES] in config.ini once the release has been imported'''
+
+APIlog = logging.getLogger(__name__)
+
+RXNORM_FILES = ['RXNCONSO.RRF', 'RXNREL.RRF', 'RXNSAT.RRF', 'RXNCUI.RRF', 'RXNCUICHANGES.RRF']
+# openFDA JSON bulk download of the NDC directory, otherwise the FDA's tab delimited product and package files are used
+FDA_NDC_JSON = 'drug-ndc-*.json'
+FDA_NDC_FILES = ['product.txt', 'package.txt']
+UMLS_FILES = ['MRCONSO.RRF']
+
+# Term types ordered from drug packs down to ingredients. Relationships are only followed towards a higher rank
+# when walking from a drug to its ingredients
+RXNORM_TTY_RANK = {'BPCK': 0, 'GPCK': 0, 'SBD': 1, 'SCD': 2, 'SBDG': 2, 'SBDF': 2, 'SBDC': 2, 'SCDG': 3, 'SCDF': 3,
+                   'SCDC': 3, 'BN': 3, 'SCDGP': 4, 'SCDFP': 4, 'MIN': 4, 'PIN': 5, 'IN': 6}
+# Synonym term types, only used as the name of a concept when it has no other atom
+RXNORM_TTY_SYNONYMS = ['SY', 'TMSY', 'PSN', 'ET']
+
+
+def use_local_source(src: str) -> bool:
+    return util.read_config_option('LOCAL_SOURCES', src, False)
+
+
+def get_local_api(src: str):
+    """
+    Local backend for a source when it is enabled under [LOCAL_SOURCES] and its release has been imported
+    :param src: RXNORM, FDA_NDC, UMLS
+    :return: API object or None if the source's API should be used
+    """
+    if src not in LOCAL_APIS.keys() or not use_local_source(src):
+        return None
+    api = LOCAL_APIS[src]()
+    if not api.get_store().is_loaded():
+        smores_error('#Ax000.7', [src, api.get_store().path], logger=APIlog)
+        return None
+    APIlog.info('Using local %s release %s', src, api.get_store().get_meta('release'))
+    return api
+
+
+def import_local_source(src: str, release_dir, release: str = None):
+    """
+    Imports a downloaded release into the local store of a source
+    :param src: RXNORM, FDA_NDC, UMLS
+    :param release_dir: Directory of the unzipped release files
+    :param release: Release name, defaults to the name of release_dir
+    :return: {table: rows imported} or None if the import failed
+    """
+    if src.upper() not in LOCAL_IMPORTS.keys():
+        smores_error('#Cx003.1', 'Local source {0}'.format(src), logger=APIlog)
+        return None
+    release_dir = Path(release_dir)
+    if not release_dir.is_dir():
+        smores_error('#Ax000.7', str(release_dir), logger=APIlog)
+        return None
+    return LOCAL_IMPORTS[src.upper()](release_dir, release if release is not None else release_dir.name)
+
+
+def import_rxnorm(release_dir, release: str):
+    files = {}
+    for _f in RXNORM_FILES:
+        files[_f] = LocalStore.find_file(release_dir, _f)
+        if files[_f] is None:
+            smores_error('#Ax000.7', [_f, str(release_dir)], logger=APIlog)
+            return None
+
+    def read_concepts():
+        # RXCUI|LAT|TS|LUI|STT|SUI|ISPREF|RXAUI|SAUI|SCUI|SDUI|SAB|TTY|CODE|STR|SRL|SUPPRESS|CVF
+        concepts = {}
+        for _r in LocalStore.read_delimited(files['RXNCONSO.RRF']):
+            if len(_r) < 17 or _r[11] != 'RXNORM':
+                continue
+            _atom = (_r[12] in RXNORM_TTY_SYNONYMS, _r[16] not in ['N', ''], _r[12], _r[14], _r[16])
+            if _r[0] not in concepts or _atom < concepts[_r[0]]:
+                concepts[_r[0]] = _atom
+        for rxcui, _atom in concepts.items():
+            yield rxcui, _atom[2], _atom[3], _atom[4]
+
+    def read_relations():
+        # RXCUI1|RXAUI1|STYPE1|REL|RXCUI2|RXAUI2|STYPE2|RELA|RUI|SRUI|SAB|SL|DIR|RG|SUPPRESS|CVF
+        for _r in LocalStore.read_delimited(files['RXNREL.RRF']):
+            if len(_r) > 10 and _r[10] == 'RXNORM' and _r[0] and _r[4] and _r[0] != _r[4]:
+                yield _r[0], _r[4], _r[7]
+
+    def read_attributes():
+        # RXCUI|LUI|SUI|RXAUI|STYPE|CODE|ATUI|SATUI|ATN|SAB|ATV|SUPPRESS|CVF
+        for _r in LocalStore.read_delimited(files['RXNSAT.RRF']):
+            if len(_r) > 10 and _r[8] == 'NDC' and _r[9] == 'RXNORM':
+                yield _r[0], _r[8], _r[10]
+
+    def read_retired():
+        # CUI1|VER_START|VER_END|CARDINALITY|CUI2
+        for _r in LocalStore.read_delimited(files['RXNCUI.RRF']):
+            if len(_r) > 4:
+                yield _r[0], _r[4], _r[2]
+
+    def read_changes():
+        # RXAUI|CODE|SAB|TTY|STR|OLD_RXCUI|NEW_RXCUI
+        for _r in LocalStore.read_delimited(files['RXNCUICHANGES.RRF']):
+            if len(_r) > 6 and _r[2] == 'RXNORM':
+                yield _r[5], _r[6], _r[3], _r[4]
+
+    schema = ['CREATE TABLE rxnconcept (rxcui TEXT PRIMARY KEY, tty TEXT, name TEXT, suppress TEXT)',
+              'CREATE TABLE rxnrel (rxcui1 TEXT, rxcui2 TEXT, rela TEXT)',
+              'CREATE TABLE rxnsat (rxcui TEXT, atn TEXT, atv TEXT)',
+              'CREATE TABLE rxncui (cui1 TEXT, cui2 TEXT, ver_end TEXT)',
+              'CREATE TABLE rxnchanges (old_rxcui TEXT, new_rxcui TEXT, tty TEXT, name TEXT)']
+    tables = {'rxnconcept': (['rxcui', 'tty', 'name', 'suppress'], read_concepts()),
+              'rxnrel': (['rxcui1', 'rxcui2', 'rela'], read_relations()),
+              'rxnsat': (['rxcui', 'atn', 'atv'], read_attributes()),
+              'rxncui': (['cui1', 'cui2', 'ver_end'], read_retired()),
+              'rxnchanges': (['old_rxcui', 'new_rxcui', 'tty', 'name'], read_changes())}
+    indexes = ['CREATE INDEX idx_rxnrel ON rxnrel (rxcui1)',
+               'CREATE INDEX idx_rxnsat ON rxnsat (atn, atv)',
+               'CREATE INDEX idx_rxncui ON rxncui (cui1)',
+               'CREATE INDEX idx_rxnchanges ON rxnchanges (old_rxcui)']
+    return LocalStore.get_store('RXNORM').build(schema, tables, indexes, {'release': release,
+                                                                        'source': str(release_dir)})
+
+
+def format_ndc11(ndc: str):
+    """ 11 digit (5-4-2) form of a hyphenated package NDC, or 9 digit (5-4) form of a hyphenated product NDC """
+    parts = ndc.split('-')
+    if len(parts) == 3:
+        return parts[0].zfill(5) + parts[1].zfill(4) + parts[2].zfill(2)
+    elif len(parts) == 2:
+        return parts[0].zfill(5) + parts[1].zfill(4)
+    return ndc
+
+
+def read_fda_ndc_text(product_file, package_file):
+    """ Builds openFDA style NDC records from the FDA NDC directory product and package text files """
+    rxnorm = LocalStore.get_store('RXNORM')
+    rxnorm = rxnorm if rxnorm.is_loaded() else None
+    packages = {}
+    _rows = LocalStore.read_delimited(package_file, sep='\t', encoding='latin-1')
+    _head = [_h.upper() for _h in next(_rows, [])]
+    for _r in _rows:
+        _p = dict(zip(_head, _r))
+        _pack = {'package_ndc': _p.get('NDCPACKAGECODE', ''), 'description': _p.get('PACKAGEDESCRIPTION', ''),
+                 'marketing_start_date': _p.get('STARTMARKETINGDATE', '')}
+        packages.setdefault(_p.get('PRODUCTID'), []).append(_pack)
+
+    _rows = LocalStore.read_delimited(product_file, sep='\t', encoding='latin-1')
+    _head = [_h.upper() for _h in next(_rows, [])]
+    for _r in _rows:
+        _p = dict(zip(_head, _r))
+        _brand = ' '.join(_n for _n in [_p.get('PROPRIETARYNAME', ''), _p.get('PROPRIETARYNAMESUFFIX', '')] if _n)
+        _ings = zip(_p.get('SUBSTANCENAME', '').split(';'), _p.get('ACTIVE_NUMERATOR_STRENGTH', '').split(';'),
+                    _p.get('ACTIVE_INGRED_UNIT', '').split(';'))
+        record = {'product_ndc': _p.get('PRODUCTNDC', ''),
+                  'generic_name': _p.get('NONPROPRIETARYNAME', ''),
+                  'brand_name': _brand,
+                  'labeler_name': _p.get('LABELERNAME', ''),
+                  'dosage_form': _p.get('DOSAGEFORMNAME', ''),
+                  'route': [_rt.strip() for _rt in _p.get('ROUTENAME', '').split(';') if _rt.strip()],
+                  'marketing_category': _p.get('MARKETINGCATEGORYNAME', ''),
+                  'marketing_start_date': _p.get('STARTMARKETINGDATE', ''),
+                  'active_ingredients': [{'name': _i[0].strip(), 'strength': '{0} {1}'.format(_i[1].strip(),
+                                                                                               _i[2].strip())}
+                                         for _i in _ings if _i[0].strip()],
+                  'packaging': packages.get(_p.get('PRODUCTID'), []),
+                  'openfda': {'unii': []}}
+        if _p.get('LISTING_RECORD_CERTIFIED_THROUGH'):
+            record['listing_expiration_date'] = _p['LISTING_RECORD_CERTIFIED_THROUGH']
+        if _p.get('ENDMARKETINGDATE'):
+            record['marketing_end_date'] = _p['ENDMARKETINGDATE']
+        if rxnorm is not None:
+            # The text files do not carry RxCUIs, link them through the NDC attributes of the local RxNorm release
+            _ndcs = [format_ndc11(_pack['package_ndc']) for _pack in record['packaging']]
+            _cuis = rxnorm.query('SELECT DISTINCT rxcui FROM rxnsat WHERE atn = ? AND atv IN ({0})'.format(
+                ', '.join('?' for _ in _ndcs)), ['NDC'] + _ndcs) if len(_ndcs) > 0 else []
+            if len(_cuis) > 0:
+                record['openfda']['rxcui'] = [_c[0] for _c in _cuis]
+        yield record
+
+
+def import_fda_ndc(release_dir, release: str):
+    json_files = LocalStore.find_files(release_dir, FDA_NDC_JSON)
+    if len(json_files) > 0:
+        records = []
+        for _f in json_files:
+            with open(str(_f), 'r', encoding='utf-8') as _file:
+                _bulk = json.load(_file)
+            records += _bulk.get('results', [])
+            release = _bulk.get('meta', {}).get('last_updated', release)
+    else:
+        files = {}
+        for _f in FDA_NDC_FILES:
+            files[_f] = LocalStore.find_file(release_dir, _f)
+            if files[_f] is None:
+                smores_error('#Ax000.7', [_f, str(release_dir)], logger=APIlog)
+                return None
+        records = list(read_fda_ndc_text(files['product.txt'], files['package.txt']))
+
+    def read_products():
+        for _rec in records:
+            _ndc = _rec.get('product_ndc', '')
+            yield _ndc, format_ndc11(_ndc), _ndc.replace('-', ''), json.dumps(_rec)
+
+    def read_packages():
+        for _rec in records:
+            for _pack in _rec.get('packaging', []):
+                _ndc = _pack.get('package_ndc', '')
+                yield _ndc, format_ndc11(_ndc), _ndc.replace('-', ''), _rec.get('product_ndc', '')
+
+    def read_rxcuis():
+        for _rec in records:
+            for rxcui in set(_rec.get('openfda', {}).get('rxcui', [])):
+                yield rxcui, _rec.get('product_ndc', '')
+
+    schema = ['CREATE TABLE product (product_ndc TEXT, ndc9 TEXT, ndc8 TEXT, data TEXT)',
+              'CREATE TABLE package (package_ndc TEXT, ndc11 TEXT, ndc10 TEXT, product_ndc TEXT)',
+              'CREATE TABLE rxcui (rxcui TEXT, product_ndc TEXT)']
+    tables = {'product': (['product_ndc', 'ndc9', 'ndc8', 'data'], read_products()),
+              'package': (['package_ndc', 'ndc11', 'ndc10', 'product_ndc'], read_packages()),
+              'rxcui': (['rxcui', 'product_ndc'], read_rxcuis())}
+    indexes = ['CREATE INDEX idx_product ON product (product_ndc)',
+               'CREATE INDEX idx_product9 ON product (ndc9)',
+               'CREATE INDEX idx_product8 ON product (ndc8)',
+               'CREATE INDEX idx_package11 ON package (ndc11)',
+               'CREATE INDEX idx_package10 ON package (ndc10)',
+               'CREATE INDEX idx_rxcui ON rxcui (rxcui)']
+    return LocalStore.get_store('FDA_NDC').build(schema, tables, indexes, {'release': release,
+                                                                         'source': str(release_dir)})
+
+
+def import_umls(release_dir, release: str):
+    mrconso = LocalStore.find_file(release_dir, UMLS_FILES[0])
+    if mrconso is None:
+        smores_error('#Ax000.7', [UMLS_FILES[0], str(release_dir)], logger=APIlog)
+        return None
+    sources = list(util.UMLS_VALID_SRCS.keys())
+    cuis = set()
+
+    def read_atoms():
+        # CUI|LAT|TS|LUI|STT|SUI|ISPREF|AUI|SAUI|SCUI|SDUI|SAB|TTY|CODE|STR|SRL|SUPPRESS|CVF
+        for _r in LocalStore.read_delimited(mrconso):
+            if len(_r) > 16 and _r[1] == 'ENG' and _r[11] in sources:
+                cuis.add(_r[0])
+                yield _r[0], _r[11], _r[13], _r[12], _r[14], _r[16], _r[6], _r[2]
+
+    def read_concepts():
+        # Preferred English name of each concept that has an atom in one of the sources
+        for _r in LocalStore.read_delimited(mrconso):
+            if len(_r) > 16 and _r[0] in cuis and _r[1] == 'ENG' and _r[2] == 'P' and _r[4] == 'PF' and _r[6] == 'Y':
+                cuis.discard(_r[0])
+                yield _r[0], _r[14]
+
+    schema = ['CREATE TABLE atom (cui TEXT, sab TEXT, code TEXT, tty TEXT, name TEXT, suppress TEXT, ispref TEXT, '
+              'ts TEXT)',
+              'CREATE TABLE concept (cui TEXT PRIMARY KEY, name TEXT)']
+    tables = {'atom': (['cui', 'sab', 'code', 'tty', 'name', 'suppress', 'ispref', 'ts'], read_atoms()),
+              'concept': (['cui', 'name'], read_concepts())}
+    indexes = ['CREATE INDEX idx_atom_code ON atom (sab, code)',
+               'CREATE INDEX idx_atom_cui ON atom (cui, sab)']
+    return LocalStore.get_store('UMLS').build(schema, tables, indexes, {'release': release,
+                                                                      'source': str(release_dir)})
+
+
+class LocalAPI:
+    """
+    Mixin for a SMOREs API that answers call_api from a local store instead of the network. Each supported endpoint
+    (call type) is handled by a method named local_<call type>(val, c_opt) that returns the API's JSON response
+    """
+    store_id = ''
+
+    def get_store(self) -> LocalStore:
+        return LocalStore.get_store(self.store_id)
+
+    def get_release(self):
+        return self.get_store().get_meta('release')
+
+    def call_api(self, call_type, val, c_opt=None, use_cache=True):
+        request = self.build_request(call_type, val, c_opt)
+        if not request:
+            return False, self.api_url, None
+        api_call = request[0] + ('?' + request[1] if len(request[1]) > 0 else '')
+        handler = getattr(self, 'local_{0}'.format(call_type.lower()), None)
+        if handler is None:
+            smores_error(self.get_e('2', c_ovrd=SMORESapi.e_subclass), [call_type, self.api_name], logger=APIlog)
+            return False, api_call, None
+        try:
+            return True, handler(str(val), c_opt), api_call
+        except sqlite3.Error as e:
+            smores_error(self.get_e('1', c_ovrd=SMORESapi.e_subclass), [api_call, self.api_name, e], logger=APIlog)
+            return False, api_call, None
+
+
+class LocalRXNAV(LocalAPI, RXNAV):
+    store_id = 'RXNORM'
+
+    def __init__(self):
+        super(LocalRXNAV, self).__init__()
+        self.api_url = 'local://rxnorm/'
+        self.api_name = 'RxNorm - Local Release Files'
+        self.api_short = 'Local RxNorm'
+
+    def get_concept(self, rxcui):
+        rows = self.get_store().query('SELECT rxcui, tty, name, suppress FROM rxnconcept WHERE rxcui = ?', (rxcui,))
+        if len(rows) == 0:
+            return None
+        return {'rxcui': rows[0][0], 'tty': rows[0][1], 'name': rows[0][2], 'suppress': rows[0][3]}
+
+    def get_related(self, rxcui):
+        rows = self.get_store().query('SELECT DISTINCT c.rxcui, c.tty, c.name, c.suppress FROM rxnrel r '
+                                      'JOIN rxnconcept c ON c.rxcui = r.rxcui2 WHERE r.rxcui1 = ?', (rxcui,))
+        return [{'rxcui': _r[0], 'tty': _r[1], 'name': _r[2], 'suppress': _r[3]} for _r in rows]
+
+    def get_remapped(self, rxcui):
+        """ Concepts a retired RxCUI was remapped to, from RXNCUI and RXNCUICHANGES """
+        rows = self.get_store().query('SELECT cui2 FROM rxncui WHERE cui1 = ? AND cui2 != cui1 UNION '
+                                      'SELECT new_rxcui FROM rxnchanges WHERE old_rxcui = ? AND new_rxcui != old_rxcui',
+                                      (rxcui, rxcui))
+        concepts = [self.get_concept(_r[0]) for _r in rows]
+        return [_c for _c in concepts if _c is not None]
+
+    def walk_ingredients(self, rxcui, targets: list):
+        """ Walks the RxNorm relationships of a concept down to the concepts of the target term types """
+        start = self.get_concept(rxcui)
+        if start is None:
+            return []
+        found, seen, queue = {}, {rxcui}, [start]
+        while len(queue) > 0:
+            concept = queue.pop(0)
+            rank = RXNORM_TTY_RANK.get(concept['tty'])
+            if rank is None:
+                continue
+            for related in self.get_related(concept['rxcui']):
+                if related['rxcui'] in seen or RXNORM_TTY_RANK.get(related['tty'], -1) <= rank:
+                    continue
+                seen.add(related['rxcui'])
+                if related['tty'] in targets:
+                    found[related['rxcui']] = related
+                queue.append(related)
+        return list(found.values())
+
+    @staticmethod
+    def format_min_concept(concept):
+        return {'rxcui': concept['rxcui'], 'name': concept['name'], 'tty': concept['tty']}
+
+    @staticmethod
+    def format_concept_properties(concept):
+        return {'rxcui': concept['rxcui'], 'name': concept['name'], 'synonym': '', 'tty': concept['tty'],
+                'language': 'ENG', 'suppress': concept['suppress'], 'umlscui': ''}
+
+    def local_status(self, rxcui, c_opt=None):
+        concept = self.get_concept(rxcui)
+        if concept is not None:
+            status = 'Active' if concept['suppress'] in ['N', ''] else 'Obsolete'
+            return {'rxcuiStatus': {'status': status,
+                                    'minConceptGroup': {'minConcept': [self.format_min_concept(concept)]}}}
+        remapped = self.get_remapped(rxcui)
+        if len(remapped) > 0:
+            return {'rxcuiStatus': {'status': 'Remapped',
+                                    'minConceptGroup': {'minConcept': [self.format_min_concept(_c) for _c in remapped]}}}
+        if len(self.get_store().query('SELECT 1 FROM rxncui WHERE cui1 = ? UNION '
+                                      'SELECT 1 FROM rxnchanges WHERE old_rxcui = ?', (rxcui, rxcui))) > 0:
+            return {'rxcuiStatus': {'status': 'Retired'}}
+        return {'rxcuiStatus': {'status': 'UNKNOWN', 'minConceptGroup': {}}}
+
+    def local_ing(self, rxcui, c_opt=None):
+        targets = self.endpoints['ING']['payload']['tty'].split('+')
+        ingredients = self.walk_ingredients(rxcui, targets)
+        groups = []
+        for tty in targets:
+            group = {'tty': tty}
+            _props = [self.format_concept_properties(_c) for _c in ingredients if _c['tty'] == tty]
+            if len(_props) > 0:
+                group['conceptProperties'] = _props
+            groups.append(group)
+        return {'relatedGroup': {'rxcui': rxcui, 'termType': targets, 'conceptGroup': groups}}
+
+    def local_history(self, rxcui, c_opt=None):
+        concept = self.get_concept(rxcui)
+        if concept is None:
+            changes = self.get_store().query('SELECT tty, name FROM rxnchanges WHERE old_rxcui = ?', (rxcui,))
+            current = self.get_remapped(rxcui)
+            if len(changes) == 0 and len(current) == 0:
+                return {'rxcuiHistoryConcept': {'rxcuiConcept': 'Not Found'}}
+            history = {'rxcuiConcept': {'rxcui': rxcui, 'str': changes[0][1] if len(changes) > 0 else '',
+                                        'tty': changes[0][0] if len(changes) > 0 else '',
+                                        'status': 'Remapped' if len(current) > 0 else 'Retired'}}
+        else:
+            current = [concept]
+            history = {'rxcuiConcept': {'rxcui': rxcui, 'str': concept['name'], 'tty': concept['tty'],
+                                        'status': 'Active' if concept['suppress'] in ['N', ''] else 'Obsolete'}}
+        boss = {}
+        for _c in current:
+            for ing in ([_c] if _c['tty'] == 'IN' else self.walk_ingredients(_c['rxcui'], ['IN'])):
+                boss[ing['rxcui']] = {'baseRxcui': ing['rxcui'], 'baseName': ing['name'],
+                                      'bossRxcui': ing['rxcui'], 'bossName': ing['name']}
+        if len(boss) > 0:
+            history['bossConcept'] = list(boss.values())
+        return {'rxcuiHistoryConcept': history}
+
+    def local_id_lookup(self, id, c_opt=None):
+        id_type = c_opt if type(c_opt) is str else ''
+        group = {'idType': id_type, 'id': id}
+        if id_type.upper() == 'NDC':
+            rows = self.get_store().query('SELECT DISTINCT rxcui FROM rxnsat WHERE atn = ? AND atv = ?',
+                                          ('NDC', id.zfill(11)))
+            if len(rows) > 0:
+                group['rxnormId'] = [_r[0] for _r in rows]
+        return {'idGroup': group}
+
+    def local_version(self, val=None, c_opt=None):
+        return {'version': self.get_release(), 'apiVersion': 'local'}
+
+
+class LocalFDA(LocalAPI, openFDA):
+    store_id = 'FDA_NDC'
+
+    def __init__(self, api_key=None):
+        super(LocalFDA, self).__init__(api_key)
+        self.api_url = 'local://fda/'
+        self.api_name = 'openFDA - Local NDC Directory'
+        self.api_short = 'Local openFDA'
+
+    @staticmethod
+    def get_ndc_keys(ndc: str):
+        """ Normalized (zero padded) and digit only forms of an input NDC """
+        return format_ndc11(ndc) if '-' in ndc else ndc, ndc.replace('-', '')
+
+    def get_products(self, product_ndcs: list):
+        if len(product_ndcs) == 0:
+            return []
+        rows = self.get_store().query('SELECT data FROM product WHERE product_ndc IN ({0})'.format(
+            ', '.join('?' for _ in product_ndcs)), product_ndcs)
+        return [json.loads(_r[0]) for _r in rows]
+
+    @staticmethod
+    def format_results(results: list, c_opt=None):
+        """ openFDA search response, one result unless a limit (and skip) are provided like the API """
+        _opt = c_opt if type(c_opt) is dict else {}
+        skip, limit = int(_opt.get('skip', 0)), int(_opt.get('limit', 1))
+        if len(results) == 0 or skip >= len(results):
+            return {'error': {'code': 'NOT_FOUND', 'message': 'No matches found!'}}
+        return {'meta': {'results': {'skip': skip, 'limit': limit, 'total': len(results)}},
+                'results': results[skip:skip + limit]}
+
+    def call_batch(self, call_type, codes: list, use_cache=True):
+        # Store lookups are cheap, so batches are answered one code at a time with the single lookup of each code
+        endpoint = self.get_endpoint(call_type)
+        if not endpoint:
+            return {}
+        found = {}
+        for code in codes:
+            success, response, _ = self.call_api(endpoint['batch_of'], str(code), {'limit': openFDA.batch_limit})
+            found[str(code)] = response['results'] if success and 'results' in response.keys() else []
+        return found
+
+    def local_pack_status(self, ndc, c_opt=None):
+        rows = self.get_store().query('SELECT DISTINCT product_ndc FROM package WHERE ndc11 = ? OR ndc10 = ?',
+                                      self.get_ndc_keys(ndc))
+        return self.format_results(self.get_products([_r[0] for _r in rows]), c_opt)
+
+    def local_product(self, ndc, c_opt=None):
+        rows = self.get_store().query('SELECT data FROM product WHERE ndc9 = ? OR ndc8 = ?', self.get_ndc_keys(ndc))
+        return self.format_results([json.loads(_r[0]) for _r in rows], c_opt)
+
+    def local_rxn_lookup(self, rxcui, c_opt=None):
+        rows = self.get_store().query('SELECT DISTINCT product_ndc FROM rxcui WHERE rxcui = ?', (rxcui,))
+        return self.format_results(self.get_products([_r[0] for _r in rows]), c_opt)
+
+
+class LocalUMLS(LocalAPI, UMLS):
+    """ UMLS lookups and crosswalks from a local MRCONSO extract. Codes of two sources are linked through the UMLS
+        concepts (CUI) they share, the same way the UMLS crosswalk API does """
+    store_id = 'UMLS'
+    # Atoms ordered so the first one of a code or concept gives its preferred name
+    atom_order = "ORDER BY suppress != 'N', ispref != 'Y', ts != 'P'"
+
+    def __init__(self, apikey=None, authuser=None, authpwd=None):
+        super(LocalUMLS, self).__init__(apikey, authuser, authpwd)
+        self.api_url = 'local://umls/'
+        self.api_name = 'UMLS - Local MRCONSO'
+        self.api_short = 'Local UMLS'
+
+    def get_auth_client(self, apikey=None, authuser=None, authpwd=None):
+        # No service tickets are needed to read the local store
+        return None
+
+    @staticmethod
+    def parse_source(src: str):
+        return src[len('source/'):] if src.startswith('source/') else src
+
+    def get_code_atoms(self, sab: str, code: str):
+        return self.get_store().query('SELECT cui, name, suppress FROM atom WHERE sab = ? AND code = ? {0}'.format(
+            self.atom_order), (sab, code))
+
+    def local_status(self, code, c_opt=None):
+        src = self.parse_source(c_opt['SRC'])
+        if src == 'CUI':
+            rows = self.get_store().query('SELECT cui, name FROM concept WHERE cui = ?', (code,))
+            if len(rows) > 0:
+                return {'result': {'ui': rows[0][0], 'name': rows[0][1], 'rootSource': 'UMLS', 'obsolete': False,
+                                   'classType': 'Concept'}}
+        else:
+            atoms = self.get_code_atoms(src, code)
+            if len(atoms) > 0:
+                return {'result': {'ui': code, 'name': atoms[0][1], 'rootSource': src,
+                                   'obsolete': all(_a[2] == 'O' for _a in atoms), 'classType': 'SourceAtomCluster'}}
+        return {'error': 'No results containing all your search terms were found.', 'status': 404}
+
+    def local_crosswalk(self, code, c_opt=None):
+        src, target = self.parse_source(c_opt['SRC']), c_opt['targetSource']
+        rows = self.get_store().query('SELECT t.code, t.name, t.suppress FROM atom s JOIN atom t ON t.cui = s.cui '
+                                      'WHERE s.sab = ? AND s.code = ? AND t.sab = ? '
+                                      "ORDER BY t.code, t.suppress != 'N', t.ispref != 'Y', t.ts != 'P'",
+                                      (src, code, target))
+        clusters = {}
+        for _code, _name, _suppress in rows:
+            if _code not in clusters.keys():
+                clusters[_code] = {'ui': _code, 'name': _name, 'rootSource': target, 'obsolete': True,
+                                   'classType': 'SourceAtomCluster'}
+            clusters[_code]['obsolete'] = clusters[_code]['obsolete'] and _suppress == 'O'
+        return {'result': list(clusters.values())}
+
+    def local_cui_lookup(self, code, c_opt=None):
+        src = c_opt['sabs'] if type(c_opt) is dict else 'CUI'
+        if src == 'CUI':
+            rows = self.get_store().query('SELECT cui, name FROM concept WHERE cui = ?', (code,))
+        else:
+            rows = self.get_store().query('SELECT DISTINCT c.cui, c.name FROM atom a JOIN concept c ON c.cui = a.cui '
+                                          'WHERE a.sab = ? AND a.code = ?', (src, code))
+        results = [{'ui': _r[0], 'rootSource': src, 'name': _r[1]} for _r in rows]
+        return {'result': {'classType': 'searchResults',
+                           'results': results if len(results) > 0 else [{'ui': 'NONE', 'name': 'NO RESULTS'}]}}
+
+
+LOCAL_APIS = {'RXNORM': LocalRXNAV, 'FDA_NDC': LocalFDA, 'UMLS': LocalUMLS}
+LOCAL_IMPORTS = {'RXNORM': import_rxnorm, 'FDA_NDC': import_fda_ndc, 'UMLS': import_umls}
@@ -1,7 +1,9 @@
 # Python Lib Modules
 import time, os, math, csv, re, logging
 from pathlib import Path
+from functools import partial
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
 # Community Modules
 import pandas as pd
@@ -13,7 +15,7 @@ from smores.medkit import MedKit
 from smores.utility.errors import smores_error
 from typing import Union
 import smores.utility.util as util
-from smores.crosswalk import get_crosswalk
+from smores.crosswalk import get_crosswalk, CUICrosswalk
 
 smoresLog = logging.getLogger(__name__)
 
@@ -71,6 +73,16 @@ def line_read (medkit, input, last_id=None, skip1=True):
         return local_id, is_dup, has_err, cui_type
 
 
+def get_input_path(input_file:str):
+    """ Full path of an input file, files are expected in the /input folder unless a full path is given """
+    if ':\\' in input_file:
+        return Path(input_file).resolve()
+    elif 'tests/' in input_file:
+        return Path("..", 'tests', input_file).resolve()
+    else:
+        return Path("..", 'input', input_file).resolve()
+
+
 def load_file(input_file:str):
     def process_file(curr_medkit):
         try:
@@ -108,12 +120,7 @@ def load_file(input_file:str):
             time.sleep(.01) # Clean exit of tqdm
             return {'records': c_records, 'dups': c_dup, 'errors': errors, 'file': curr_medkit.file_name}
 
-    if ':\\' in input_file:
-        input_file_path = Path(input_file).resolve()
-    elif 'tests/' in input_file:
-        input_file_path = Path("..", 'tests', input_file).resolve()
-    else:
-        input_file_path = Path("..", 'input', input_file).resolve()
+    input_file_path = get_input_path(input_file)
 
     try:
         if input_file_path.exists():
@@ -200,12 +207,65 @@ def write_file(output_file=None, data=None, iter:int=0, ext:str=None):
             return False, '#Cx001.2'
 
 
-def process_event(src:Union[MedKit, str], func, display:str, event_restrict=None, args=None):
+def get_worker_count():
+    """ Number of concurrent workers used to process medications, from [PROCESSING] WORKERS in config.ini """
+    return max(util.read_config_option('PROCESSING', 'WORKERS', 1), 1)
+
+
+def get_unique_codes(kits:list, sources:list):
+    """
+    Collects the unique codes of the given sources across the medications of one or more MedKits. Code objects are
+    shared by every LocalMed that lists the code, so anything resolved on one is available to all of them
+    :param kits: list of MedKits
+    :param sources: code sources (LocalMed dictionaries) to collect, e.g. ['RXNORM']
+    :return: dict{(source, code): Medication object}
+    """
+    codes = {}
+    for kit in kits:
+        for local_med in kit.m_dict.med_list.values():
+            for src in sources:
+                src_dict = local_med.get_dict(src)
+                if src_dict is not None:
+                    for cui, med_obj in src_dict.get_med_list(inc_obj=True).items():
+                        if (src, str(cui)) not in codes.keys():
+                            codes[(src, str(cui))] = med_obj
+    return codes
+
+
+def resolve_codes(codes:dict, resolve, display:str, workers:int=None):
+    """
+    Planning stage of a command, runs resolve once for each unique code object before the per medication processing
+    :param codes: dict{(source, code): Medication object} from get_unique_codes
+    :param resolve: function taking a code object, its results are kept on the object
+    :param workers: Number of codes to resolve concurrently. Defaults to [PROCESSING] WORKERS in config.ini
+    :return: number of codes resolved
+    """
+    workers = get_worker_count() if workers is None else max(workers, 1)
+    code_objs = list(codes.values())
+    if len(code_objs) == 0:
+        return 0
+    pbar = tqdm(total=len(code_objs), desc=display + ' Unique Codes', position=0)
+    if workers > 1 and len(code_objs) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in as_completed([executor.submit(resolve, _obj) for _obj in code_objs]):
+                pbar.update(1)
+    else:
+        for _obj in code_objs:
+            resolve(_obj)
+            pbar.update(1)
+    pbar.close()
+    time.sleep(.01)
+    return len(code_objs)
+
+
+def process_event(src:Union[MedKit, str], func, display:str, event_restrict=None, args=None, workers:int=None):
     '''
 
     :param src:
     :param func:
     :param event_restrict: Must be a function call
+    :param workers: Number of medications to process concurrently. Defaults to [PROCESSING] WORKERS in config.ini.
+        API calls made by the workers remain subject to the shared per-host rate limits
     :return:
     '''
     _count = 0
@@ -221,13 +281,26 @@ def process_event(src:Union[MedKit, str], func, display:str, event_restrict=None
         med_val_list = list(_md.med_list.values())
 
     results = {}
+    workers = get_worker_count() if workers is None else max(workers, 1)
     pbar = tqdm(total=len(med_val_list), desc=display + ' Processing', position=0)
-    for _val in med_val_list:
-        _v, _res = func(_val) if args is None else func(_val, args)
-        if _v:
-            _num_valid += 1
-            results[_val.cui] = _res
-        pbar.update(1)
+    if workers > 1 and len(med_val_list) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(func, _val) if args is None else executor.submit(func, _val, args): _val
+                       for _val in med_val_list}
+            for future in as_completed(futures):
+                _val = futures[future]
+                _v, _res = future.result()
+                if _v:
+                    _num_valid += 1
+                    results[_val.cui] = _res
+                pbar.update(1)
+    else:
+        for _val in med_val_list:
+            _v, _res = func(_val) if args is None else func(_val, args)
+            if _v:
+                _num_valid += 1
+                results[_val.cui] = _res
+            pbar.update(1)
     #pbar.close()
 
     #pbar = tqdm(total=_num_valid, desc='Finalizing Results', position=0)
@@ -282,14 +355,21 @@ def run_client_cmd(client_cmd:str, med_id:str=None, med_id_type:str=None, file:s
     :param opts:
     :return:
     """
+    # 'plan' : code sources to resolve once per unique code, across all files, before processing each medication, or a
+    #   'batch' function of (kits, args) whose results are handed to the command as planned=
     client_cmds = {'rxn_status': {'func': get_rxn_status, 'display': 'RxNorm Status', 'restrict': None},
-                   'rxn_ing': {'func': get_rxn_ingredients, 'display': 'RxNorm Ingredients', 'restrict': None},
-                   'rxn_lookup': {'func': get_rxn_lookup, 'display': 'RxNorm Lookup', 'restrict': None},
-                   'rxn_remap': {'func': get_rxn_remap, 'display': 'Remapped RxNorm', 'restrict': None},
+                   'rxn_ing': {'func': get_rxn_ingredients, 'display': 'RxNorm Ingredients', 'restrict': None,
+                               'plan': {'sources': ['RXNORM'], 'resolve': lambda rxc: rxc.get_ingredients()}},
+                   'rxn_lookup': {'func': get_rxn_lookup, 'display': 'RxNorm Lookup', 'restrict': None,
+                                  'plan': {'sources': ['NDC'], 'resolve': lambda ndc: ndc.get_linked_cui('RXNORM')}},
+                   'rxn_remap': {'func': get_rxn_remap, 'display': 'Remapped RxNorm', 'restrict': None,
+                                 'plan': {'sources': ['RXNORM'],
+                                          'resolve': lambda rxc: rxc.get_linked_cui('remap') if rxc.has_remaps else None}},
                    'rxn_history': {'func': get_rxn_history,
                                    'display': 'Retired RxNorm History',
                                    'restrict': m.RxCUI.get_historical_list},
-                   'code_lookup': {'func': get_code_lookup, 'display': 'Code Lookup', 'restrict': None}
+                   'code_lookup': {'func': get_code_lookup, 'display': 'Code Lookup', 'restrict': None,
+                                   'plan': {'batch': plan_code_lookup}}
                    # 'rxn_search': get_rxn_search
                    }
     try:
@@ -297,6 +377,7 @@ def run_client_cmd(client_cmd:str, med_id:str=None, med_id_type:str=None, file:s
         this_display = client_cmds[client_cmd]['display']
         this_restriction = client_cmds[client_cmd]['restrict']
         this_cmd_requires = client_cmds[client_cmd]['requires'] if 'requires' in client_cmds[client_cmd].keys() else None
+        this_plan = client_cmds[client_cmd]['plan'] if 'plan' in client_cmds[client_cmd].keys() else None
     except KeyError:
         smores_error('TBD', client_cmd)
         return
@@ -311,6 +392,17 @@ def run_client_cmd(client_cmd:str, med_id:str=None, med_id_type:str=None, file:s
                     print('   Requirements: {0} \n'.format(error))
                 return 0, [], file
         success_count, errors = 0, []
+        if this_plan is not None:
+            plan_kits = list(MedKit.get_medkit().values()) if file == 'ALL' else \
+                [MedKit.get_medkit(file) if not isinstance(file, MedKit) and MedKit.src_is_medkit(file) else file]
+            plan_kits = [_k for _k in plan_kits if isinstance(_k, MedKit)]
+            if 'batch' in this_plan.keys():
+                this_cmd = partial(this_cmd, planned=this_plan['batch'](plan_kits, args))
+            else:
+                unique_codes = get_unique_codes(plan_kits, this_plan['sources'])
+                smoresLog.info('{0} : Resolving {1} unique codes'.format(client_cmd, len(unique_codes)))
+                resolve_codes(unique_codes, this_plan['resolve'], this_display)
+
         if file == 'ALL':
             medkits = MedKit.get_medkit()
             num_kits = len(medkits)
@@ -341,24 +433,72 @@ def run_client_cmd(client_cmd:str, med_id:str=None, med_id_type:str=None, file:s
         return 0, [], med_id
 
 
-def get_code_lookup(medObj:Union[m.Medication, m.NDC, m.RxCUI], target:str):
+def plan_code_lookup(kits:list, target:str):
+    """
+    Planning stage of code_lookup. The unique codes of every code set with a crosswalk (or planned chain of crosswalks)
+    to target are crosswalked once as a batch, each hop over the unique codes reaching it
+    :param kits: list of MedKits
+    :param target: the target codeset to search for mappings to
+    :return: dict{(source, code): answers or None}
+    """
+    planned = {}
+    if type(target) is not str:
+        return planned
+    for source in util.OPTIONS_CUI_TYPES:
+        if source == target:
+            continue
+        try:
+            crosswalk = get_crosswalk(source, target)
+        except KeyError:
+            continue
+        codes = get_unique_codes(kits, [source])
+        if len(codes) == 0:
+            continue
+        smoresLog.info('code_lookup : Crosswalking {0} unique {1} codes to {2}'.format(len(codes), source, target))
+        answers = crosswalk.run_batch([_code for _, _code in codes.keys()])
+        for _key in codes.keys():
+            planned[_key] = answers.get(_key[1])
+    return planned
+
+
+def get_code_lookup(medObj:Union[m.Medication, m.NDC, m.RxCUI], target:str, planned:dict=None):
     """
-    Performs a crosswalk of an input medication's cui to another codeset
+    Performs a crosswalk of an input medication's cui to another codeset. For a LocalMed, which has no code of its own,
+    each of its codes (other than target) with a crosswalk to target is crosswalked and the answers are linked to that
+    code's object, shared by every LocalMed listing the code. Codes of a source without a crosswalk are skipped
     :param medObj: A Medication object or sub type to be crosswalked
     :param target: the target codeset to search for mappings to
-    :return: True if results, False if None
-    """
-    source = medObj.get_property('source')
-    crosswalk = get_crosswalk(source, target)
-    cross_r = crosswalk.run_crosswalk(medObj.cui) # hold results from the lookup of target code set
-    if cross_r:
-        smoresLog.debug('Crosswalk Results for {0} to {1}'.format(medObj.cui, target))
-        for _res in cross_r:
-            medObj.add_linked_cui(_res, target)
-            smoresLog.debug('{0}.{1}'.format(target, _res))
-        return True, _res
+    :param planned: answers from plan_code_lookup keyed by (source, code), codes found in it are not crosswalked again
+    :return: (True, list of every answer found) if results, (False, None) if None
+    """
+    if isinstance(medObj, m.LocalMed):
+        codes = []
+        for source, src_cuis in medObj.get_cui_all(omit=['PARENT', target], inc_obj=True).items():
+            for cui, cui_obj in src_cuis.items():
+                if planned is None or (source, str(cui)) not in planned.keys():
+                    try:
+                        get_crosswalk(source, target)
+                    except KeyError:
+                        smoresLog.debug('No crosswalk from {0} to {1}, {2} skipped'.format(source, target, cui))
+                        continue
+                codes.append((source, str(cui), cui_obj))
     else:
-        return False, None
+        codes = [(medObj.get_property('source'), str(medObj.cui), medObj)]
+
+    found = []
+    for source, cui, cui_obj in codes:
+        if planned is not None and (source, cui) in planned.keys():
+            cross_r = planned[(source, cui)]
+        else:
+            cross_r = get_crosswalk(source, target).run_crosswalk(cui) # hold results from the lookup of target code set
+        if cross_r:
+            smoresLog.debug('Crosswalk Results for {0} to {1}'.format(cui, target))
+            for _res in CUICrosswalk.get_answers(cross_r):
+                cui_obj.add_linked_cui(_res, target)
+                smoresLog.debug('{0}.{1}'.format(target, _res))
+                if _res not in found:
+                    found.append(_res)
+    return (True, found) if len(found) > 0 else (False, None)
 
 
 def get_rxn_lookup(medObj:Union[m.Medication, m.LocalMed, m.NDC]):
@@ -685,6 +825,241 @@ def load_session(session:str, SMOREs_version:str):
         return None
 
 
+def read_file_codes(input_file_path:Path):
+    """
+    Distinct codes of an input file, by code type, without building any medications
+    :return: dict{code type: list of codes}
+    """
+    config_i_keys = util.read_config_value('INFILE_KEYS')
+    i_code_key = config_i_keys['code_col_id']
+    i_code_type_key = config_i_keys['code_type_col_id']
+    codes = {}
+    with open(input_file_path, 'r') as file_handle:
+        reader = csv.DictReader(file_handle, delimiter=",", skipinitialspace=True)
+        for line in reader:
+            code, cui_type = line[i_code_key], line[i_code_type_key].upper()
+            cui_type = 'RXNORM' if cui_type == 'RXCUI' else cui_type
+            if len(code) > 0 and cui_type in util.OPTIONS_CUI_TYPES and util.validate_id(code, cui_type):
+                if cui_type not in codes.keys():
+                    codes[cui_type] = {}
+                # Insertion ordered dict as a set, keeps the file order with constant time lookups
+                codes[cui_type][code] = None
+    return {cui_type: list(type_codes.keys()) for cui_type, type_codes in codes.items()}
+
+
+def warm_cache(input_file:str, workers:int=None):
+    """
+    Fills the API caches with the lookups rxn_status, rxn_ing and rxn_remap will need for an input file, without loading
+    the file. Distinct NDC's are looked up in openFDA batches (RxNav NDC status when openFDA has no match). Their RxCUI's
+    and those in the file are looked up for status, ingredients and remaps, then the status of every ingredient and
+    remap target found. Requests run on [PROCESSING] WORKERS threads and are only limited by [API_RATE_LIMIT]. Sources
+    enabled under [LOCAL_SOURCES] are read through the same local release as the medication classes, and the RxCUI
+    lookups are skipped when RxNorm is local since nothing would read their cached responses
+    :param input_file: file in the load format, see load_file
+    :param workers: Number of concurrent lookups. Defaults to [PROCESSING] WORKERS in config.ini
+    :return: dict{lookup: number of codes} or False if the file could not be read
+    """
+    from smores.offline import LocalAPI
+    input_file_path = get_input_path(input_file)
+    try:
+        file_codes = read_file_codes(input_file_path)
+    except FileNotFoundError:
+        smores_error('#Cx001.1', input_file)
+        return False
+    except PermissionError:
+        smores_error('#Cx001.2', input_file)
+        return False
+    workers = get_worker_count() if workers is None else max(workers, 1)
+    # The APIs the medication classes use, i.e. the local release of a source when it is enabled
+    rxnav, rxndc, fda = m.RxCUI.api, m.NDC.api2, m.NDC.api
+    counts = {}
+
+    def run_lookups(codes:list, lookup, display:str):
+        found = []
+        pbar = tqdm(total=len(codes), desc=display, position=0)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in as_completed([executor.submit(lookup, _c) for _c in codes]):
+                found += future.result()
+                pbar.update(1)
+        pbar.close()
+        time.sleep(.01)
+        counts[display] = len(codes)
+        return found
+
+    def warm_ndc(ndc:str):
+        ndc_record = fda.get_ndc_record(ndc) if fda.is_available() else None
+        if ndc_record is None:
+            ndc_record = rxndc.get_ndc_record(ndc)
+        return ndc_record['rxcui'] if ndc_record is not None else []
+
+    def warm_rxcui(rxcui:str):
+        # Same lookups an RxCUI makes for rxn_status, rxn_ing and rxn_remap
+        status_payload = rxnav.get_status_payload(rxcui)
+        valid, status = rxnav.process_cui_status(rxcui, *status_payload)
+        linked = []
+        if not valid:
+            return linked
+        if status in ['ALIEN', 'UNKNOWN', 'RETIRED']:
+            history = rxnav.get_historical_info(rxcui, 'bossConcept')
+            linked += [_i['baseRxcui'] for _i in history if 'baseRxcui' in _i.keys()] if history else []
+        else:
+            ingredients = rxnav.get_rxcui_ingredients(rxcui)
+            linked += [_i['rxcui'] for _tty in ingredients.values() for _i in _tty] if ingredients else []
+        if status not in ['ACTIVE', 'RETIRED', 'ALIEN', 'UNKNOWN']:
+            linked += rxnav.process_remap_cuis(*status_payload)
+        return linked
+
+    def warm_status(rxcui:str):
+        rxnav.get_status_payload(rxcui)
+        return []
+
+    tic = time.time()
+    if 'NDC' in file_codes.keys():
+        fda.get_ndc_batch(file_codes['NDC'])
+        ndc_rxcuis = run_lookups(file_codes['NDC'], warm_ndc, 'NDC')
+    else:
+        ndc_rxcuis = []
+    rxcuis = list(dict.fromkeys((file_codes['RXNORM'] if 'RXNORM' in file_codes.keys() else []) + ndc_rxcuis))
+    if isinstance(rxnav, LocalAPI):
+        rxcuis = []
+        print('RxNorm lookups are read from the local release {0}, skipping them'.format(rxnav.get_release()))
+    linked = run_lookups(rxcuis, warm_rxcui, 'RXNORM') if len(rxcuis) > 0 else []
+    linked = [_c for _c in dict.fromkeys(linked) if _c not in rxcuis]
+    if len(linked) > 0:
+        run_lookups(linked, warm_status, 'RXNORM Linked')
+    print('Cache warm up of {0} completed in {1} seconds'.format(input_file, round(time.time() - tic, 2)))
+    for lookup, count in counts.items():
+        print('   {0} : {1} codes'.format(lookup, count))
+    return counts
+
+
+def get_snapshot_path(snapshot_file:str=None, must_exist:bool=False):
+    """ Cache snapshots are written to the /output folder unless a full path is given, and read from /output or /input """
+    if snapshot_file is None or len(snapshot_file) == 0:
+        base_file, ext = process_filename(None, 'cache', 'jsonl.gz')
+        return Path("..", 'output', base_file + '.' + ext).resolve()
+    elif ':\\' in snapshot_file or '/' in snapshot_file or '\\' in snapshot_file:
+        return Path(snapshot_file).resolve()
+    elif must_exist and not Path("..", 'output', snapshot_file).exists():
+        return Path("..", 'input', snapshot_file).resolve()
+    else:
+        return Path("..", 'output', snapshot_file).resolve()
+
+
+def export_cache(snapshot_file:str=None, apis:list=None):
+    """
+    Exports the API response caches into one compressed snapshot file that can be imported by another install
+    :param snapshot_file: file to write, defaults to /output/SMORES_cache_<time>.jsonl.gz
+    :param apis: APIs to export (e.g. ['RXNAV']), all by default
+    :return: manifest of the snapshot
+    """
+    from smores.utility.cache import export_snapshot
+    snapshot_path = get_snapshot_path(snapshot_file)
+    manifest = export_snapshot(snapshot_path, apis)
+    print('Cache snapshot written to {0}'.format(snapshot_path))
+    for api, counts in manifest['caches'].items():
+        print('   {0} : {1} responses, {2} unknown codes'.format(api, counts['responses'], counts['negatives']))
+    return manifest
+
+
+def import_cache(snapshot_file:str):
+    """
+    Merges a cache snapshot written by export_cache into the API response caches. Entries already cached from the same
+    or a later lookup are kept, so snapshots can be imported in any order and more than once
+    :return: dict{api: {'added': n, 'skipped': n}} or None if the snapshot could not be read
+    """
+    from smores.utility.cache import import_snapshot
+    snapshot_path = get_snapshot_path(snapshot_file, must_exist=True)
+    results = import_snapshot(snapshot_path)
+    if results is not None:
+        print('Cache snapshot {0} imported'.format(snapshot_path))
+        for api, counts in results.items():
+            print('   {0} : {1} entries added, {2} already cached'.format(api, counts['added'], counts['skipped']))
+    return results
+
+
+def get_cache_stats():
+    """
+    Entry counts, size and hit ratio of the response cache of each API with a cache file
+    :return: dict{api: ResponseCache.get_stats()}
+    """
+    from smores.utility.cache import ResponseCache
+    return {api: ResponseCache.get_cache(api).get_stats() for api in ResponseCache.get_namespaces()}
+
+
+def get_crosswalk_stats():
+    """ :return: CrosswalkStore.get_stats() of the persistent crosswalk store """
+    from smores.utility.cache import CrosswalkStore
+    return CrosswalkStore.get_store().get_stats()
+
+
+def compact_cache():
+    """
+    Deletes expired entries from every API response cache, enforces [API_CACHE] MAX_MB and rebuilds the cache files to
+    release the free space. The crosswalk store is rebuilt as well
+    :return: dict{api or CROSSWALKS: (file bytes before, file bytes after)}
+    """
+    from smores.utility.cache import ResponseCache, CrosswalkStore
+    results = {}
+    for api in ResponseCache.get_namespaces():
+        results[api] = ResponseCache.get_cache(api).compact()
+    results['CROSSWALKS'] = CrosswalkStore.get_store().compact()
+    for name, (before, after) in results.items():
+        print('   {0} : {1} MB -> {2} MB'.format(name, round(before / 1048576, 2), round(after / 1048576, 2)))
+    return results
+
+
+def refresh_crosswalks(workers:int=None):
+    """
+    Re-runs the crosswalk of every stale entry in the persistent crosswalk store ([API_CACHE] CROSSWALK_EXPIRE_AFTER),
+    oldest first. Entries that are still fresh are not looked up, entries whose lookup has no answer keep their old one
+    and are not looked up again until they are stale again
+    :param workers: Number of concurrent crosswalks. Defaults to [PROCESSING] WORKERS in config.ini
+    :return: dict{stale, refreshed, failed}
+    """
+    from smores.utility.cache import CrosswalkStore
+    store = CrosswalkStore.get_store()
+    stale = store.get_stale() if store.is_enabled() else []
+    counts = {'stale': len(stale), 'refreshed': 0, 'failed': 0}
+    if len(stale) == 0:
+        print('No stale crosswalk entries to refresh.')
+        return counts
+
+    def refresh(entry):
+        source, target, code = entry
+        try:
+            crosswalk = get_crosswalk(source, target)
+        except KeyError:
+            return False
+        return not CUICrosswalk.is_empty(crosswalk.refresh(code))
+
+    workers = get_worker_count() if workers is None else max(workers, 1)
+    tic = time.time()
+    pbar = tqdm(total=len(stale), desc='Crosswalk Refresh', position=0)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in as_completed([executor.submit(refresh, _e) for _e in stale]):
+            counts['refreshed' if future.result() else 'failed'] += 1
+            pbar.update(1)
+    pbar.close()
+    time.sleep(.01)
+    print('Refreshed {0} of {1} stale crosswalk entries in {2} seconds ({3} kept their previous answer)'.format(
+        counts['refreshed'], counts['stale'], round(time.time() - tic, 2), counts['failed']))
+    return counts
+
+
+def load_local_source(src:str, release_dir:str):
+    from smores.offline import import_local_source
+    print('Importing {0} release files from {1}. This may take several minutes...'.format(src, release_dir))
+    tic = time.time()
+    counts = import_local_source(src, release_dir)
+    if counts is not None:
+        print('Import completed in {0} seconds'.format(round(time.time() - tic, 2)))
+        for table, count in counts.items():
+            print('   {0} : {1} rows'.format(table, count))
+        print('Set {0} = TRUE under [LOCAL_SOURCES] in config.ini to use the local release.'.format(src.upper()))
+    return counts
+
+
 def get_cmd_requirements(cmd:str, input:list):
     _file = input[0]
     _opts = input[1]
@@ -688,6 +688,114 @@ Syntax: load [file_name]
         Cached queries to API's will not be saved as these results should be rebuilt every 48 hours due to code set fluctuations."""
         smores.save_session(self.__version__)
 
+    def do_api_stats(self, arg=None):
+        """Display connection pool statistics for each API that has been called during this session.
+        'reused' is the number of requests that were sent over an already open connection
+        'shared' is the number of lookups answered by an identical request that was already in flight
+        'circuit' is the state of each host's circuit breaker, OPEN hosts are failing fast until the reset time
+        'concurrency' is the adaptive limit on requests in flight to each host, with the latency of each endpoint"""
+        from smores.utility.sessions import SessionPool
+        from smores.utility.resilience import CircuitBreaker
+        from smores.utility.concurrency import AdaptiveLimit
+        from smores.api import SMORESapi
+        stats = SessionPool.get_stats()
+        if len(stats) == 0:
+            print('No API calls have been made during this session.')
+            return
+        for pool_id, hosts in stats.items():
+            print(console_colorize(pool_id, 'yellow'))
+            for host, host_stats in hosts.items():
+                print('   {0} : {1} requests over {2} connections ({3} reused, {4} idle)'.format(
+                    host, host_stats['requests'], host_stats['connections'], host_stats['reused'], host_stats['idle']))
+        print('{0} lookups shared an in-flight request'.format(SMORESapi.in_flight.get_stats()['shared']))
+        for host, breaker in CircuitBreaker.get_stats().items():
+            print('   {0} circuit : {1} ({2} trips, {3} requests failed fast)'.format(
+                host, breaker['state'], breaker['trips'], breaker['rejected']))
+        for host, limit in AdaptiveLimit.get_stats().items():
+            print('   {0} concurrency : {1} ({2} raises, {3} cuts)'.format(
+                host, limit['limit'], limit['increases'], limit['decreases']))
+            for endpoint, ep_stats in limit['endpoints'].items():
+                print('      {0} : {1} requests, {2} errors, {3} sec avg latency'.format(
+                    endpoint, ep_stats['requests'], ep_stats['errors'], ep_stats['latency']))
+
+    def do_warm(self, arg):
+        """Fill the API caches with the RxNorm status, ingredient and remap lookups for an input file without loading it,
+e.g. as an overnight job so that later rxn_status / rxn_ing / rxn_remap runs are answered from the cache
+Syntax: warm [file_name]
+    - [file_name] is a file in the load format. Files by default are expected to reside in this programs '/input'
+    folder. If located under a different path, it must be fully specified"""
+        if type(arg) is not str or len(arg.strip()) == 0:
+            print("Enter '? warm' for options in running this command")
+            return
+        smores.warm_cache(arg.strip())
+
+    def do_prefetch(self, arg):
+        """Same as warm
+Syntax: prefetch [file_name]"""
+        self.do_warm(arg)
+
+    def do_cache(self, arg):
+        """Manage the on-disk API response caches
+Syntax: cache [action] [file_name]
+    - export [file_name] : Write all API caches to one compressed snapshot file. [file_name] is optional, snapshots are
+      written to this programs '/output' folder unless a full path is given. Stored crosswalk answers are not part of
+      snapshots, they are looked up again from the imported API responses
+    - import [file_name] : Merge a snapshot into the API caches, e.g. one exported on a machine with internet access.
+      Entries already cached from the same or a later lookup are kept
+    - stats : Entries, size on disk and hit ratio of each API cache and of the stored crosswalk answers
+    - compact : Delete expired entries and shrink the cache files and the crosswalk store on disk
+    - refresh : Look up again only the stored crosswalk answers older than [API_CACHE] CROSSWALK_EXPIRE_AFTER"""
+        _args = arg.split(maxsplit=1) if type(arg) is str else []
+        action = _args[0].lower() if len(_args) > 0 else None
+        if action == 'stats':
+            stats = smores.get_cache_stats()
+            if len(stats) == 0:
+                print('No API responses have been cached.')
+            for api, api_stats in stats.items():
+                print(console_colorize(api, 'yellow'))
+                print('   {0} responses, {1} unknown codes, {2} MB of {3} MB ({4} MB on disk)'.format(
+                    sum(api_stats['entries'].values()), sum(api_stats['negatives'].values()),
+                    round(api_stats['bytes'] / 1048576, 2),
+                    round(api_stats['max_bytes'] / 1048576, 2) if api_stats['max_bytes'] > 0 else 'unlimited',
+                    round(api_stats['file_bytes'] / 1048576, 2)))
+                for endpoint, count in api_stats['entries'].items():
+                    print('      {0} : {1}'.format(endpoint, count))
+                print('   Session : {0} hits, {1} misses{2}, {3} evicted'.format(
+                    api_stats['hits'], api_stats['misses'],
+                    ' ({0}% hit ratio)'.format(round(api_stats['hit_ratio'] * 100, 1))
+                    if api_stats['hit_ratio'] is not None else '', api_stats['evicted']))
+            cross_stats = smores.get_crosswalk_stats()
+            if len(cross_stats['entries']) > 0:
+                print(console_colorize('CROSSWALKS', 'yellow'))
+                print('   {0} answers stored, {1} stale ({2} MB on disk)'.format(
+                    sum(cross_stats['entries'].values()), cross_stats['stale'],
+                    round(cross_stats['file_bytes'] / 1048576, 2)))
+                for crosswalk, count in cross_stats['entries'].items():
+                    print('      {0} : {1}'.format(crosswalk, count))
+                print('   Session : {0} hits, {1} misses'.format(cross_stats['hits'], cross_stats['misses']))
+        elif action == 'refresh':
+            smores.refresh_crosswalks()
+        elif action == 'compact':
+            smores.compact_cache()
+        elif action == 'export':
+            smores.export_cache(_args[1].strip() if len(_args) > 1 else None)
+        elif action == 'import' and len(_args) > 1:
+            smores.import_cache(_args[1].strip())
+        else:
+            print("Enter '? cache' for options in running this command")
+
+    def do_load_local(self, arg):
+        """Import a downloaded source release so that lookups can be answered locally without API calls
+Syntax: load_local [source] [release_directory]
+    - [source] RXNORM : RxNorm full release (RRF files)
+               FDA_NDC : FDA NDC directory (openFDA drug-ndc JSON or product.txt / package.txt)
+               UMLS : UMLS Metathesaurus (MRCONSO.RRF)"""
+        _args = arg.split(maxsplit=1) if type(arg) is str else []
+        if len(_args) != 2:
+            print("Enter '? load_local' for options in running this command")
+            return
+        smores.load_local_source(_args[0].upper(), _args[1].strip())
+
     def do_errors(self, arg):
         if len(self.errors) == 0:
             print("There are currently no errors to display.")
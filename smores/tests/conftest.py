@@ -0,0 +1,34 @@
+import pytest
+# SMOREs Internal Imports
+from smores.crosswalk import CUICrosswalk, CrosswalkPlanner
+from smores.utility import util
+from smores.utility.cache import CrosswalkStore, ResponseCache
+
+
+@pytest.fixture
+def crosswalk_store(tmp_path, monkeypatch):
+    """ A CrosswalkStore in a temporary directory, used as the shared store for the test """
+    store = CrosswalkStore(tmp_path.joinpath('crosswalk.sqlite'))
+    monkeypatch.setattr(CrosswalkStore, 'store', store)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def crosswalks(monkeypatch, crosswalk_store):
+    """ An empty crosswalk registry, so the planner only sees the crosswalks registered by the test """
+    monkeypatch.setattr(CUICrosswalk, 'CROSSWALKS', {})
+    CrosswalkPlanner.clear()
+    yield CUICrosswalk.CROSSWALKS
+    CrosswalkPlanner.clear()
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """ Directory of the API response caches for the test, replacing smores/cache """
+    _get_util_base = util.get_util_base
+    monkeypatch.setattr(util, 'get_util_base', lambda type: tmp_path if type == 'cache' else _get_util_base(type))
+    monkeypatch.setattr(ResponseCache, 'caches', {})
+    yield tmp_path
+    for cache in ResponseCache.caches.values():
+        cache.close()
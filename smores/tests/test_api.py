@@ -0,0 +1,31 @@
+import asyncio
+import threading
+import pytest
+# SMOREs Internal Imports
+from smores import api
+
+
+@pytest.mark.skipif(api.aiohttp is None, reason='aiohttp is not installed')
+def test_async_cache_lookups_run_off_the_event_loop(cache_dir, monkeypatch):
+    rxnav = api.RXNAV()
+    rxnav.get_cache().release_checked = True
+    threads = {}
+
+    def get_cached(call_type, api_call, payload_str):
+        threads['cached'] = threading.get_ident()
+        return None
+
+    def get_negative(call_type, api_call, payload_str):
+        threads['negative'] = threading.get_ident()
+        return {'rxcuiStatus': {'status': 'UNKNOWN'}}, 'https://smores.test/rxcui/1'
+
+    monkeypatch.setattr(rxnav, 'get_cached', get_cached)
+    monkeypatch.setattr(rxnav, 'get_negative', get_negative)
+
+    async def lookup():
+        threads['loop'] = threading.get_ident()
+        async with api.RXNAVAsync(rxnav) as client:
+            return await client.call_api('STATUS', '1')
+
+    assert asyncio.run(lookup())[0] is True
+    assert threads['cached'] != threads['loop'] and threads['negative'] != threads['loop']
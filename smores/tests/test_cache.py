@@ -0,0 +1,275 @@
+import gzip
+import json
+import time
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+# SMOREs Internal Imports
+from smores.utility.cache import ResponseCache, MemoryLRU, BloomFilter, SNAPSHOT_FORMAT, export_snapshot, \
+    import_snapshot
+
+
+def write_snapshot(path, manifest: dict, entries: list):
+    with gzip.open(str(path), 'wt', encoding='utf-8') as snapshot:
+        snapshot.write(json.dumps(manifest) + '\n')
+        for entry in entries:
+            snapshot.write(json.dumps(entry) + '\n')
+
+
+def snapshot_entry(cache, key, created=None):
+    return {'cache': cache, 'table': 'responses', 'key': key, 'endpoint': 'STATUS', 'url': 'https://smores.test/' + key,
+            'data': json.dumps({'key': key}), 'created': time.time() if created is None else created, 'version': None}
+
+
+def reopen_caches(monkeypatch, cache_dir):
+    """ Closes the open caches and deletes their files, as on an install that never cached anything """
+    for cache in ResponseCache.caches.values():
+        cache.close()
+    monkeypatch.setattr(ResponseCache, 'caches', {})
+    for _f in cache_dir.glob('*_cache.sqlite*'):
+        _f.unlink()
+
+
+def test_snapshot_round_trip(cache_dir, tmp_path, monkeypatch):
+    cache = ResponseCache.get_cache('RXNAV')
+    cache.set('STATUS', 'k1', 'https://smores.test/k1', {'status': 'Active'})
+    cache.set_negative('STATUS', 'k2', 'https://smores.test/k2', {'status': 'UNKNOWN'})
+    manifest = export_snapshot(tmp_path.joinpath('snapshot.jsonl.gz'))
+    assert manifest['caches'] == {'RXNAV': {'responses': 1, 'negatives': 1}}
+
+    reopen_caches(monkeypatch, cache_dir)
+    assert import_snapshot(tmp_path.joinpath('snapshot.jsonl.gz')) == {'RXNAV': {'added': 2, 'skipped': 0}}
+    cache = ResponseCache.get_cache('RXNAV')
+    assert cache.get('STATUS', 'k1') == ({'status': 'Active'}, 'https://smores.test/k1')
+    assert cache.get_negative('STATUS', 'k2') == ({'status': 'UNKNOWN'}, 'https://smores.test/k2')
+    # Importing again only finds entries that are already cached
+    assert import_snapshot(tmp_path.joinpath('snapshot.jsonl.gz')) == {'RXNAV': {'added': 0, 'skipped': 2}}
+
+
+def test_snapshot_keeps_newer_entries(cache_dir, tmp_path):
+    cache = ResponseCache.get_cache('RXNAV')
+    cache.set('STATUS', 'k1', 'https://smores.test/local', {'status': 'Active'})
+    write_snapshot(tmp_path.joinpath('old.jsonl.gz'), {'format': SNAPSHOT_FORMAT, 'version': 1, 'caches': {}},
+                   [snapshot_entry('RXNAV', 'k1', created=time.time() - 3600)])
+    assert import_snapshot(tmp_path.joinpath('old.jsonl.gz')) == {'RXNAV': {'added': 0, 'skipped': 1}}
+    assert cache.get('STATUS', 'k1')[1] == 'https://smores.test/local'
+
+
+def test_snapshot_without_created_imports(cache_dir, tmp_path):
+    write_snapshot(tmp_path.joinpath('snapshot.jsonl.gz'), {'format': SNAPSHOT_FORMAT, 'version': 1},
+                   [snapshot_entry('UMLS', 'k1')])
+    assert import_snapshot(tmp_path.joinpath('snapshot.jsonl.gz')) == {'UMLS': {'added': 1, 'skipped': 0}}
+
+
+@pytest.mark.parametrize('namespace', ['../../escaped', 'NOT_AN_API', 'rxnav'])
+def test_snapshot_rejects_unknown_cache(cache_dir, tmp_path, namespace):
+    manifest = {'format': SNAPSHOT_FORMAT, 'version': 1, 'caches': {namespace: {}}}
+    write_snapshot(tmp_path.joinpath('manifest.jsonl.gz'), manifest, [snapshot_entry(namespace, 'k1')])
+    assert import_snapshot(tmp_path.joinpath('manifest.jsonl.gz')) is None
+
+    # Named only by an entry, not the manifest
+    write_snapshot(tmp_path.joinpath('entry.jsonl.gz'), {'format': SNAPSHOT_FORMAT, 'version': 1, 'caches': {}},
+                   [snapshot_entry(namespace, 'k1')])
+    assert import_snapshot(tmp_path.joinpath('entry.jsonl.gz')) is None
+    assert namespace not in ResponseCache.caches.keys()
+    assert list(cache_dir.parent.rglob('*escaped*')) == []
+
+
+def test_snapshot_import_enforces_max_size(cache_dir, tmp_path):
+    cache = ResponseCache.get_cache('UMLS')
+    cache.max_bytes = 256 * 1024
+    entries = [dict(snapshot_entry('UMLS', 'k{0}'.format(_i)), data=json.dumps({'pad': 'x' * 2000}))
+               for _i in range(500)]
+    write_snapshot(tmp_path.joinpath('big.jsonl.gz'), {'format': SNAPSHOT_FORMAT, 'version': 1, 'caches': {}}, entries)
+    assert import_snapshot(tmp_path.joinpath('big.jsonl.gz')) == {'UMLS': {'added': 500, 'skipped': 0}}
+    assert cache.get_size() <= cache.max_bytes
+    assert cache.evicted > 0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ Moves time.time() forward by clock.advance(seconds) """
+    class Clock:
+        offset = 0.0
+
+        def advance(self, seconds):
+            self.offset += seconds
+    _clock, _time = Clock(), time.time
+    monkeypatch.setattr(time, 'time', lambda: _time() + _clock.offset)
+    return _clock
+
+
+def get_cache(namespace='RXNAV', mode='TTL', expire_hours=1.0, negative_hours=1.0, memory_entries=100):
+    cache = ResponseCache.get_cache(namespace)
+    cache.mode = mode
+    cache.expiry['STATUS'] = expire_hours * 3600
+    cache.negative_expiry['STATUS'] = negative_hours * 3600
+    cache.memory_entries = memory_entries
+    return cache
+
+
+@pytest.mark.parametrize('memory_entries', [0, 100])
+def test_ttl_expiry(cache_dir, clock, memory_entries):
+    cache = get_cache(expire_hours=1, negative_hours=2, memory_entries=memory_entries)
+    cache.set('STATUS', 'k1', 'u1', {'status': 'Active'})
+    cache.set_negative('STATUS', 'k2', 'u2')
+    clock.advance(1800)
+    assert cache.get('STATUS', 'k1') == ({'status': 'Active'}, 'u1')
+    clock.advance(3600)
+    assert cache.get('STATUS', 'k1') is None
+    assert cache.get_negative('STATUS', 'k2') == (None, 'u2')
+    clock.advance(3600)
+    assert cache.get_negative('STATUS', 'k2') is None
+
+
+def test_release_expiry(cache_dir, clock):
+    cache = get_cache(mode='RELEASE', expire_hours=1, negative_hours=1)
+    cache.set_release('2024-01')
+    cache.set('STATUS', 'k1', 'u1', {'status': 'Active'})
+    cache.set_negative('STATUS', 'k2', 'u2')
+    clock.advance(7200)
+    # Responses outlive their TTL while the release is current, unknown codes still expire
+    assert cache.get('STATUS', 'k1') == ({'status': 'Active'}, 'u1')
+    assert cache.get_negative('STATUS', 'k2') is None
+    cache.set_negative('STATUS', 'k3', 'u3')
+    cache.set_release('2024-02')
+    assert cache.get('STATUS', 'k1') is None
+    assert cache.get_negative('STATUS', 'k3') is None
+
+
+def test_release_mode_without_release_uses_ttl(cache_dir, clock):
+    cache = get_cache(mode='RELEASE', expire_hours=1)
+    cache.set_release(None)
+    cache.set('STATUS', 'k1', 'u1', {'status': 'Active'})
+    clock.advance(7200)
+    assert cache.get('STATUS', 'k1') is None
+
+
+def test_purge_expired(cache_dir, clock):
+    cache = get_cache(expire_hours=1, negative_hours=1)
+    cache.set('STATUS', 'old', 'u', {})
+    cache.set_negative('STATUS', 'old_negative', 'u')
+    clock.advance(7200)
+    cache.set('STATUS', 'new', 'u', {})
+    assert cache.purge_expired() == 2
+    assert [_r['key'] for _r in cache.iter_rows('responses')] == ['new']
+    assert cache.count_rows('negatives') == 0
+
+
+def test_memory_lru_evicts_least_recently_used():
+    memory = MemoryLRU(max_entries=3, max_bytes=0)
+    for key in ['a', 'b', 'c']:
+        memory.set(key, (key,), 1)
+    memory.get('a')
+    memory.set('d', ('d',), 1)
+    assert list(memory.entries.keys()) == ['c', 'a', 'd']
+
+
+def test_memory_lru_size_limit():
+    memory = MemoryLRU(max_entries=100, max_bytes=10)
+    memory.set('a', ('a',), 4)
+    memory.set('b', ('b',), 4)
+    memory.set('c', ('c',), 4)
+    assert list(memory.entries.keys()) == ['b', 'c'] and memory.size == 8
+    memory.set('b', ('b',), 2)
+    assert memory.size == 6
+    # An entry larger than the limit is still kept on its own
+    memory.set('d', ('d',), 50)
+    assert list(memory.entries.keys()) == ['d'] and memory.size == 50
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(100)
+    keys = ['code{0}'.format(_i) for _i in range(1000)]  # Ten times its capacity
+    for key in keys:
+        bloom.add(key)
+    assert all(bloom.might_contain(_k) for _k in keys)
+    bloom.clear()
+    assert not bloom.might_contain('code1')
+
+
+def test_bloom_filter_error_rate():
+    bloom = BloomFilter(1000)
+    for _i in range(1000):
+        bloom.add('known{0}'.format(_i))
+    false_positives = sum(bloom.might_contain('unknown{0}'.format(_i)) for _i in range(10000))
+    assert false_positives < 300
+
+
+def test_negatives_are_found_after_reopening(cache_dir, monkeypatch):
+    cache = get_cache()
+    cache.set_negative('STATUS', 'k1', 'u1')
+    assert cache.get('STATUS', 'k1') is None
+    cache.close()
+    monkeypatch.setattr(ResponseCache, 'caches', {})
+    cache = get_cache()
+    assert cache.bloom.might_contain('k1')
+    assert cache.get_negative('STATUS', 'k1') == (None, 'u1')
+    assert cache.get_negative('STATUS', 'k2') is None
+
+
+def test_response_replaces_negative(cache_dir):
+    cache = get_cache()
+    cache.set_negative('STATUS', 'k1', 'u1')
+    cache.set('STATUS', 'k1', 'u1', {'status': 'Active'})
+    # The Bloom filter still holds the key, the negatives table decides
+    assert cache.get_negative('STATUS', 'k1') is None
+    assert cache.get('STATUS', 'k1')[0] == {'status': 'Active'}
+
+
+def test_eviction_keeps_recently_used(cache_dir, clock):
+    cache = get_cache(expire_hours=100, memory_entries=0)
+    cache.max_bytes = 0
+    for _i in range(200):
+        cache.set('STATUS', 'k{0}'.format(_i), 'u', {'pad': 'x' * 2000})
+        clock.advance(1)
+    recent = ['k{0}'.format(_i) for _i in range(20)]
+    for key in recent:
+        assert cache.get('STATUS', key) is not None
+    cache.max_bytes = cache.get_size() // 2
+    evicted = cache.enforce_size()
+    assert evicted > 0 and cache.get_size() <= cache.max_bytes
+    kept = set(_r['key'] for _r in cache.iter_rows('responses'))
+    assert set(recent) <= kept
+    # The oldest responses that were not read again went first
+    assert 'k20' not in kept and 'k199' in kept
+
+
+def test_access_times_are_written_in_read_only_sessions(cache_dir, monkeypatch):
+    cache = get_cache(memory_entries=0)
+    cache.set('STATUS', 'k1', 'u1', {})
+    cache.close()
+    monkeypatch.setattr(ResponseCache, 'caches', {})
+    monkeypatch.setattr(ResponseCache, 'access_flush_entries', 1)
+    cache = get_cache(memory_entries=0)
+    cache.get('STATUS', 'k1')
+    reader = sqlite3.connect(str(cache.path))
+    assert reader.execute('SELECT last_access FROM responses WHERE key = ?', ('k1',)).fetchone()[0] is not None
+    reader.close()
+
+
+def test_compact_releases_space(cache_dir, clock):
+    cache = get_cache(expire_hours=1, memory_entries=0)
+    for _i in range(200):
+        cache.set('STATUS', 'k{0}'.format(_i), 'u', {'pad': 'x' * 2000})
+    clock.advance(7200)
+    cache.set('STATUS', 'fresh', 'u', {})
+    before, after = cache.compact()
+    assert after < before
+    assert [_r['key'] for _r in cache.iter_rows('responses')] == ['fresh']
+
+
+def test_concurrent_hits_are_counted_and_recorded(cache_dir, monkeypatch):
+    monkeypatch.setattr(ResponseCache, 'access_flush_entries', 7)
+    cache = get_cache(memory_entries=0)
+    keys = ['k{0}'.format(_i) for _i in range(50)]
+    for key in keys:
+        cache.set('STATUS', key, 'u', {})
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda key: cache.get('STATUS', key), keys * 20))
+    assert cache.hits == len(keys) * 20
+    with cache._lock:
+        cache.flush_access()
+        cache._conn.commit()
+        unread = cache._conn.execute('SELECT COUNT(*) FROM responses WHERE last_access IS NULL').fetchone()[0]
+    assert unread == 0
@@ -0,0 +1,110 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+# SMOREs Internal Imports
+from smores.utility.concurrency import KeyedLock, AdaptiveLimit, ADAPTIVE_DEFAULTS
+
+
+def test_keyed_lock_serializes_a_key():
+    locks, running, peak, guard = KeyedLock(), [0], [0], threading.Lock()
+
+    def work(key):
+        with locks.get(key):
+            with guard:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.005)
+            with guard:
+                running[0] -= 1
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(work, ['same'] * 40))
+    assert peak[0] == 1
+
+
+def test_keyed_lock_runs_keys_in_parallel():
+    locks, barrier = KeyedLock(), threading.Barrier(2, timeout=2)
+
+    def work(key):
+        with locks.get(key):
+            barrier.wait()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(work, ['a', 'b']))
+
+
+def test_keyed_lock_is_reentrant_and_released():
+    locks = KeyedLock()
+    with locks.get(('RXNORM', '1')):
+        with locks.get(('RXNORM', '1')):
+            assert len(locks) == 1
+    assert len(locks) == 0
+
+
+def test_keyed_lock_drops_unused_locks():
+    locks = KeyedLock()
+
+    def work(code):
+        with locks.get(('NDC', str(code % 50))):
+            time.sleep(0.0005)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(work, range(1000)))
+    assert len(locks) == 0
+
+
+def get_limit(initial_limit):
+    conf = dict(ADAPTIVE_DEFAULTS, initial_limit=initial_limit, max_limit=initial_limit)
+    return AdaptiveLimit('limit.smores.test', conf)
+
+
+def test_async_waiters_are_woken_by_release():
+    limit, running, peak = get_limit(2), [0], [0]
+
+    async def request():
+        await limit.acquire_async()
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.005)
+        running[0] -= 1
+        limit.release('TEST', 0.005, True)
+
+    async def main():
+        await asyncio.wait_for(asyncio.gather(*[request() for _ in range(30)]), timeout=5)
+
+    asyncio.run(main())
+    assert peak[0] == 2
+    assert limit.in_flight == 0 and len(limit._async_waiters) == 0
+
+
+def test_async_waiter_is_woken_from_a_thread():
+    limit = get_limit(1)
+    limit.acquire()
+
+    async def main():
+        waiter = asyncio.ensure_future(limit.acquire_async())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        threading.Thread(target=limit.release, args=('TEST', 0.01, True)).start()
+        await asyncio.wait_for(waiter, timeout=2)
+
+    asyncio.run(main())
+    assert limit.in_flight == 1
+
+
+def test_cancelled_async_waiter_passes_its_wake_up_on():
+    limit = get_limit(1)
+    limit.acquire()
+
+    async def main():
+        first = asyncio.ensure_future(limit.acquire_async())
+        second = asyncio.ensure_future(limit.acquire_async())
+        await asyncio.sleep(0.01)
+        limit.release('TEST', 0.01, True)
+        first.cancel()
+        await asyncio.wait_for(second, timeout=2)
+        assert first.cancelled()
+
+    asyncio.run(main())
+    assert limit.in_flight == 1 and len(limit._async_waiters) == 0
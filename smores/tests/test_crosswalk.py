@@ -0,0 +1,261 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+# SMOREs Internal Imports
+import smores.processes as processes
+from smores.crosswalk import CUICrosswalk, CrosswalkChain, CrosswalkPlanner, get_crosswalk
+from smores.utility.ratelimit import RateLimiter, TokenBucket
+
+
+class StubStep:
+    """ Workflow step answering from a dict and recording every code it is asked for """
+    def __init__(self, answers: dict):
+        self.answers = answers
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, code):
+        with self._lock:
+            self.calls.append(code)
+        return self.answers.get(code)
+
+
+def add_crosswalk(start, end, answers: dict, run_seconds: float = None):
+    """ Registers a crosswalk with one stub step, with an observed average run time when run_seconds is given """
+    step = StubStep(answers)
+    crosswalk = CUICrosswalk(start, end)
+    crosswalk.add_step(step)
+    if run_seconds is not None:
+        crosswalk.lookups, crosswalk.runs, crosswalk.run_seconds = 1, 1, run_seconds
+    return crosswalk, step
+
+
+def get_route(source, target):
+    return CrosswalkPlanner.get_plan(source, target).get_route()
+
+
+def test_registered_crosswalk_is_not_planned(crosswalks):
+    direct, _ = add_crosswalk('A', 'C', {})
+    add_crosswalk('A', 'B', {})
+    add_crosswalk('B', 'C', {})
+    assert get_crosswalk('A', 'C') is direct
+
+
+def test_cheapest_path_is_chosen(crosswalks):
+    add_crosswalk('A', 'B', {}, 0.1)
+    add_crosswalk('B', 'C', {}, 0.1)
+    add_crosswalk('A', 'D', {}, 0.5)
+    add_crosswalk('D', 'C', {}, 0.5)
+    assert get_route('A', 'C') == 'A > B > C'
+    cost, hops = CrosswalkPlanner.find_path('A', 'C')
+    assert [_h.end for _h in hops] == ['B', 'C']
+    assert cost == pytest.approx(2 * (CUICrosswalk.hop_cost + 0.1))
+
+
+def test_shorter_path_wins_a_tie(crosswalks):
+    add_crosswalk('A', 'B', {}, 0.2)
+    add_crosswalk('B', 'C', {}, 0.2)
+    add_crosswalk('A', 'D', {}, 0.2)
+    add_crosswalk('D', 'E', {}, 0.1)
+    add_crosswalk('E', 'C', {}, 0.1)
+    assert get_route('A', 'C') == 'A > B > C'
+
+
+def test_no_path_raises_key_error(crosswalks):
+    add_crosswalk('A', 'B', {})
+    with pytest.raises(KeyError):
+        get_crosswalk('B', 'A')
+
+
+def test_internal_crosswalks_are_not_edges(crosswalks):
+    add_crosswalk('A', 'B', {}, 0.1)
+    helper, _ = add_crosswalk('B', 'C', {}, 0.1)
+    add_crosswalk('A', 'D', {}, 0.5)
+    add_crosswalk('D', 'C', {}, 0.5)
+    outer = CUICrosswalk('X', 'Y')
+    outer.add_step(helper, None)
+    assert helper.internal and not outer.internal
+    assert get_route('A', 'C') == 'A > D > C'
+
+
+def test_crosswalk_without_workflow_is_not_an_edge(crosswalks):
+    add_crosswalk('A', 'B', {}, 0.1)
+    CUICrosswalk('B', 'C')
+    assert CrosswalkPlanner.get_plan('A', 'C') is None
+
+
+def test_plan_follows_costs_after_ttl(crosswalks, monkeypatch):
+    add_crosswalk('A', 'B', {}, 0.1)
+    slow, _ = add_crosswalk('B', 'C', {}, 0.1)
+    add_crosswalk('A', 'D', {}, 0.5)
+    add_crosswalk('D', 'C', {}, 0.5)
+    assert get_route('A', 'C') == 'A > B > C'
+
+    slow.run_seconds = 10.0
+    assert get_route('A', 'C') == 'A > B > C'  # Kept until the plan expires
+    monkeypatch.setattr(CrosswalkPlanner, 'plan_ttl', -1.0)
+    assert get_route('A', 'C') == 'A > D > C'
+
+
+def test_adding_a_step_clears_plans(crosswalks):
+    add_crosswalk('A', 'B', {})
+    direct = CUICrosswalk('B', 'C')
+    assert CrosswalkPlanner.get_plan('A', 'C') is None
+    direct.add_step(StubStep({}))
+    assert get_route('A', 'C') == 'A > B > C'
+
+
+def test_cost_of_untried_crosswalk(crosswalks):
+    crosswalk, _ = add_crosswalk('A', 'B', {})
+    assert crosswalk.get_cost() == pytest.approx(CUICrosswalk.hop_cost + CUICrosswalk.default_run_seconds)
+
+
+def test_cost_weighs_store_misses(crosswalks):
+    crosswalk, _ = add_crosswalk('A', 'B', {})
+    crosswalk.lookups, crosswalk.store_hits, crosswalk.runs, crosswalk.run_seconds = 4, 1, 3, 1.5
+    # 3 of 4 lookups ran the workflow, averaging 0.5 seconds
+    assert crosswalk.get_cost() == pytest.approx(CUICrosswalk.hop_cost + 0.75 * 0.5)
+
+
+class StubAPI:
+    api_url = 'https://quota.smores.test/api'
+
+    def lookup(self, code):
+        return None
+
+
+def test_quota_cost(crosswalks, monkeypatch):
+    monkeypatch.setitem(RateLimiter.limiters, 'quota.smores.test', TokenBucket(4))
+    crosswalk = CUICrosswalk('A', 'B')
+    crosswalk.add_step(StubAPI().lookup, None)
+    crosswalk.add_step(StubAPI().lookup)
+    crosswalk.lookups, crosswalk.runs, crosswalk.run_seconds = 2, 2, 1.0
+    # Only the first step is counted when SEQUENTIAL, every alternative step when HEDGED
+    assert crosswalk.get_quota_cost() == pytest.approx(0.25)
+    assert crosswalk.get_cost() == pytest.approx(CUICrosswalk.hop_cost + 0.5 + 0.25)
+    crosswalk.set_mode('HEDGED')
+    assert crosswalk.get_quota_cost() == pytest.approx(0.5)
+
+
+def test_chain_runs_each_hop_once_per_unique_code(crosswalks):
+    _, first = add_crosswalk('A', 'B', {'1': ['b1', 'shared'], '2': ['b2', 'shared'], '3': []})
+    _, second = add_crosswalk('B', 'C', {'b1': ['c1'], 'shared': [{'cui': 'cs', 'name': 'S'}], 'b2': None})
+    chain = get_crosswalk('A', 'C')
+    assert isinstance(chain, CrosswalkChain)
+
+    answers = chain.run_batch(['1', '2', '1', '3'], workers=4)
+    assert answers == {'1': ['c1', {'cui': 'cs', 'name': 'S'}], '2': [{'cui': 'cs', 'name': 'S'}], '3': None}
+    assert sorted(first.calls) == ['1', '2', '3']
+    assert sorted(second.calls) == ['b1', 'b2', 'shared']
+
+
+def test_chain_answers_are_stored_per_hop(crosswalks, crosswalk_store):
+    _, first = add_crosswalk('A', 'B', {'1': ['b1']})
+    _, second = add_crosswalk('B', 'C', {'b1': ['c1']})
+    chain = get_crosswalk('A', 'C')
+    assert chain.run_crosswalk('1') == ['c1']
+    assert chain.run_crosswalk('1') == ['c1']
+    assert first.calls == ['1'] and second.calls == ['b1']
+    assert crosswalk_store.get('B', 'C', 'b1')['result'] == ['c1']
+
+
+def test_plan_code_lookup_batches_unique_codes(crosswalks, monkeypatch):
+    _, first = add_crosswalk('RXNORM', 'ZZ_MID', {'1': ['m1'], '2': ['m1']})
+    _, second = add_crosswalk('ZZ_MID', 'ZZ_TARGET', {'m1': ['t1']})
+    unique_codes = {('RXNORM', '1'): None, ('RXNORM', '2'): None}
+    monkeypatch.setattr(processes, 'get_unique_codes',
+                        lambda kits, sources: {_k: _v for _k, _v in unique_codes.items() if _k[0] in sources})
+
+    planned = processes.plan_code_lookup([], 'ZZ_TARGET')
+    assert planned == {('RXNORM', '1'): ['t1'], ('RXNORM', '2'): ['t1']}
+    assert sorted(first.calls) == ['1', '2']
+    assert second.calls == ['m1']
+
+
+@pytest.fixture
+def hedge_threads(monkeypatch):
+    """ A hedge pool of two threads for the test """
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='crosswalk-hedge-test')
+    monkeypatch.setattr(CUICrosswalk, 'hedge_executor', executor)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def add_hedged_crosswalk(start, end, *steps, merge='FIRST'):
+    crosswalk = CUICrosswalk(start, end)
+    for step in steps[:-1]:
+        crosswalk.add_step(step, None)
+    crosswalk.add_step(steps[-1])
+    crosswalk.set_mode('HEDGED', merge, 0)
+    return crosswalk
+
+
+def sleeper(seconds, answer):
+    def step(code):
+        time.sleep(seconds)
+        return answer
+    return step
+
+
+def test_hedged_first_returns_fastest_answer(crosswalks, hedge_threads):
+    crosswalk = add_hedged_crosswalk('A', 'B', sleeper(0.5, ['slow']), sleeper(0.01, ['fast']))
+    tic = time.monotonic()
+    assert crosswalk.run_workflow('1')[0] == ['fast']
+    assert time.monotonic() - tic < 0.4
+
+
+def test_hedged_union_merges_answers(crosswalks, hedge_threads):
+    crosswalk = add_hedged_crosswalk('A', 'B', sleeper(0.05, ['a', 'b']), sleeper(0.01, ['b', 'c']), merge='UNION')
+    assert crosswalk.run_workflow('1')[0] == ['a', 'b', 'c']
+
+
+def test_chained_workflow_is_not_hedged(crosswalks, hedge_threads):
+    crosswalk = CUICrosswalk('A', 'B')
+    crosswalk.add_step(lambda code: code + 'x', 'never')
+    crosswalk.add_step(lambda code: [code + 'y'])
+    crosswalk.set_mode('HEDGED')
+    assert not crosswalk.is_hedged()
+    assert crosswalk.run_workflow('1')[0] == '1x'
+
+
+def test_hedges_are_bounded_and_not_nested(crosswalks, hedge_threads):
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def counted(code):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return [code]
+
+    inner = add_hedged_crosswalk('A1', 'B1', counted, counted)
+    outer = add_hedged_crosswalk('A', 'B', inner, counted, merge='UNION')
+    with ThreadPoolExecutor(max_workers=8) as callers:
+        answers = list(callers.map(lambda code: outer.run_workflow(code)[0], [str(_i) for _i in range(8)]))
+    assert answers == [[str(_i)] for _i in range(8)]
+    assert peak[0] <= 2
+
+
+def failing(error):
+    def step(code):
+        raise error
+    return step
+
+
+def test_failed_step_is_reported_as_no_answer(crosswalks, hedge_threads, caplog, capsys):
+    crosswalk = add_hedged_crosswalk('A', 'B', failing(ValueError('bad response')), sleeper(0.05, ['b']),
+                                     merge='UNION')
+    with caplog.at_level('ERROR'):
+        assert crosswalk.run_workflow('1') == (['b'], 'step')
+    assert any('#Ax000.10' in _r.getMessage() and 'bad response' in _r.getMessage() for _r in caplog.records)
+    assert capsys.readouterr().out == ''
+
+
+def test_unexpected_step_error_is_raised(crosswalks):
+    crosswalk = CUICrosswalk('A', 'B')
+    crosswalk.add_step(failing(RuntimeError('bug')))
+    with pytest.raises(RuntimeError):
+        crosswalk.run_workflow('1')
@@ -0,0 +1,68 @@
+import pytest
+# SMOREs Internal Imports
+import smores.processes as processes
+import smores.medication as m
+from smores.offline import LocalAPI
+
+
+class StubFDA:
+    """ Stand-in for openFDA answering NDC records from a dict and recording the NDC's it is asked for """
+    def __init__(self, records: dict):
+        self.records = records
+        self.calls = []
+
+    def is_available(self):
+        return True
+
+    def get_ndc_batch(self, ndcs):
+        self.calls += list(ndcs)
+
+    def get_ndc_record(self, ndc):
+        self.calls.append(ndc)
+        return self.records.get(ndc)
+
+
+class StubRXNAV:
+    """ Stand-in for RxNav recording the RxCUI's it is asked for """
+    def __init__(self):
+        self.calls = []
+
+    def get_status_payload(self, rxcui):
+        self.calls.append(rxcui)
+        return 'ACTIVE', None
+
+    def process_cui_status(self, rxcui, status, payload):
+        return True, status
+
+    def get_rxcui_ingredients(self, rxcui):
+        return {}
+
+
+class StubLocalRXNAV(LocalAPI, StubRXNAV):
+    def get_release(self):
+        return 'TEST'
+
+
+@pytest.fixture
+def input_file(tmp_path):
+    path = tmp_path.joinpath('warm.csv')
+    path.write_text('LOCAL_ID,LOCAL_NAME,CODE,CODE_TYPE,CODE_NAME\n'
+                    '1,A,0002-3227-30,NDC,A\n'
+                    '2,B,197361,RXNORM,B\n')
+    return str(path)
+
+
+@pytest.mark.parametrize('local_rxnorm', [False, True])
+def test_warm_cache_uses_the_medication_apis(input_file, monkeypatch, local_rxnorm):
+    fda, rxndc = StubFDA({'0002-3227-30': {'rxcui': ['1']}}), StubFDA({})
+    rxnav = StubLocalRXNAV() if local_rxnorm else StubRXNAV()
+    monkeypatch.setattr(m.NDC, 'api', fda)
+    monkeypatch.setattr(m.NDC, 'api2', rxndc)
+    monkeypatch.setattr(m.RxCUI, 'api', rxnav)
+
+    counts = processes.warm_cache(input_file, workers=2)
+    assert '0002-3227-30' in fda.calls and rxndc.calls == []
+    if local_rxnorm:
+        assert rxnav.calls == [] and 'RXNORM' not in counts
+    else:
+        assert sorted(rxnav.calls) == ['1', '197361'] and counts['RXNORM'] == 2
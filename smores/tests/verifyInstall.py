@@ -20,7 +20,7 @@ _p = sys.path
 reqs = subprocess.check_output([sys.executable, '-m', 'pip', 'freeze'])
 installed_packages = [r.decode().split('==')[0] for r in reqs.split()]
 controlled_failure = 'muhnamena [Expected Failure - Should Not Be Found]'
-required_packages = ['PyYAML','tqdm','requests','requests-cache','python-dateutil','pandas','numpy', controlled_failure]
+required_packages = ['PyYAML','tqdm','requests','python-dateutil','pandas','numpy', controlled_failure]
 
 error_log_path = os.path.join(_c, 'logs', 'install.log')
 logging.basicConfig(filename=error_log_path,
@@ -1,4 +1,6 @@
 import requests
+import queue
+import threading
 from datetime import datetime, timedelta
 from typing import Union
 import logging
@@ -6,6 +8,7 @@ from lxml.html import fromstring
 
 from smores.utility.errors import smores_error
 from smores.utility import util
+from smores.utility.sessions import SessionPool
 
 
 '''Retrieves Ticket Granting Ticket for the user (must be replaced every 8 hours but can be used multiple for 
@@ -13,9 +16,14 @@ multiple API requests) '''
 
 APIlog = logging.getLogger(__name__)
 
+# Only one thread requests a new Ticket Granting Ticket at a time
+_tgt_lock = threading.Lock()
+
+
 class Authenticate:
     e_class = '#A'
     e_subclass = 'x004'
+    pool_id = 'UMLS_AUTH'
 
     def __init__(self, authuri:str, authendpoint:Union[str, dict], authkey=None, authuser=None, authpwd=None):
         self.auth_param = {}
@@ -41,8 +49,13 @@ class Authenticate:
     def get_auth_ticket(self):
         if self.auth_ticket is not None and datetime.now() < self.auth_ticket_expire:
             return self.auth_ticket
+        with _tgt_lock:
+            if self.auth_ticket is not None and datetime.now() < self.auth_ticket_expire:
+                return self.auth_ticket
+            return self.request_auth_ticket()
 
-        elif self.auth_method:
+    def request_auth_ticket(self):
+        if self.auth_method:
             if self.auth_method == 'apikey':
                 params = {'apikey': self.auth_param['apikey']}
             else:
@@ -50,7 +63,8 @@ class Authenticate:
 
             h = {"Content-type": "application/x-www-form-urlencoded", "Accept": "text/plain", "User-Agent": "python"}
             try:
-                r = requests.post(self.auth_uri+self.auth_endpoint, data=params, headers=h)
+                r = SessionPool.get_session(Authenticate.pool_id).post(self.auth_uri+self.auth_endpoint, data=params,
+                                                                       headers=h)
                 response = fromstring(r.text)
                 tgt = response.xpath('//form/@action')[0]
                 if tgt is not None:
@@ -65,12 +79,26 @@ class Authenticate:
         else:
             return False
 
+    def get_pool_key(self, service:str):
+        return self.auth_uri, self.auth_method, self.auth_param.get(self.auth_method), service
+
     def get_service_ticket(self, service:str):
+        """ Single use service ticket for a request, taken from the ticket pool when one is configured """
+        if ServiceTicketPool.get_pool_size() > 0:
+            return ServiceTicketPool.get_pool(self, service).get_ticket()
+        return self.request_service_ticket(service)
+
+    def request_service_ticket(self, service:str):
         tgt = self.get_auth_ticket()
+        if not tgt:
+            return False
         params = {'service': service}
         h = {"Content-type": "application/x-www-form-urlencoded", "Accept": "text/plain", "User-Agent": "python"}
         try:
-            r = requests.post(tgt, data=params, headers=h)
+            r = SessionPool.get_session(Authenticate.pool_id).post(tgt, data=params, headers=h)
+            if not r.ok:
+                APIlog.warning('Service ticket request failed : %s %s', r.status_code, r.reason)
+                return False
             st = r.text
             return st
         except (requests.ConnectionError, requests.Timeout) as e:
@@ -78,3 +106,97 @@ class Authenticate:
             return False
         except:
             return False
+
+
+class ServiceTicketPool:
+    """
+    Keeps a supply of UMLS service tickets minted ahead of demand by a background thread, using the cached Ticket
+    Granting Ticket. Service tickets are single use and expire after 5 minutes, so tickets older than st_expire are
+    discarded. Callers that find the pool empty mint their own ticket, so a lookup never waits on the refill thread
+    """
+    pools = {}
+    _lock = threading.Lock()
+    st_expire = timedelta(minutes=4)
+    idle_wait = 60
+    pool_size = None
+
+    def __init__(self, auth_client: Authenticate, service: str, size: int):
+        self.auth_client = auth_client
+        self.service = service
+        self.size = size
+        self.tickets = queue.Queue()
+        self.minted = 0
+        self.issued = 0
+        self.misses = 0
+        self._wake = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def get_pool_size():
+        """ Number of service tickets kept ready from [API_POOL] UMLS_TICKET_POOL, 0 disables the pool """
+        if ServiceTicketPool.pool_size is None:
+            ServiceTicketPool.pool_size = max(util.read_config_option('API_POOL', 'UMLS_TICKET_POOL', 10), 0)
+        return ServiceTicketPool.pool_size
+
+    @staticmethod
+    def get_pool(auth_client: Authenticate, service: str):
+        key = auth_client.get_pool_key(service)
+        pool = ServiceTicketPool.pools.get(key)
+        if pool is None:
+            with ServiceTicketPool._lock:
+                pool = ServiceTicketPool.pools.get(key)
+                if pool is None:
+                    pool = ServiceTicketPool(auth_client, service, ServiceTicketPool.get_pool_size())
+                    ServiceTicketPool.pools[key] = pool
+        return pool
+
+    def get_ticket(self):
+        while True:
+            try:
+                ticket, minted = self.tickets.get_nowait()
+            except queue.Empty:
+                break
+            if datetime.now() - minted < ServiceTicketPool.st_expire:
+                self.issued += 1
+                self.refill()
+                return ticket
+        self.misses += 1
+        self.refill()
+        return self.auth_client.request_service_ticket(self.service)
+
+    def refill(self):
+        if self._thread is None or not self._thread.is_alive():
+            with ServiceTicketPool._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self.run, name='umls-ticket-pool', daemon=True)
+                    self._thread.start()
+        self._wake.set()
+
+    def discard_expired(self):
+        fresh = []
+        while True:
+            try:
+                _t = self.tickets.get_nowait()
+            except queue.Empty:
+                break
+            if datetime.now() - _t[1] < ServiceTicketPool.st_expire:
+                fresh.append(_t)
+        for _t in fresh:
+            self.tickets.put(_t)
+
+    def run(self):
+        while True:
+            self._wake.clear()
+            self.discard_expired()
+            while self.tickets.qsize() < self.size:
+                ticket = self.auth_client.request_service_ticket(self.service)
+                if not ticket:
+                    break
+                self.tickets.put((ticket, datetime.now()))
+                self.minted += 1
+            if not self._wake.wait(timeout=ServiceTicketPool.idle_wait):
+                # No tickets were taken for a while, stop minting until the next request
+                return
+
+    def get_stats(self):
+        return {'ready': self.tickets.qsize(), 'minted': self.minted, 'issued': self.issued, 'misses': self.misses}
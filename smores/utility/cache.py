@@ -0,0 +1,781 @@
+import atexit
+import sqlite3
+import threading
+import time
+import json
+import gzip
+import math
+import hashlib
+import logging
+from datetime import datetime
+from collections import OrderedDict
+# SMOREs Internal Imports
+from smores.utility import util
+from smores.utility.errors import smores_error
+
+'''On-disk cache of API responses. Each API (namespace) has its own sqlite file in smores/cache and every endpoint of
+that API can be given its own expiry under [API_CACHE] in config.ini '''
+
+APIlog = logging.getLogger(__name__)
+
+CACHE_DEFAULTS = {
+    'expire_after': 48.0,  # Hours a cached response is valid for. 0 disables caching
+    'mode': 'TTL',  # TTL: entries expire after expire_after. RELEASE: entries are valid until the source data changes
+    'memory_entries': 10000,  # Parsed responses kept in memory per endpoint. 0 disables the in-memory cache
+    'memory_mb': 64.0,  # Approximate size limit of the in-memory responses of an endpoint. 0 for no size limit
+    'negative_expire_after': 24.0,  # Hours a code the API reported as unknown / not found is remembered. 0 disables
+    'negative_bloom_entries': 100000,  # Expected number of unknown codes per API, sizes the Bloom filter
+    'max_mb': 512.0,  # Max size of the cache file of an API, least recently used responses are evicted past it. 0 disables
+    'crosswalk_expire_after': 720.0  # Hours a stored crosswalk answer is used before it is looked up again. 0 disables
+}
+
+# Cache snapshots (export_snapshot / import_snapshot) are gzipped JSON lines, a manifest line then one line per entry
+SNAPSHOT_FORMAT = 'smores-cache-snapshot'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_TABLES = ['responses', 'negatives']
+SNAPSHOT_COLUMNS = ['key', 'endpoint', 'url', 'data', 'created', 'version']
+# APIs with a response cache (their pool ids), the only caches a snapshot may write to
+CACHE_NAMESPACES = ['RXNAV', 'RXNDC', 'OPENFDA', 'OPENFDA_DEVICE', 'UMLS']
+
+# Request parameters that change between calls for the same lookup and are left out of the cache key
+CACHE_KEY_IGNORE = ['ticket', 'api_key']
+
+
+class MemoryLRU:
+    """ Bounded in-memory LRU of parsed responses. Entries are evicted least recently used first once either the entry
+        count or the approximate size (length of the response JSON) goes over its limit """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key: str):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: tuple, size: int):
+        self.pop(key)
+        self.entries[key] = entry + (size,)
+        self.size += size
+        while len(self.entries) > self.max_entries or (0 < self.max_bytes < self.size and len(self.entries) > 1):
+            _, _evicted = self.entries.popitem(last=False)
+            self.size -= _evicted[-1]
+
+    def pop(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[-1]
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+class BloomFilter:
+    """ Probabilistic set of keys. might_contain() is never wrong for keys that were added, and is wrong about keys that
+        were not added at most error_rate of the time while holding up to capacity keys """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(capacity, 1)
+        self.bits = max(int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.bits / self.capacity * math.log(2))), 1)
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def get_positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key: str):
+        for _pos in self.get_positions(key):
+            self.array[_pos >> 3] |= 1 << (_pos & 7)
+        self.count += 1
+
+    def might_contain(self, key: str) -> bool:
+        return all(self.array[_pos >> 3] & (1 << (_pos & 7)) for _pos in self.get_positions(key))
+
+    def clear(self):
+        self.array = bytearray(len(self.array))
+        self.count = 0
+
+
+class ResponseCache:
+    caches = {}
+    _lock = threading.Lock()
+    size_check_interval = 100  # Responses stored between checks of the cache size
+    access_flush_entries = 1000  # Access times held in memory before they are written to the cache file
+    access_flush_seconds = 60.0  # Max seconds access times are held in memory before they are written
+    evict_batch_size = 500
+
+    def __init__(self, namespace: str, path=None):
+        self.namespace = namespace.upper()
+        self.path = path if path is not None else \
+            util.get_util_base('cache').joinpath('{0}_cache.sqlite'.format(namespace.lower()))
+        self.expiry = {}
+        self.negative_expiry = {}
+        self.mode = None
+        self.release = None
+        self.release_checked = False
+        self.hits = 0
+        self.misses = 0
+        self.memory = {}
+        self.memory_hits = 0
+        self.memory_misses = 0
+        self.negative_hits = 0
+        self.bloom_skips = 0
+        self.evicted = 0
+        self._accessed = {}
+        self._accessed_flushed = time.monotonic()
+        self._sets_since_check = 0
+        _max_mb = util.read_config_option('API_CACHE', 'max_mb', CACHE_DEFAULTS['max_mb'])
+        self.max_bytes = int(max(util.read_config_option('API_CACHE', '{0}_max_mb'.format(self.namespace), _max_mb),
+                                 0.0) * 1024 * 1024)
+        self.bloom = BloomFilter(util.read_config_option('API_CACHE', 'negative_bloom_entries',
+                                                         CACHE_DEFAULTS['negative_bloom_entries']))
+        self.memory_entries = max(util.read_config_option('API_CACHE', 'memory_entries',
+                                                          CACHE_DEFAULTS['memory_entries']), 0)
+        self.memory_bytes = int(max(util.read_config_option('API_CACHE', 'memory_mb', CACHE_DEFAULTS['memory_mb']),
+                                    0.0) * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._memory_lock = threading.Lock()
+        self._stats_lock = threading.Lock()  # Session counters and access times, taken after _lock, never before it
+        self._release_lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS responses ('
+                               'key TEXT PRIMARY KEY, endpoint TEXT, url TEXT, data TEXT, created REAL, version TEXT)')
+            _columns = [_c[1] for _c in self._conn.execute('PRAGMA table_info(responses)').fetchall()]
+            if 'version' not in _columns:
+                self._conn.execute('ALTER TABLE responses ADD COLUMN version TEXT')
+            if 'last_access' not in _columns:
+                self._conn.execute('ALTER TABLE responses ADD COLUMN last_access REAL')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS responses_lru ON responses (COALESCE(last_access, created))')
+            # Lookups of codes the API reported as unknown / not found. data is NULL when the API answered with an error
+            self._conn.execute('CREATE TABLE IF NOT EXISTS negatives ('
+                               'key TEXT PRIMARY KEY, endpoint TEXT, url TEXT, data TEXT, created REAL, version TEXT)')
+            self._conn.commit()
+            for _key in self._conn.execute('SELECT key FROM negatives'):
+                self.bloom.add(_key[0])
+
+    @staticmethod
+    def get_cache(namespace: str):
+        """ Returns the shared cache for an API, opening it on first use. Safe to call from multiple threads """
+        cache = ResponseCache.caches.get(namespace)
+        if cache is None:
+            with ResponseCache._lock:
+                cache = ResponseCache.caches.get(namespace)
+                if cache is None:
+                    cache = ResponseCache(namespace)
+                    ResponseCache.caches[namespace] = cache
+        return cache
+
+    @staticmethod
+    def get_namespaces():
+        """ APIs that have a cache file in smores/cache """
+        return sorted(_f.name[:-len('_cache.sqlite')].upper()
+                      for _f in util.get_util_base('cache').glob('*_cache.sqlite'))
+
+    @staticmethod
+    def flush_all():
+        """ Writes the pending access times of every open cache, registered to run when the interpreter exits """
+        for cache in list(ResponseCache.caches.values()):
+            try:
+                with cache._lock:
+                    cache.flush_access()
+                    cache._conn.commit()
+            except sqlite3.Error as e:
+                APIlog.debug('Access times of %s could not be written : %s', cache.namespace, e)
+
+    @staticmethod
+    def make_key(api_call: str, payload_str: str):
+        """ Cache key of a request: its url and sorted query parameters, without tickets or API keys """
+        params = sorted(_p for _p in payload_str.split('&')
+                        if len(_p) > 0 and _p.split('=', 1)[0] not in CACHE_KEY_IGNORE)
+        return api_call + ('?' + '&'.join(params) if len(params) > 0 else '')
+
+    def get_expire_after(self, endpoint: str) -> float:
+        """
+        Expiry in seconds for an endpoint, read from [API_CACHE]. Checked in order: <API>_<ENDPOINT>, <API>, EXPIRE_AFTER
+        e.g. RXNAV_HISTORY = 168
+        """
+        expire = self.expiry.get(endpoint)
+        if expire is None:
+            _val = util.read_config_option('API_CACHE', 'expire_after', CACHE_DEFAULTS['expire_after'])
+            _val = util.read_config_option('API_CACHE', self.namespace, _val)
+            _val = util.read_config_option('API_CACHE', '{0}_{1}'.format(self.namespace, endpoint), _val)
+            expire = max(_val, 0.0) * 3600
+            self.expiry[endpoint] = expire
+        return expire
+
+    def get_negative_expire_after(self, endpoint: str) -> float:
+        """
+        Expiry in seconds of unknown / not found lookups for an endpoint, read from [API_CACHE]. Checked in order:
+        <API>_<ENDPOINT>_NEGATIVE, <API>_NEGATIVE, NEGATIVE_EXPIRE_AFTER
+        """
+        expire = self.negative_expiry.get(endpoint)
+        if expire is None:
+            _val = util.read_config_option('API_CACHE', 'negative_expire_after', CACHE_DEFAULTS['negative_expire_after'])
+            _val = util.read_config_option('API_CACHE', '{0}_negative'.format(self.namespace), _val)
+            _val = util.read_config_option('API_CACHE', '{0}_{1}_negative'.format(self.namespace, endpoint), _val)
+            expire = max(_val, 0.0) * 3600
+            self.negative_expiry[endpoint] = expire
+        return expire
+
+    def get_mode(self) -> str:
+        """ Invalidation mode of this cache from [API_CACHE] <API>_MODE, either TTL or RELEASE """
+        if self.mode is None:
+            _val = util.read_config_option('API_CACHE', '{0}_mode'.format(self.namespace), CACHE_DEFAULTS['mode'])
+            self.mode = _val.upper() if _val.upper() in ['TTL', 'RELEASE'] else CACHE_DEFAULTS['mode']
+        return self.mode
+
+    def needs_release(self) -> bool:
+        return self.get_mode() == 'RELEASE' and not self.release_checked
+
+    def set_release(self, release):
+        """
+        Sets the release of the source data for this session. Entries fetched under another release are treated as
+        expired. If the release could not be determined (None) the cache falls back to its TTL expiry
+        """
+        self.release = str(release) if release is not None else None
+        self.release_checked = True
+        APIlog.info('%s cache release : %s', self.namespace, self.release)
+
+    def check_release(self, get_release):
+        """ In RELEASE mode, looks up the current release once per session with get_release() """
+        if self.needs_release():
+            with self._release_lock:
+                if self.needs_release():
+                    self.set_release(get_release())
+
+    def is_valid(self, endpoint: str, created: float, version, negative: bool = False):
+        """
+        In RELEASE mode a response is valid while the release it was cached under is current, otherwise for the
+        endpoint's expiry. Unknown codes (negative) always expire after NEGATIVE_EXPIRE_AFTER as well, in either mode
+        """
+        if self.get_mode() == 'RELEASE' and self.release is not None:
+            if version != self.release:
+                return False
+            if not negative:
+                return True
+        expire_after = self.get_negative_expire_after(endpoint) if negative else self.get_expire_after(endpoint)
+        return time.time() - created <= expire_after
+
+    def get_memory(self, endpoint: str) -> MemoryLRU:
+        """ In-memory LRU of an endpoint, only use while holding _memory_lock """
+        memory = self.memory.get(endpoint)
+        if memory is None:
+            memory = MemoryLRU(self.memory_entries, self.memory_bytes)
+            self.memory[endpoint] = memory
+        return memory
+
+    def set_memory(self, endpoint: str, key: str, data, url: str, created: float, version, size: int):
+        if self.memory_entries > 0:
+            with self._memory_lock:
+                self.get_memory(endpoint).set(key, (data, url, created, version), size)
+
+    def get(self, endpoint: str, key: str):
+        """
+        Looks up a response in memory first, then on disk
+        :return: (json data, url) of a cached response or None if it is not cached or has expired
+        """
+        if self.get_expire_after(endpoint) <= 0:
+            return None
+        if self.memory_entries > 0:
+            with self._memory_lock:
+                entry = self.get_memory(endpoint).get(key)
+            if entry is not None and self.is_valid(endpoint, entry[2], entry[3]):
+                self.record_access(key, memory_hit=True)
+                return entry[0], entry[1]
+            with self._stats_lock:
+                self.memory_misses += 1
+
+        with self._lock:
+            row = self._conn.execute('SELECT data, url, created, version FROM responses WHERE key = ?',
+                                     (key,)).fetchone()
+        if row is None or not self.is_valid(endpoint, row[2], row[3]):
+            with self._stats_lock:
+                self.misses += 1
+            return None
+        self.record_access(key)
+        data = json.loads(row[0])
+        self.set_memory(endpoint, key, data, row[1], row[2], row[3], len(row[0]))
+        return data, row[1]
+
+    def set(self, endpoint: str, key: str, url: str, data):
+        if self.get_expire_after(endpoint) <= 0:
+            return
+        try:
+            _data = json.dumps(data)
+        except (TypeError, ValueError) as e:
+            APIlog.debug('Response for %s could not be cached : %s', url, e)
+            return
+        created = time.time()
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO responses (key, endpoint, url, data, created, version) '
+                               'VALUES (?, ?, ?, ?, ?, ?)', (key, endpoint, url, _data, created, self.release))
+            # A lookup that now has an answer is no longer an unknown code
+            self._conn.execute('DELETE FROM negatives WHERE key = ?', (key,))
+            self.flush_access()
+            self._conn.commit()
+            self._sets_since_check += 1
+            check_size = self.max_bytes > 0 and self._sets_since_check >= ResponseCache.size_check_interval
+            if check_size:
+                self._sets_since_check = 0
+        self.set_memory(endpoint, key, data, url, created, self.release, len(_data))
+        if check_size:
+            self.enforce_size()
+
+    def record_access(self, key: str, memory_hit: bool = False):
+        """
+        Counts a cache hit and notes it for least recently used eviction. Access times are written in bulk once
+        access_flush_entries have been held or access_flush_seconds have passed, so that read-only sessions keep the
+        order on disk current
+        """
+        with self._stats_lock:
+            self.hits += 1
+            if memory_hit:
+                self.memory_hits += 1
+            self._accessed[key] = time.time()
+            flush = len(self._accessed) >= ResponseCache.access_flush_entries or \
+                time.monotonic() - self._accessed_flushed >= ResponseCache.access_flush_seconds
+        if flush:
+            with self._lock:
+                self.flush_access()
+                self._conn.commit()
+
+    def flush_access(self):
+        """ Writes the last access time of responses read since the last flush, only call while holding _lock """
+        with self._stats_lock:
+            self._accessed_flushed = time.monotonic()
+            accessed, self._accessed = self._accessed, {}
+        if len(accessed) > 0:
+            self._conn.executemany('UPDATE responses SET last_access = ? WHERE key = ?',
+                                   [(_t, _k) for _k, _t in list(accessed.items())])
+
+    def get_size(self) -> int:
+        """ Bytes used by cached entries, excluding free pages that a compaction would release """
+        with self._lock:
+            pages, free_pages, page_size = [self._conn.execute('PRAGMA {0}'.format(_p)).fetchone()[0]
+                                            for _p in ['page_count', 'freelist_count', 'page_size']]
+        return (pages - free_pages) * page_size
+
+    def get_file_size(self) -> int:
+        """ Bytes of the cache file and its write-ahead log on disk """
+        return sum(_f.stat().st_size for _f in [self.path, self.path.with_name(self.path.name + '-wal')]
+                   if _f.exists())
+
+    def purge_expired(self):
+        """ Deletes the responses and unknown codes that are no longer valid
+        :return: number of entries deleted """
+        purged = 0
+        with self._lock:
+            self.flush_access()
+            for table, get_expire in [('responses', self.get_expire_after),
+                                      ('negatives', self.get_negative_expire_after)]:
+                if self.get_mode() == 'RELEASE' and self.release is not None:
+                    purged += self._conn.execute('DELETE FROM {0} WHERE version IS NOT ?'.format(table),
+                                                 (self.release,)).rowcount
+                    if table == 'responses':
+                        continue
+                endpoints = [_e[0] for _e in self._conn.execute('SELECT DISTINCT endpoint FROM {0}'.format(table))]
+                for endpoint in endpoints:
+                    purged += self._conn.execute('DELETE FROM {0} WHERE endpoint = ? AND created < ?'.format(table),
+                                                 (endpoint, time.time() - get_expire(endpoint))).rowcount
+            self._conn.commit()
+        if purged > 0:
+            with self._memory_lock:
+                self.memory = {}
+        return purged
+
+    def enforce_size(self):
+        """
+        Keeps the cache under its max size ([API_CACHE] MAX_MB or <API>_MAX_MB). Once over it, expired entries are
+        deleted first, then the least recently used responses until the cache is back under 90% of the max size.
+        Freed pages are reused by new entries, compact() returns them to the file system
+        :return: number of responses evicted
+        """
+        if self.max_bytes <= 0 or self.get_size() <= self.max_bytes:
+            return 0
+        self.purge_expired()
+        evicted = 0
+        target = self.max_bytes * 0.9
+        while True:
+            size = self.get_size()
+            if size <= target:
+                break
+            with self._lock:
+                self.flush_access()
+                count = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+                # Enough of the least recently used responses to get under the target at the average response size
+                batch = min(int((size - target) / (size / max(count, 1))) + 1, ResponseCache.evict_batch_size)
+                keys = [_r[0] for _r in self._conn.execute(
+                    'SELECT key FROM responses ORDER BY COALESCE(last_access, created) LIMIT ?', (batch,)).fetchall()]
+                if len(keys) == 0:
+                    break
+                self._conn.executemany('DELETE FROM responses WHERE key = ?', [(_k,) for _k in keys])
+                self._conn.commit()
+            with self._memory_lock:
+                for memory in self.memory.values():
+                    for _k in keys:
+                        memory.pop(_k)
+            evicted += len(keys)
+        with self._stats_lock:
+            self.evicted += evicted
+        APIlog.info('%s cache over %s bytes, evicted %s least recently used responses', self.namespace,
+                    self.max_bytes, evicted)
+        return evicted
+
+    def compact(self):
+        """
+        Deletes expired entries, enforces the max size and rebuilds the cache file to release free space
+        :return: (file bytes before, file bytes after)
+        """
+        before = self.get_file_size()
+        self.purge_expired()
+        self.enforce_size()
+        with self._lock:
+            self._conn.commit()
+            self._conn.execute('VACUUM')
+            self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return before, self.get_file_size()
+
+    def get_negative(self, endpoint: str, key: str):
+        """
+        Checks if a lookup is a known unknown / not found code. The Bloom filter answers most lookups without a query
+        :return: (json data or None if the API answered with an error, url) or None if the lookup is not known to fail
+        """
+        if self.get_negative_expire_after(endpoint) <= 0:
+            return None
+        if not self.bloom.might_contain(key):
+            with self._stats_lock:
+                self.bloom_skips += 1
+            return None
+        with self._lock:
+            row = self._conn.execute('SELECT data, url, created, version FROM negatives WHERE key = ?',
+                                     (key,)).fetchone()
+        if row is None or not self.is_valid(endpoint, row[2], row[3], negative=True):
+            return None
+        with self._stats_lock:
+            self.negative_hits += 1
+        return json.loads(row[0]) if row[0] is not None else None, row[1]
+
+    def set_negative(self, endpoint: str, key: str, url: str, data=None):
+        if self.get_negative_expire_after(endpoint) <= 0:
+            return
+        _data = json.dumps(data) if data is not None else None
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO negatives (key, endpoint, url, data, created, version) '
+                               'VALUES (?, ?, ?, ?, ?, ?)', (key, endpoint, url, _data, time.time(), self.release))
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._conn.commit()
+        with self._memory_lock:
+            for memory in self.memory.values():
+                memory.pop(key)
+        self.bloom.add(key)
+
+    def count_rows(self, table: str) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM {0}'.format(table)).fetchone()[0]
+
+    def iter_rows(self, table: str, batch_size: int = 5000):
+        """ Yields the entries of a cache table (responses or negatives) as dicts of SNAPSHOT_COLUMNS """
+        last_key = ''
+        while True:
+            with self._lock:
+                rows = self._conn.execute('SELECT {0} FROM {1} WHERE key > ? ORDER BY key LIMIT ?'.format(
+                    ', '.join(SNAPSHOT_COLUMNS), table), (last_key, batch_size)).fetchall()
+            for row in rows:
+                yield dict(zip(SNAPSHOT_COLUMNS, row))
+            if len(rows) < batch_size:
+                break
+            last_key = rows[-1][0]
+
+    def merge_rows(self, table: str, rows):
+        """
+        Merges entries from another cache into this one. An entry is only added if it is newer than what is cached for
+        the same request, in either table, so merging the same or overlapping entries again changes nothing
+        :param table: responses or negatives
+        :param rows: iterable of dicts of SNAPSHOT_COLUMNS
+        :return: (entries added, entries skipped)
+        """
+        other = 'negatives' if table == 'responses' else 'responses'
+        added, skipped = 0, 0
+        with self._lock:
+            for row in rows:
+                newest = [_r[0] for _t in [table, other] for _r in self._conn.execute(
+                    'SELECT created FROM {0} WHERE key = ?'.format(_t), (row['key'],)).fetchall()]
+                if len(newest) > 0 and max(newest) >= row['created']:
+                    skipped += 1
+                    continue
+                self._conn.execute('INSERT OR REPLACE INTO {0} ({1}) VALUES (?, ?, ?, ?, ?, ?)'.format(
+                    table, ', '.join(SNAPSHOT_COLUMNS)), [row[_c] for _c in SNAPSHOT_COLUMNS])
+                self._conn.execute('DELETE FROM {0} WHERE key = ?'.format(other), (row['key'],))
+                if table == 'negatives':
+                    self.bloom.add(row['key'])
+                added += 1
+            self._conn.commit()
+        with self._memory_lock:
+            self.memory = {}
+        return added, skipped
+
+    def delete(self, key: str):
+        with self._memory_lock:
+            for memory in self.memory.values():
+                memory.pop(key)
+        with self._lock:
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._conn.execute('DELETE FROM negatives WHERE key = ?', (key,))
+            self._conn.commit()
+
+    def clear(self, endpoint: str = None):
+        with self._memory_lock:
+            if endpoint is None:
+                self.memory = {}
+            elif endpoint in self.memory.keys():
+                self.memory[endpoint].clear()
+        with self._lock:
+            if endpoint is None:
+                self._conn.execute('DELETE FROM responses')
+                self._conn.execute('DELETE FROM negatives')
+                self.bloom.clear()
+            else:
+                self._conn.execute('DELETE FROM responses WHERE endpoint = ?', (endpoint,))
+                self._conn.execute('DELETE FROM negatives WHERE endpoint = ?', (endpoint,))
+            self._conn.commit()
+
+    def get_stats(self):
+        with self._lock:
+            self.flush_access()
+            self._conn.commit()
+            rows = self._conn.execute('SELECT endpoint, COUNT(*) FROM responses GROUP BY endpoint').fetchall()
+            negatives = self._conn.execute('SELECT endpoint, COUNT(*) FROM negatives GROUP BY endpoint').fetchall()
+        with self._memory_lock:
+            memory = {_e: len(_m.entries) for _e, _m in self.memory.items()}
+        return {'entries': {_e: _c for _e, _c in rows}, 'hits': self.hits, 'misses': self.misses,
+                'memory_entries': memory, 'memory_hits': self.memory_hits, 'memory_misses': self.memory_misses,
+                'negatives': {_e: _c for _e, _c in negatives}, 'negative_hits': self.negative_hits,
+                'bloom_skips': self.bloom_skips,
+                'hit_ratio': self.hits / (self.hits + self.misses) if self.hits + self.misses > 0 else None,
+                'bytes': self.get_size(), 'file_bytes': self.get_file_size(), 'max_bytes': self.max_bytes,
+                'evicted': self.evicted,
+                'mode': self.get_mode(), 'release': self.release}
+
+    def close(self):
+        with self._lock:
+            self.flush_access()
+            self._conn.commit()
+            self._conn.close()
+
+
+class CrosswalkStore:
+    """ Answers of the code set crosswalks (e.g. NDC to RXNORM) keyed by source code set, target code set and code,
+        with when and from which API each was fetched. Kept in smores/cache/crosswalk.sqlite and read by CUICrosswalk
+        before any API is asked. Entries older than [API_CACHE] CROSSWALK_EXPIRE_AFTER are stale and looked up again.
+        The store is separate from the API response caches and is not part of cache snapshots, an imported snapshot
+        answers its crosswalks again from the cached API responses """
+    store = None
+    _lock = threading.Lock()
+
+    def __init__(self, path=None):
+        self.path = path if path is not None else util.get_util_base('cache').joinpath('crosswalk.sqlite')
+        self.expire_after = max(util.read_config_option('API_CACHE', 'crosswalk_expire_after',
+                                                        CACHE_DEFAULTS['crosswalk_expire_after']), 0.0) * 3600
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS crosswalks (source TEXT, target TEXT, code TEXT, '
+                               'result TEXT, api TEXT, fetched_at REAL, PRIMARY KEY (source, target, code))')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS crosswalks_fetched ON crosswalks (fetched_at)')
+            self._conn.commit()
+
+    @staticmethod
+    def get_store():
+        """ Returns the shared crosswalk store, opening it on first use. Safe to call from multiple threads """
+        if CrosswalkStore.store is None:
+            with CrosswalkStore._lock:
+                if CrosswalkStore.store is None:
+                    CrosswalkStore.store = CrosswalkStore()
+        return CrosswalkStore.store
+
+    def is_enabled(self) -> bool:
+        return self.expire_after > 0
+
+    def get(self, source: str, target: str, code: str):
+        """
+        :return: dict{result, api, fetched_at, stale} or None if the code has not been crosswalked
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT result, api, fetched_at FROM crosswalks '
+                                     'WHERE source = ? AND target = ? AND code = ?', (source, target, code)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            stale = time.time() - row[2] > self.expire_after
+            if stale:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return {'result': json.loads(row[0]), 'api': row[1], 'fetched_at': row[2], 'stale': stale}
+
+    def set(self, source: str, target: str, code: str, result, api: str):
+        try:
+            _result = json.dumps(result)
+        except (TypeError, ValueError) as e:
+            APIlog.debug('Crosswalk of %s from %s to %s could not be stored : %s', code, source, target, e)
+            return
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO crosswalks (source, target, code, result, api, fetched_at) '
+                               'VALUES (?, ?, ?, ?, ?, ?)', (source, target, code, _result, api, time.time()))
+            self._conn.commit()
+
+    def touch(self, source: str, target: str, code: str) -> bool:
+        """
+        Marks a stored answer as refreshed without changing it, for a refresh that found no answer
+        :return: False if the code has no stored answer
+        """
+        with self._lock:
+            touched = self._conn.execute('UPDATE crosswalks SET fetched_at = ? WHERE source = ? AND target = ? '
+                                         'AND code = ?', (time.time(), source, target, code)).rowcount
+            self._conn.commit()
+        return touched > 0
+
+    def get_stale(self):
+        """ :return: list of (source, target, code) of the entries past their expiry, oldest first """
+        with self._lock:
+            return self._conn.execute('SELECT source, target, code FROM crosswalks WHERE fetched_at < ? '
+                                      'ORDER BY fetched_at', (time.time() - self.expire_after,)).fetchall()
+
+    def get_stats(self):
+        """ :return: dict{entries{source > target: count}, stale, hits, misses, file_bytes} """
+        with self._lock:
+            rows = self._conn.execute('SELECT source, target, COUNT(*) FROM crosswalks '
+                                      'GROUP BY source, target').fetchall()
+            stale = self._conn.execute('SELECT COUNT(*) FROM crosswalks WHERE fetched_at < ?',
+                                       (time.time() - self.expire_after,)).fetchone()[0]
+        return {'entries': {'{0} > {1}'.format(_s, _t): _c for _s, _t, _c in rows}, 'stale': stale,
+                'hits': self.hits, 'misses': self.misses, 'file_bytes': self.get_file_size()}
+
+    def get_file_size(self) -> int:
+        """ Bytes of the store file and its write-ahead log on disk """
+        return sum(_f.stat().st_size for _f in [self.path, self.path.with_name(self.path.name + '-wal')]
+                   if _f.exists())
+
+    def compact(self):
+        """
+        Rebuilds the store file to release free space. Stale answers are kept, they are still served until refreshed
+        :return: (file bytes before, file bytes after)
+        """
+        before = self.get_file_size()
+        with self._lock:
+            self._conn.commit()
+            self._conn.execute('VACUUM')
+            self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return before, self.get_file_size()
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+atexit.register(ResponseCache.flush_all)
+
+
+def export_snapshot(path, namespaces: list = None):
+    """
+    Writes the response caches of one or more APIs to a single gzipped snapshot file
+    :param path: snapshot file to write
+    :param namespaces: APIs to export, all cached APIs by default
+    :return: manifest of the snapshot
+    """
+    namespaces = ResponseCache.get_namespaces() if namespaces is None else [_n.upper() for _n in namespaces]
+    manifest = {'format': SNAPSHOT_FORMAT, 'version': SNAPSHOT_VERSION,
+                'created': datetime.now().isoformat(timespec='seconds'), 'caches': {}}
+    caches = {_n: ResponseCache.get_cache(_n) for _n in namespaces}
+    for namespace, cache in caches.items():
+        manifest['caches'][namespace] = {_t: cache.count_rows(_t) for _t in SNAPSHOT_TABLES}
+    with gzip.open(str(path), 'wt', encoding='utf-8') as snapshot:
+        snapshot.write(json.dumps(manifest) + '\n')
+        for namespace, cache in caches.items():
+            for table in SNAPSHOT_TABLES:
+                for row in cache.iter_rows(table):
+                    row['cache'], row['table'] = namespace, table
+                    snapshot.write(json.dumps(row) + '\n')
+    APIlog.info('Cache snapshot %s written : %s', path, manifest['caches'])
+    return manifest
+
+
+def read_snapshot(path):
+    """ Yields the manifest of a snapshot file, then its entries """
+    with gzip.open(str(path), 'rt', encoding='utf-8') as snapshot:
+        manifest = json.loads(snapshot.readline())
+        if type(manifest) is not dict or manifest.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError('not a SMOREs cache snapshot')
+        elif int(manifest.get('version', 0)) > SNAPSHOT_VERSION:
+            raise ValueError('snapshot version {0} is newer than the supported version {1}'.format(
+                manifest['version'], SNAPSHOT_VERSION))
+        yield manifest
+        for line in snapshot:
+            if len(line.strip()) > 0:
+                yield json.loads(line)
+
+
+def import_snapshot(path):
+    """
+    Merges a snapshot file written by export_snapshot into the local response caches, see ResponseCache.merge_rows.
+    A snapshot naming a cache other than the known APIs (CACHE_NAMESPACES) is rejected. The caches are kept under
+    their max size afterwards
+    :param path: snapshot file to read
+    :return: dict{api: {'added': entries added, 'skipped': entries already cached as new or newer}} or None if the
+        snapshot could not be read
+    """
+    results = {}
+    try:
+        entries = read_snapshot(path)
+        manifest = next(entries)
+        for namespace in manifest.get('caches', {}).keys():
+            check_snapshot_namespace(namespace)
+        batch, batch_id = [], None
+        for entry in entries:
+            if (entry['cache'], entry['table']) != batch_id or len(batch) >= 5000:
+                merge_snapshot_batch(batch_id, batch, results)
+                batch, batch_id = [], (entry['cache'], entry['table'])
+            batch.append(entry)
+        merge_snapshot_batch(batch_id, batch, results)
+    except (OSError, EOFError, ValueError, KeyError, TypeError) as e:
+        smores_error('#Ax000.8', [str(path), e], logger=APIlog)
+        return None
+    finally:
+        for namespace in results.keys():
+            ResponseCache.get_cache(namespace).enforce_size()
+    APIlog.info('Cache snapshot %s (%s) imported : %s', path, manifest.get('created'), results)
+    return results
+
+
+def check_snapshot_namespace(namespace):
+    """ Raises ValueError unless namespace is a known API cache, as it ends up in the name of the cache file """
+    if namespace not in CACHE_NAMESPACES:
+        raise ValueError('unknown cache {0}'.format(namespace))
+
+
+def merge_snapshot_batch(batch_id, batch: list, results: dict):
+    if batch_id is None or len(batch) == 0:
+        return
+    namespace, table = batch_id
+    check_snapshot_namespace(namespace)
+    if table not in SNAPSHOT_TABLES:
+        raise ValueError('unknown cache table {0}'.format(table))
+    added, skipped = ResponseCache.get_cache(namespace).merge_rows(table, batch)
+    if namespace not in results.keys():
+        results[namespace] = {'added': 0, 'skipped': 0}
+    results[namespace]['added'] += added
+    results[namespace]['skipped'] += skipped
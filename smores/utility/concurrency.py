@@ -0,0 +1,265 @@
+import time
+import asyncio
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+# SMOREs Internal Imports
+from smores.utility import util
+
+'''Helpers for running SMOREs lookups from multiple worker threads '''
+
+APIlog = logging.getLogger(__name__)
+
+ADAPTIVE_DEFAULTS = {
+    'adaptive': True,  # When False every request is sent as soon as a worker has one
+    'initial_limit': 4,  # Concurrent requests allowed to a host before any have been measured
+    'min_limit': 1,
+    'max_limit': 32,
+    'decrease': 0.5,  # Factor the limit is multiplied by on 429 / 5xx, timeouts and latency spikes
+    'spike_ratio': 2.0  # Latency above this multiple of an endpoint's baseline latency counts as a spike
+}
+
+
+class KeyedLock:
+    """ Hands out one re-entrant lock per key (e.g. a code and its source) so that work on the same key is serialized
+        while work on different keys runs in parallel. Locks are held here rather than on the objects they protect so
+        that those objects remain picklable. A key's lock is only kept while a thread holds or waits on it, so the
+        locks don't grow with the number of keys ever locked """
+
+    def __init__(self):
+        self._locks = {}  # key: [RLock, threads holding or waiting on it]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def get(self, key):
+        """ Context manager holding the lock of key, e.g. with _med_locks.get(('RXNORM', cui)): """
+        with self._lock:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = [threading.RLock(), 0]
+                self._locks[key] = entry
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
+
+
+class SingleFlight:
+    """ Coalesces concurrent calls for the same key (e.g. the same API request) into one. The first caller runs the
+        call, callers arriving while it is in flight wait for it and receive the same result or exception """
+
+    class Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = SingleFlight.Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def get_stats(self):
+        with self._lock:
+            return {'in_flight': len(self._calls), 'shared': self.shared}
+
+
+class AdaptiveLimit:
+    """ Additive increase / multiplicative decrease (AIMD) limit on the requests in flight to one API host. The limit
+        grows by one request per round of successful requests while it is fully used, and is cut back at once when the
+        host throttles (429 / 5xx), times out or an endpoint's latency spikes above its baseline. Requests still take a
+        token from the host's rate limiter, so [API_RATE_LIMIT] stays the ceiling """
+    limits = {}
+    _lock = threading.Lock()
+    spike_min = 0.25  # Seconds a response must be slower than the baseline before it can count as a spike
+
+    def __init__(self, host: str, conf: dict):
+        self.host = host
+        self.enabled = conf['adaptive']
+        self.min_limit = max(conf['min_limit'], 1)
+        self.max_limit = max(conf['max_limit'], self.min_limit)
+        self.limit = float(min(max(conf['initial_limit'], self.min_limit), self.max_limit))
+        self.decrease = min(max(conf['decrease'], 0.1), 0.9)
+        self.spike_ratio = max(conf['spike_ratio'], 1.0)
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self.last_decrease = 0.0
+        self.endpoints = {}
+        self._cond = threading.Condition()
+        self._async_waiters = deque()  # (event loop, future) of coroutines waiting in acquire_async
+
+    @staticmethod
+    def get_config(pool_id: str):
+        """
+        Settings from the [API_CONCURRENCY] section of config.ini. Any setting can be overridden for a single API by
+        prefixing it with the pool id, e.g. OPENFDA_MAX_LIMIT = 4
+        """
+        conf = {}
+        for setting, default in ADAPTIVE_DEFAULTS.items():
+            _val = util.read_config_option('API_CONCURRENCY', setting, default)
+            conf[setting] = util.read_config_option('API_CONCURRENCY', '{0}_{1}'.format(pool_id, setting), _val)
+        return conf
+
+    @staticmethod
+    def get_limit(host: str, pool_id: str):
+        """ Returns the shared limit for a host, with the settings of the first API (pool_id) to use it """
+        host = host.lower() if host is not None else ''
+        limit = AdaptiveLimit.limits.get(host)
+        if limit is None:
+            with AdaptiveLimit._lock:
+                limit = AdaptiveLimit.limits.get(host)
+                if limit is None:
+                    conf = AdaptiveLimit.get_config(pool_id)
+                    limit = AdaptiveLimit(host, conf)
+                    AdaptiveLimit.limits[host] = limit
+                    APIlog.info('Adaptive concurrency for %s : %s', host, conf)
+        return limit
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.enabled and self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def acquire(self):
+        """ Waits until the host has room for another request under the current limit """
+        with self._cond:
+            while self.enabled and self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        """ Same as acquire without blocking the event loop, the coroutine sleeps until release() wakes it """
+        loop = asyncio.get_running_loop()
+        retry = False
+        while True:
+            with self._cond:
+                if not self.enabled or self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                waiter = loop.create_future()
+                # A coroutine that was woken but lost the slot to another caller keeps its place at the front
+                if retry:
+                    self._async_waiters.appendleft((loop, waiter))
+                else:
+                    self._async_waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._cond:
+                    try:
+                        self._async_waiters.remove((loop, waiter))
+                    except ValueError:
+                        # Already woken, hand the wake-up on so the free slot isn't left unused
+                        self._wake_async()
+                raise
+            retry = True
+
+    def _wake_async(self):
+        """ Wakes as many waiting coroutines as there are free slots. Called with self._cond held """
+        _free = int(self.limit) - self.in_flight if self.enabled else len(self._async_waiters)
+        while _free > 0 and self._async_waiters:
+            loop, waiter = self._async_waiters.popleft()
+            try:
+                loop.call_soon_threadsafe(AdaptiveLimit._set_waiter, waiter)
+            except RuntimeError:  # The waiter's event loop has been closed
+                continue
+            _free -= 1
+
+    @staticmethod
+    def _set_waiter(waiter):
+        if not waiter.done():
+            waiter.set_result(None)
+
+    def release(self, endpoint: str, latency: float, success: bool):
+        """
+        Frees the request's slot and adjusts the limit from its outcome
+        :param endpoint: Key the latency is tracked under, e.g. RXNAV_STATUS
+        :param latency: Seconds the host took to answer, not counting time spent waiting on the rate limiter
+        :param success: False for 429 / 5xx responses, timeouts and connection errors
+        """
+        with self._cond:
+            _saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = {'requests': 0, 'errors': 0, 'latency': None, 'baseline': None}
+                self.endpoints[endpoint] = stats
+            stats['requests'] += 1
+            if success:
+                _base = stats['baseline']
+                _spike = _base is not None and latency > max(_base * self.spike_ratio, _base + AdaptiveLimit.spike_min)
+                stats['latency'] = latency if stats['latency'] is None else stats['latency'] * 0.8 + latency * 0.2
+                # The baseline drops to a faster response at once and rises slowly, so gradual drift is not a spike
+                stats['baseline'] = latency if _base is None or latency < _base else _base * 0.99 + latency * 0.01
+            else:
+                stats['errors'] += 1
+                _spike = True
+            if self.enabled and _spike:
+                # At most one cut per round trip, requests that were already in flight report the same congestion
+                _now = time.monotonic()
+                if _now - self.last_decrease > max(stats['latency'] or 0.0, AdaptiveLimit.spike_min):
+                    self.limit = max(self.limit * self.decrease, float(self.min_limit))
+                    self.last_decrease = _now
+                    self.decreases += 1
+                    APIlog.info('Concurrency for %s reduced to %s (%s)', self.host, int(self.limit), endpoint)
+            elif self.enabled and _saturated and self.limit < self.max_limit:
+                _before = int(self.limit)
+                self.limit = min(self.limit + 1.0 / self.limit, float(self.max_limit))
+                self.increases += int(self.limit) - _before
+            self._cond.notify_all()
+            self._wake_async()
+
+    @staticmethod
+    def get_stats(host: str = None):
+        """ :return: dict{host: {limit, in_flight, increases, decreases, endpoints{requests, errors, latency}}} """
+        if host is None:
+            return {_h: AdaptiveLimit.get_stats(_h) for _h in list(AdaptiveLimit.limits.keys())}
+        limit = AdaptiveLimit.limits.get(host)
+        if limit is None:
+            return {}
+        with limit._cond:
+            return {'limit': int(limit.limit), 'in_flight': limit.in_flight, 'increases': limit.increases,
+                    'decreases': limit.decreases,
+                    'endpoints': {_e: {'requests': _s['requests'], 'errors': _s['errors'],
+                                       'latency': round(_s['latency'], 3) if _s['latency'] is not None else None}
+                                  for _e, _s in limit.endpoints.items()}}
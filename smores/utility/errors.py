@@ -72,7 +72,13 @@ smores_errors = {
             '1': {'message': 'API Call Produced Unexpected Error', 'alert': 'error'},
             '2': {'message': 'Invalid API Call Type', 'alert': 'error'},
             '3': {'message': 'API Produced 404 Error', 'alert': 'error'},
-            '4': {'message': 'KeyError: Invalid value for Payload Parameter', 'alert': 'error'}
+            '4': {'message': 'KeyError: Invalid value for Payload Parameter', 'alert': 'error'},
+            '5': {'message': 'aiohttp Is Required for the Asynchronous API Clients', 'alert': 'error'},
+            '6': {'message': 'Import of Local Source Release Failed', 'alert': 'error'},
+            '7': {'message': 'Local Source Release File Not Found', 'alert': 'error'},
+            '8': {'message': 'Invalid or Unsupported Cache Snapshot', 'alert': 'error'},
+            '9': {'message': 'API Host Unavailable, Circuit Breaker Open', 'alert': 'warn'},
+            '10': {'message': 'Crosswalk Step Failed, Treated as No Answer', 'alert': 'error'}
          },
         '001': { 'subclass': 'RXNav API Errors',
             '1': {'message': 'RXNav API Call Failed', 'alert': 'error'},
@@ -0,0 +1,142 @@
+import os
+import fnmatch
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+# SMOREs Internal Imports
+from smores.utility import util
+from smores.utility.errors import smores_error
+
+'''Indexed sqlite stores built from locally downloaded source releases (RxNorm RRF, FDA NDC directory, UMLS MRCONSO).
+Stores live in smores/local and are opened read-only by the local API backends in smores.offline '''
+
+APIlog = logging.getLogger(__name__)
+
+
+class LocalStore:
+    stores = {}
+    _lock = threading.Lock()
+    batch_size = 50000
+
+    def __init__(self, name: str, path=None):
+        self.name = name.upper()
+        self.path = Path(path) if path is not None else \
+            util.get_util_base('local').joinpath('{0}.sqlite'.format(name.lower()))
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @staticmethod
+    def get_store(name: str):
+        """ Returns the shared store for a source, whether or not it has been imported yet """
+        store = LocalStore.stores.get(name)
+        if store is None:
+            with LocalStore._lock:
+                store = LocalStore.stores.get(name)
+                if store is None:
+                    store = LocalStore(name)
+                    LocalStore.stores[name] = store
+        return store
+
+    @staticmethod
+    def find_file(root, file_name: str):
+        """ Finds a release file by name (case-insensitive) anywhere under root """
+        for _dir, _, files in os.walk(str(root)):
+            for _f in files:
+                if _f.upper() == file_name.upper():
+                    return Path(_dir).joinpath(_f)
+        return None
+
+    @staticmethod
+    def find_files(root, pattern: str):
+        """ All release files under root whose name matches a glob pattern (case-insensitive), sorted by name """
+        found = []
+        for _dir, _, files in os.walk(str(root)):
+            found += [Path(_dir).joinpath(_f) for _f in files if fnmatch.fnmatch(_f.lower(), pattern.lower())]
+        return sorted(found, key=lambda _f: _f.name)
+
+    @staticmethod
+    def read_delimited(path, sep: str = '|', skip_header: bool = False, encoding: str = 'utf-8'):
+        """ Yields the fields of each line of a delimited release file """
+        with open(str(path), 'r', encoding=encoding, errors='replace') as _file:
+            if skip_header:
+                next(_file, None)
+            for line in _file:
+                yield line.rstrip('\r\n').split(sep)
+
+    def is_loaded(self) -> bool:
+        return self.path.exists() and self.get_meta('release') is not None
+
+    def get_conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect('file:{0}?mode=ro'.format(self.path.as_posix()), uri=True,
+                                         check_same_thread=False)
+        return self._conn
+
+    def query(self, sql: str, params=()):
+        with self._lock:
+            return self.get_conn().execute(sql, params).fetchall()
+
+    def get_meta(self, key: str):
+        try:
+            rows = self.query('SELECT value FROM meta WHERE key = ?', (key,))
+        except sqlite3.Error:
+            return None
+        return rows[0][0] if len(rows) > 0 else None
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def build(self, schema: list, tables: dict, indexes: list, meta: dict):
+        """
+        Builds the store from scratch into a temporary file, then replaces the existing store
+        :param schema: CREATE TABLE statements
+        :param tables: {table: (insert columns, iterable of rows)}
+        :param indexes: CREATE INDEX statements, run after all rows are loaded
+        :param meta: key/values describing the import, must include 'release'
+        :return: {table: rows imported}
+        """
+        _tmp = self.path.with_suffix('.sqlite.tmp')
+        if _tmp.exists():
+            _tmp.unlink()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        counts = {}
+        conn = sqlite3.connect(str(_tmp))
+        try:
+            conn.execute('PRAGMA journal_mode=OFF')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+            for _sql in schema:
+                conn.execute(_sql)
+            for table, (columns, rows) in tables.items():
+                _insert = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(table, ', '.join(columns),
+                                                                      ', '.join('?' for _ in columns))
+                counts[table] = 0
+                batch = []
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) >= LocalStore.batch_size:
+                        conn.executemany(_insert, batch)
+                        counts[table] += len(batch)
+                        batch = []
+                if len(batch) > 0:
+                    conn.executemany(_insert, batch)
+                    counts[table] += len(batch)
+                APIlog.info('%s : imported %s rows into %s', self.name, counts[table], table)
+            for _sql in indexes:
+                conn.execute(_sql)
+            conn.executemany('INSERT INTO meta (key, value) VALUES (?, ?)',
+                             [(str(_k), str(_v)) for _k, _v in meta.items()])
+            conn.commit()
+        except (sqlite3.Error, OSError) as e:
+            conn.close()
+            _tmp.unlink()
+            smores_error('#Ax000.6', [self.name, e], logger=APIlog)
+            return None
+        conn.close()
+        self.close()
+        os.replace(str(_tmp), str(self.path))
+        return counts
@@ -0,0 +1,100 @@
+import threading
+import time
+import logging
+# SMOREs Internal Imports
+from smores.utility import util
+from smores.utility.errors import smores_error
+
+'''Process wide token bucket rate limiting for the upstream API hosts. Every API instance and thread that calls the
+same host draws from the same bucket, so the configured rate in [API_RATE_LIMIT] is never exceeded '''
+
+APIlog = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float = 1):
+        """
+        :param rate: Tokens (requests) added per second. A rate of 0 or less disables limiting
+        :param burst: Max number of tokens that can be saved up while idle
+        """
+        self.rate = float(rate)
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.updated = time.perf_counter()
+        self.acquired = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Takes tokens from the bucket immediately, allowing the balance to go negative so that concurrent callers are
+        queued in the order they arrive.
+        :return: Seconds the caller must wait before the reserved tokens may be used
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.perf_counter()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            self.acquired += 1
+            self.waited += wait
+        return wait
+
+    def acquire(self, tokens: float = 1) -> float:
+        """ Blocks until the requested tokens are available. Returns the time spent waiting """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def get_stats(self):
+        return {'rate': self.rate, 'burst': self.capacity, 'acquired': self.acquired, 'waited': round(self.waited, 4)}
+
+
+class RateLimiter:
+    limiters = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_limit_config(host: str):
+        """
+        Reads the rate for a host from [API_RATE_LIMIT] in config.ini. Values are requests per second with an
+        optional burst size, e.g. rxnav.nlm.nih.gov = 20,1
+        :return: rate, burst
+        """
+        conf = util.read_config_value('API_RATE_LIMIT', required=False)
+        conf = conf if conf is not None else {}
+        _val = conf[host] if host in conf.keys() else conf.get('default_rate', '0')
+        try:
+            _parts = [float(_p) for _p in _val.split(',')]
+        except ValueError:
+            smores_error('#Cx003.1', '[API_RATE_LIMIT] {0} = {1}'.format(host, _val))
+            return 0.0, 1.0
+        return _parts[0], _parts[1] if len(_parts) > 1 else 1.0
+
+    @staticmethod
+    def get_limiter(host: str) -> TokenBucket:
+        host = host.lower() if host is not None else ''
+        limiter = RateLimiter.limiters.get(host)
+        if limiter is None:
+            with RateLimiter._lock:
+                limiter = RateLimiter.limiters.get(host)
+                if limiter is None:
+                    rate, burst = RateLimiter.get_limit_config(host)
+                    limiter = TokenBucket(rate, burst)
+                    RateLimiter.limiters[host] = limiter
+                    APIlog.info('Rate limit for %s : %s requests/sec (burst %s)', host, rate, burst)
+        return limiter
+
+    @staticmethod
+    def acquire(host: str) -> float:
+        return RateLimiter.get_limiter(host).acquire()
+
+    @staticmethod
+    def get_stats(host: str = None):
+        if host is None:
+            return {_h: _l.get_stats() for _h, _l in list(RateLimiter.limiters.items())}
+        return RateLimiter.get_limiter(host).get_stats()
@@ -0,0 +1,208 @@
+import time
+import random
+import threading
+import logging
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+# SMOREs Internal Imports
+from smores.utility import util
+
+'''Timeouts, retries and circuit breakers for the SMOREs API clients. Each request gets a deadline covering all of its
+attempts, transient failures (timeouts, connection errors, 429 / 5xx) are retried with jittered exponential backoff
+that honors Retry-After, and hosts that keep failing are short-circuited so callers can fall back to another API '''
+
+APIlog = logging.getLogger(__name__)
+
+RESILIENCE_DEFAULTS = {
+    'timeout': 10.0,  # Seconds to wait on a single attempt (connect and read)
+    'deadline': 60.0,  # Seconds allowed for a request including all of its retries
+    'retries': 3,  # Retries after the first attempt
+    'backoff': 0.5,  # Base seconds of the exponential backoff between attempts
+    'backoff_max': 30.0,  # Max seconds waited between two attempts
+    'breaker_failures': 5,  # Consecutive failed attempts against a host that open its circuit
+    'breaker_reset': 30.0  # Seconds an open circuit fails fast before a trial request is let through
+}
+
+# Response statuses worth another attempt, anything else is a final answer from the API
+RETRY_STATUS = [429, 500, 502, 503, 504]
+
+_configs = {}
+_config_lock = threading.Lock()
+
+
+def get_resilience_config(pool_id: str):
+    """
+    Settings from the [API_RESILIENCE] section of config.ini. Any setting can be overridden for a single API by
+    prefixing it with the pool id, e.g. OPENFDA_TIMEOUT = 20. Read once per API and kept for the session
+    """
+    conf = _configs.get(pool_id)
+    if conf is None:
+        with _config_lock:
+            conf = _configs.get(pool_id)
+            if conf is None:
+                conf = {}
+                for setting, default in RESILIENCE_DEFAULTS.items():
+                    _val = util.read_config_option('API_RESILIENCE', setting, default)
+                    conf[setting] = util.read_config_option('API_RESILIENCE', '{0}_{1}'.format(pool_id, setting),
+                                                            _val)
+                _configs[pool_id] = conf
+                APIlog.info('Request resilience for %s : %s', pool_id, conf)
+    return conf
+
+
+def parse_retry_after(value):
+    """
+    Seconds to wait from a Retry-After header, given either as seconds or as an HTTP date
+    :return: float seconds, None if the header is missing or can't be read
+    """
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        _date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if _date.tzinfo is None:
+        _date = _date.replace(tzinfo=timezone.utc)
+    return max((_date - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def get_backoff(attempt: int, base: float, cap: float, retry_after=None):
+    """
+    Seconds to wait before the next attempt. Full jitter over an exponentially growing window so that threads that
+    failed together do not retry together. A Retry-After from the API is a lower bound
+    """
+    _wait = random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+    if retry_after is not None:
+        _wait = max(_wait, retry_after)
+    return _wait
+
+
+class CircuitBreaker:
+    breakers = {}
+    _lock = threading.Lock()
+    CLOSED = 'CLOSED'
+    OPEN = 'OPEN'
+    HALF_OPEN = 'HALF_OPEN'
+
+    def __init__(self, host: str, failures: int, reset: float):
+        self.host = host
+        self.failures = max(int(failures), 0)
+        self.reset = max(float(reset), 0.0)
+        self.state = CircuitBreaker.CLOSED
+        self.failed = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_breaker(host: str, pool_id: str = None):
+        """ Returns the shared breaker for a host, with the thresholds of the first API (pool_id) to use it """
+        host = host.lower() if host is not None else ''
+        breaker = CircuitBreaker.breakers.get(host)
+        if breaker is None:
+            with CircuitBreaker._lock:
+                breaker = CircuitBreaker.breakers.get(host)
+                if breaker is None:
+                    conf = get_resilience_config(pool_id) if pool_id is not None else RESILIENCE_DEFAULTS
+                    breaker = CircuitBreaker(host, conf['breaker_failures'], conf['breaker_reset'])
+                    CircuitBreaker.breakers[host] = breaker
+        return breaker
+
+    @staticmethod
+    def is_available(url: str) -> bool:
+        """ False while the circuit of the url's host is open, without taking the half-open trial request """
+        breaker = CircuitBreaker.breakers.get(urlparse(url).hostname or '')
+        if breaker is None:
+            return True
+        with breaker._lock:
+            return breaker.state != CircuitBreaker.OPEN or time.monotonic() - breaker.opened_at >= breaker.reset
+
+    def allow(self) -> bool:
+        """ Whether a request may be sent. Once the reset time has passed a single trial request is let through """
+        if self.failures == 0:
+            return True
+        with self._lock:
+            if self.state == CircuitBreaker.CLOSED:
+                return True
+            if self.state == CircuitBreaker.OPEN and time.monotonic() - self.opened_at >= self.reset:
+                self.state = CircuitBreaker.HALF_OPEN
+                APIlog.info('Circuit for %s half-open, sending a trial request', self.host)
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CircuitBreaker.CLOSED:
+                APIlog.info('Circuit for %s closed', self.host)
+            self.state = CircuitBreaker.CLOSED
+            self.failed = 0
+
+    def record_failure(self):
+        if self.failures == 0:
+            return
+        with self._lock:
+            self.failed += 1
+            if self.state == CircuitBreaker.HALF_OPEN or \
+                    (self.state == CircuitBreaker.CLOSED and self.failed >= self.failures):
+                self.state = CircuitBreaker.OPEN
+                self.opened_at = time.monotonic()
+                self.trips += 1
+                APIlog.warning('Circuit for %s opened after %s failed attempts, failing fast for %s seconds',
+                               self.host, self.failed, self.reset)
+
+    @staticmethod
+    def get_stats(host: str = None):
+        """ :return: dict{host: {state, failed, trips, rejected}} or the stats of one host """
+        if host is None:
+            return {_h: CircuitBreaker.get_stats(_h) for _h in list(CircuitBreaker.breakers.keys())}
+        breaker = CircuitBreaker.get_breaker(host)
+        with breaker._lock:
+            return {'state': breaker.state, 'failed': breaker.failed, 'trips': breaker.trips,
+                    'rejected': breaker.rejected}
+
+
+class RequestAttempts:
+    """ Tracks the attempts of one API request against its deadline, retry budget and the host's circuit breaker """
+    def __init__(self, pool_id: str, url: str):
+        self.conf = get_resilience_config(pool_id)
+        self.breaker = CircuitBreaker.get_breaker(urlparse(url).hostname, pool_id)
+        self.deadline = time.monotonic() + self.conf['deadline']
+        self.attempt = 0
+
+    def allow(self) -> bool:
+        return self.breaker.allow()
+
+    def get_timeout(self) -> float:
+        """ Timeout for the next attempt, never past the request's deadline """
+        return max(min(self.conf['timeout'], self.deadline - time.monotonic()), 0.1)
+
+    def succeeded(self):
+        self.breaker.record_success()
+
+    def failed(self, status: int = None, retry_after: str = None):
+        """
+        Records a failed attempt. A 429 means the host is up but throttling us, so it counts as a live host for the
+        breaker
+        :param status: HTTP status of the response, None for timeouts and connection errors
+        :param retry_after: Retry-After header of the response
+        :return: seconds to wait before retrying, None when the retries or the deadline are used up
+        """
+        if status == 429:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        self.attempt += 1
+        if self.attempt > self.conf['retries']:
+            return None
+        _wait = get_backoff(self.attempt, self.conf['backoff'], self.conf['backoff_max'],
+                            parse_retry_after(retry_after))
+        if time.monotonic() + _wait >= self.deadline:
+            return None
+        return _wait
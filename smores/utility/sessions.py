@@ -0,0 +1,110 @@
+import threading
+import logging
+from urllib.parse import urlparse
+# Community Modules
+import requests
+from requests.adapters import HTTPAdapter
+# SMOREs Internal Imports
+from smores.utility import util
+from smores.utility.ratelimit import RateLimiter
+
+'''Shared, keep-alive HTTP sessions for the SMOREs API clients. Each API (pool_id) is given a single requests.Session
+with its own urllib3 connection pools so that TCP/TLS connections are re-used between lookups and threads '''
+
+APIlog = logging.getLogger(__name__)
+
+POOL_DEFAULTS = {
+    'pool_connections': 10,  # Number of per-host connection pools kept by each session
+    'pool_maxsize': 10,  # Max connections kept open per host
+    'pool_block': False,  # When True, pool_maxsize is a hard per-host limit and callers wait for a free connection
+    'keep_alive': True
+}
+
+
+class ThrottledAdapter(HTTPAdapter):
+    """ Transport adapter that takes a token from the host's shared rate limiter before each request is sent.
+        Responses served from the cache never reach the adapter and so do not count against the limit. The time spent
+        waiting is kept on the response as rate_wait so it can be told apart from the API's own latency """
+    def send(self, request, **kwargs):
+        wait = RateLimiter.acquire(urlparse(request.url).hostname)
+        response = super(ThrottledAdapter, self).send(request, **kwargs)
+        response.rate_wait = wait
+        return response
+
+
+class SessionPool:
+    sessions = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_pool_config(pool_id: str):
+        """
+        Pool settings from the [API_POOL] section of config.ini. Any setting can be overridden for a single API by
+        prefixing it with the pool id, e.g. RXNAV_POOL_MAXSIZE = 20
+        """
+        conf = {}
+        for setting, default in POOL_DEFAULTS.items():
+            _val = util.read_config_option('API_POOL', setting, default)
+            conf[setting] = util.read_config_option('API_POOL', '{0}_{1}'.format(pool_id, setting), _val)
+        return conf
+
+    @staticmethod
+    def get_session(pool_id: str) -> requests.Session:
+        """ Returns the shared session for an API, creating it on first use. Safe to call from multiple threads """
+        session = SessionPool.sessions.get(pool_id)
+        if session is None:
+            with SessionPool._lock:
+                session = SessionPool.sessions.get(pool_id)
+                if session is None:
+                    session = SessionPool.new_session(pool_id)
+                    SessionPool.sessions[pool_id] = session
+        return session
+
+    @staticmethod
+    def new_session(pool_id: str) -> requests.Session:
+        conf = SessionPool.get_pool_config(pool_id)
+        session = requests.Session()
+        adapter = ThrottledAdapter(pool_connections=conf['pool_connections'], pool_maxsize=conf['pool_maxsize'],
+                                   pool_block=conf['pool_block'])
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['Connection'] = 'keep-alive' if conf['keep_alive'] else 'close'
+        APIlog.info('Created connection pool for %s : %s', pool_id, conf)
+        return session
+
+    @staticmethod
+    def get_stats(pool_id: str = None):
+        """
+        Connection statistics for the pools of an API, or all APIs if pool_id is None
+        :return: dict{pool_id: {host: {requests, connections, reused, idle}}}
+        """
+        if pool_id is None:
+            return {_id: SessionPool.get_stats(_id) for _id in list(SessionPool.sessions.keys())}
+        session = SessionPool.sessions.get(pool_id)
+        stats = {}
+        if session is None:
+            return stats
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                conn_pool = pools.get(key)
+                if conn_pool is None:
+                    continue
+                host = '{0}://{1}'.format(conn_pool.scheme, conn_pool.host)
+                stats[host] = {
+                    'requests': conn_pool.num_requests,
+                    'connections': conn_pool.num_connections,
+                    'reused': max(conn_pool.num_requests - conn_pool.num_connections, 0),
+                    'idle': sum(1 for conn in list(conn_pool.pool.queue) if conn is not None)
+                        if conn_pool.pool is not None else 0
+                }
+        return stats
+
+    @staticmethod
+    def close(pool_id: str = None):
+        with SessionPool._lock:
+            _ids = list(SessionPool.sessions.keys()) if pool_id is None else [pool_id]
+            for _id in _ids:
+                session = SessionPool.sessions.pop(_id, None)
+                if session is not None:
+                    session.close()
@@ -132,6 +132,8 @@ def get_util_base(type):
         return _prj.joinpath('smores', 'config')
     elif type == 'cache':
         return _prj.joinpath('smores', 'cache')
+    elif type == 'local':
+        return _prj.joinpath('smores', 'local')
     else:
         return _prj
 
@@ -182,22 +184,25 @@ def get_api_key(API:str):
     return validated_key
 
 
-def read_config_value(setting):
+CONFIG_SECTIONS = {
+    'INFILE_KEYS': 'INPUT_FILE',
+    'OUTPUT_CONF': 'OUTPUT_FILE',
+    'API_KEY': 'API_CONFIG',
+    'API_POOL': 'API_POOL'
+}
+
+
+def read_config_value(setting, required=True):
     import configparser as cf
     config_path = get_util_base('config').joinpath('config.ini')
     config = cf.ConfigParser()
     try:
         config.read(config_path)
-
-        if setting == 'INFILE_KEYS':
-            index = 'INPUT_FILE'
-        elif setting == 'OUTPUT_CONF':
-            index = 'OUTPUT_FILE'
-        elif setting == 'API_KEY':
-            index = 'API_CONFIG'
+        index = CONFIG_SECTIONS[setting] if setting in CONFIG_SECTIONS.keys() else setting
         return {item.lower(): value for item, value in config[index].items()}
     except KeyError:
-        smores_error('TBD')
+        if required:
+            smores_error('TBD')
         return None
     except FileNotFoundError:
         smores_error('#Cx001.1', console_p=True, supplement='config.ini')
@@ -207,6 +212,34 @@ def read_config_value(setting):
         return None
 
 
+def read_config_option(setting, option, default=None):
+    """
+    Reads a single option from a config.ini section that is not required to exist.
+    :param setting: Setting name (see CONFIG_SECTIONS) or section name of config.ini
+    :param option: Option within the section
+    :param default: Value returned when the section/option is missing or NONE. Its type is used to cast the value
+    :return: The configured value cast to the type of default
+    """
+    conf = read_config_value(setting, required=False)
+    if conf is None or option.lower() not in conf.keys():
+        return default
+    _val = conf[option.lower()].strip()
+    if len(_val) == 0 or _val.upper() == 'NONE':
+        return default
+    try:
+        if isinstance(default, bool):
+            return _val.upper() in ['TRUE', 'YES', 'ON', '1']
+        elif isinstance(default, int):
+            return int(_val)
+        elif isinstance(default, float):
+            return float(_val)
+        else:
+            return _val
+    except ValueError:
+        smores_error('#Cx003.1', '{0} : {1} = {2}'.format(setting, option, _val))
+        return default
+
+
 def harmonize_cui_status(in_status):
     return
 